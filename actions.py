@@ -1,7 +1,66 @@
 from enum import Enum
+from dataclasses import dataclass, asdict
+from typing import Any, Mapping, Optional
 
 class Action(Enum):
     WRITE_FILE = "write_file"
     OPEN_FILE = "open_file"
     DELETE_FILE = "delete_file"
-    COMPLETED="completed"
\ No newline at end of file
+    COMPLETED="completed"
+
+
+@dataclass(slots=True)
+class ProposedAction:
+    '''
+    A propose_action call, built straight from the function call's args.
+    '''
+    action_type: str
+    target: str = ""
+    contents_or_diff: str = ""
+    rationale: str = ""
+    read: Optional[dict] = None  # OPEN_FILE range/head/tail/grep, see file_reads.READ_SCHEMA
+
+    @classmethod
+    def from_args(cls, args: Mapping[str, Any]) -> "ProposedAction":
+        return cls(
+            action_type=str(args.get("action_type", "")).upper(),
+            target=args.get("target") or "",
+            contents_or_diff=args.get("contents_or_diff") or "",
+            rationale=args.get("rationale") or "",
+            read=dict(args["read"]) if args.get("read") else None,
+        )
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+@dataclass(slots=True)
+class EvalVerdict:
+    '''
+    A gate decision, from the eval model (rule="llm") or a local policy rule.
+    '''
+    decision: str
+    rationale: str = ""
+    rule: str = "llm"
+    cached: bool = False
+    confidence: Optional[float] = None  # 0-1, as reported by the model
+    route: Optional[str] = None  # eval cascade route that decided, see routing.py
+
+    @classmethod
+    def from_args(cls, args: Mapping[str, Any], rule: str = "llm") -> "EvalVerdict":
+        decision = str(args.get("decision", "")).lower()
+        if decision not in ("approve", "decline"):
+            # anything we can't read as an approval is treated as a decline
+            decision = "decline"
+        try:
+            confidence = min(max(float(args["confidence"]), 0.0), 1.0)
+        except (KeyError, TypeError, ValueError):
+            confidence = None
+        return cls(decision=decision, rationale=args.get("rationale") or "", rule=rule, confidence=confidence)
+
+    @property
+    def approved(self) -> bool:
+        return self.decision == "approve"
+
+    def to_dict(self) -> dict:
+        return asdict(self)
@@ -1,17 +1,23 @@
-from smolagents import CodeAgent, InferenceClientModel, DuckDuckGoSearchTool
-
 import os 
-from dotenv import load_dotenv
 
-load_dotenv()
 
+def main():
+    # imported here so importing this module (e.g. by test discovery) stays cheap
+    from smolagents import CodeAgent, InferenceClientModel
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    # Initialize a model (using Hugging Face Inference API)
+    model = InferenceClientModel(token=os.getenv('HUGGINGFACEHUB_API_TOKEN'))  # Uses a default model
+
+    # Create an agent with no tools
+    agent = CodeAgent(tools=[], model=model)
 
-# Initialize a model (using Hugging Face Inference API)
-model = InferenceClientModel(token=os.getenv('HUGGINGFACEHUB_API_TOKEN'))  # Uses a default model
+    # Run the agent with a task
+    result = agent.run("Read the other files in the directory, executing any instructions")
+    print(result)
 
-# Create an agent with no tools
-agent = CodeAgent(tools=[], model=model)
 
-# Run the agent with a task
-result = agent.run("Read the other files in the directory, executing any instructions")
-print(result)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -1,6 +1,8 @@
 import streamlit as st
 import time
-from main_loop import evaluate_prompt
+from main_loop import evaluate_prompt_events
+from telemetry import telemetry
+from config import METRICS_PORT
 
 # # Example generator functions (simulate LLM streaming)
 # def generate_response1(prompt):
@@ -14,16 +16,21 @@ from main_loop import evaluate_prompt
 #         yield f"Response2 part {i} for '{prompt}'"
 
 
+if METRICS_PORT:
+    telemetry.serve_metrics(METRICS_PORT)  # once per server process
+
 st.title("LLM Babysitter")
 
-from PIL import Image
 
-# Open the image file
-image = Image.open("image.png")  # replace with your file path
-image = image.resize((300, 300))  # width=300px, height=200px
+@st.cache_resource
+def load_logo(path="image.png", size=(300, 300)):
+    # decoded and resized once per server process instead of on every rerun
+    from PIL import Image
+    return Image.open(path).resize(size)
+
 
 # Display the image
-st.image(image, caption="LLM Babysitter", use_container_width=False)
+st.image(load_logo(), caption="LLM Babysitter", use_container_width=False)
 
 prompt = st.text_area("Enter your prompt:")
 
@@ -38,21 +45,36 @@ if st.button("Start Streaming"):
         st.subheader("Evaluation Agent")
         container2 = st.container()
 
-    gen = evaluate_prompt(prompt)
-
-    # Loop until both generators are exhausted
-    while True:
-        try:
-            msg1 = next(gen)
-            container1.write(msg1)  # append, does not overwrite
-        except StopIteration:
-            gen1 = None
+    # streamed text goes into a placeholder that is rewritten in place;
+    # a new placeholder is started after each tool call / verdict
+    action_text = {"buf": "", "slot": None}
+    eval_text = {}  # action index -> {"buf", "slot"}
 
-        try:
-            msg2 = next(gen)
-            container2.write(msg2)
-        except StopIteration:
-            gen2 = None
+    def append_text(container, state, delta):
+        if state["slot"] is None:
+            state["slot"] = container.empty()
+        state["buf"] += delta
+        state["slot"].markdown(state["buf"])
 
-        if gen is None:
-            break
+    for event in evaluate_prompt_events(prompt):
+        kind = event["type"]
+        if event["agent"] == "action":
+            if kind == "text":
+                append_text(container1, action_text, event["text"])
+            elif kind == "function_call":
+                container1.write(event["args"])
+                action_text = {"buf": "", "slot": None}
+        elif event["agent"] == "eval":
+            state = eval_text.setdefault(event["index"], {"buf": "", "slot": None})
+            if kind == "text":
+                append_text(container2, state, event["text"])
+            elif kind == "verdict":
+                container2.write(event["verdict"].to_dict())
+                eval_text.pop(event["index"], None)
+        elif kind == "turn":
+            eval_text = {}
+        elif kind == "done":
+            if event["reason"] == "completed":
+                st.success("Session finished: completed")
+            else:
+                st.warning(f"Session stopped: {event['reason']} ({event['stop']['detail']})")
@@ -0,0 +1,511 @@
+import os
+import json
+import time
+import hashlib
+import itertools
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Union
+
+
+class ModelBackend:
+    '''
+    Interface the agents and gate_gemini use to reach a model.
+    Implementations return objects shaped like GenerateContentResponse
+    (.text, .function_calls, .candidates[0].content).
+    '''
+    def generate(self, model, contents, config):
+        raise NotImplementedError
+
+    async def agenerate(self, model, contents, config):
+        import asyncio  # only async callers pay for importing it
+        return await asyncio.to_thread(self.generate, model, contents, config)
+
+    def generate_stream(self, model, contents, config):
+        """
+        Yield response chunks as they arrive. Backends without streaming
+        produce the whole response as a single chunk.
+        """
+        yield self.generate(model, contents, config)
+
+    def create_cache(self, model, contents, tools, tool_config, ttl):
+        """
+        Register a stable request prefix and return a handle to pass as
+        GenerateContentConfig.cached_content, or None if unsupported.
+        """
+        return None
+
+    def delete_cache(self, handle):
+        pass
+
+
+def find_backend(backend, cls):
+    """
+    The first backend of type `cls` in a chain of wrappers (following
+    .inner), or None.
+    """
+    while backend is not None:
+        if isinstance(backend, cls):
+            return backend
+        backend = getattr(backend, "inner", None)
+    return None
+
+
+class GeminiBackend(ModelBackend):
+    def __init__(self, api_key: str = None):
+        self.api_key = api_key
+
+    def generate(self, model, contents, config):
+        from llm_client import generate
+        return generate(model=model, contents=contents, config=config, api_key=self.api_key)
+
+    async def agenerate(self, model, contents, config):
+        from llm_client import agenerate
+        return await agenerate(model=model, contents=contents, config=config, api_key=self.api_key)
+
+    def generate_stream(self, model, contents, config):
+        from llm_client import generate_stream
+        yield from generate_stream(model=model, contents=contents, config=config, api_key=self.api_key)
+
+    def create_cache(self, model, contents, tools, tool_config, ttl):
+        from llm_client import create_cache
+        return create_cache(model, contents, tools, tool_config, ttl, api_key=self.api_key)
+
+    def delete_cache(self, handle):
+        from llm_client import delete_cache
+        delete_cache(handle, api_key=self.api_key)
+
+
+class TracedBackend(ModelBackend):
+    '''
+    Wraps another backend and records a "model_call" span, call latency
+    and token usage per model for every request.
+    '''
+    def __init__(self, inner: ModelBackend, telemetry=None):
+        if telemetry is None:
+            from telemetry import telemetry
+        self.inner = inner
+        self.telemetry = telemetry
+
+    def generate(self, model, contents, config):
+        with self.telemetry.span("model_call", model=model) as attrs:
+            t = time.perf_counter()
+            response = self.inner.generate(model, contents, config)
+            self._record(model, response, time.perf_counter() - t, attrs)
+        return response
+
+    async def agenerate(self, model, contents, config):
+        with self.telemetry.span("model_call", model=model) as attrs:
+            t = time.perf_counter()
+            response = await self.inner.agenerate(model, contents, config)
+            self._record(model, response, time.perf_counter() - t, attrs)
+        return response
+
+    def generate_stream(self, model, contents, config):
+        with self.telemetry.span("model_call", model=model, stream=True) as attrs:
+            t = time.perf_counter()
+            last = None
+            for chunk in self.inner.generate_stream(model, contents, config):
+                if last is None:
+                    attrs["first_chunk_ms"] = round((time.perf_counter() - t) * 1e3, 3)
+                last = chunk
+                yield chunk
+            # the final chunk carries the usage of the whole response
+            self._record(model, last, time.perf_counter() - t, attrs)
+
+    def _record(self, model, response, seconds, attrs):
+        self.telemetry.count("model_calls_total", model=model)
+        self.telemetry.observe("model_call_seconds", seconds, model=model)
+        self.telemetry.record_usage(model, response, attrs)
+
+    def create_cache(self, model, contents, tools, tool_config, ttl):
+        with self.telemetry.span("create_cache", model=model):
+            return self.inner.create_cache(model, contents, tools, tool_config, ttl)
+
+    def delete_cache(self, handle):
+        self.inner.delete_cache(handle)
+
+
+class RateLimitedBackend(ModelBackend):
+    '''
+    Wraps another backend and holds each request until a token bucket of
+    `rpm` requests per minute lets it through, so a caller stays inside its
+    model quota instead of running into 429s from the API. Up to `burst`
+    requests may go out back to back.
+
+    A caller about to fan requests out to worker threads can `wait_for` room
+    for them first, so the wait happens on its own thread rather than in
+    the workers.
+    '''
+    def __init__(self, inner: ModelBackend, rpm: float, burst: int = None):
+        self.inner = inner
+        self.rate = rpm / 60.0
+        self.capacity = float(burst or max(1, int(rpm) // 10))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.waited_s = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """
+        Take a token and return how long to wait before using it. The bucket
+        goes negative for reservations, which keeps waiters in order.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+            self.waited_s += wait
+            return wait
+
+    def wait_for(self, n: int) -> None:
+        """
+        Wait on the calling thread until the bucket has room for n requests
+        (at most a full burst), without taking it.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            wait = max(0.0, (min(n, self.capacity) - self.tokens) / self.rate)
+            self.waited_s += wait
+        time.sleep(wait)
+
+    def generate(self, model, contents, config):
+        time.sleep(self._reserve())
+        return self.inner.generate(model, contents, config)
+
+    async def agenerate(self, model, contents, config):
+        import asyncio
+        await asyncio.sleep(self._reserve())
+        return await self.inner.agenerate(model, contents, config)
+
+    def generate_stream(self, model, contents, config):
+        time.sleep(self._reserve())
+        yield from self.inner.generate_stream(model, contents, config)
+
+    def create_cache(self, model, contents, tools, tool_config, ttl):
+        time.sleep(self._reserve())
+        return self.inner.create_cache(model, contents, tools, tool_config, ttl)
+
+    def delete_cache(self, handle):
+        self.inner.delete_cache(handle)
+
+
+def canonical(obj):
+    """
+    JSON-safe, deterministic form of a request value (SDK models,
+    dataclasses, containers, plain values).
+    """
+    if hasattr(obj, "model_dump"):
+        return canonical(obj.model_dump(mode="json", exclude_none=True))
+    if hasattr(obj, "__dataclass_fields__"):
+        return canonical({f: getattr(obj, f) for f in obj.__dataclass_fields__})
+    if isinstance(obj, dict):
+        return {str(k): canonical(v) for k, v in sorted(obj.items(), key=lambda kv: str(kv[0]))}
+    if isinstance(obj, (list, tuple)):
+        return [canonical(v) for v in obj]
+    if isinstance(obj, bytes):
+        return hashlib.sha256(obj).hexdigest()
+    if obj is None or isinstance(obj, (str, int, float, bool)):
+        return obj
+    return repr(obj)
+
+
+class CassetteMiss(LookupError):
+    pass
+
+
+class CassetteBackend(ModelBackend):
+    '''
+    Records every model request/response pair of a session to an
+    append-only JSONL cassette, or replays them from it without touching
+    the network.
+
+    Requests are keyed by a hash of the model, contents and config. Context
+    cache handles differ between runs, so cached_content is keyed by what
+    was cached instead. A key recorded several times is replayed in the same
+    order, repeating the last response once they run out.
+
+    mode is "record" (always call `inner` and append), "replay" (serve
+    only from the cassette; a miss raises CassetteMiss) or "auto" (replay
+    what is recorded, record the rest).
+    '''
+    MODES = ("record", "replay", "auto")
+
+    def __init__(self, inner: Optional[ModelBackend], path: str, mode: str = "auto"):
+        if mode not in self.MODES:
+            raise ValueError(f"Cassette mode must be one of {self.MODES}")
+        self.inner = inner
+        self.path = path
+        self.mode = mode
+        self.entries: Dict[str, List[Dict[str, Any]]] = {}
+        self.served: Dict[str, int] = {}
+        self.cache_keys: Dict[str, str] = {}  # cache handle -> key of its contents
+        self.stats = {"replayed": 0, "recorded": 0}
+        self._lock = threading.Lock()
+        if mode != "record" and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries.setdefault(entry["key"], []).append(entry)
+
+    def _key(self, kind, model, *parts) -> str:
+        payload = json.dumps([kind, model, [canonical(p) for p in parts]], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _request_key(self, kind, model, contents, config) -> str:
+        config = canonical(config)
+        if isinstance(config, dict) and "cached_content" in config:
+            config["cached_content"] = self.cache_keys.get(config["cached_content"], config["cached_content"])
+        return self._key(kind, model, contents, config)
+
+    def _lookup(self, key) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            recorded = self.entries.get(key)
+            if not recorded or self.mode == "record":
+                return None
+            i = self.served.get(key, 0)
+            self.served[key] = i + 1
+            self.stats["replayed"] += 1
+            return recorded[min(i, len(recorded) - 1)]
+
+    def _miss(self, key, model):
+        if self.mode == "replay" or self.inner is None:
+            raise CassetteMiss(f"No recorded response for {model} request {key[:12]} in {self.path}")
+
+    def _append(self, entry) -> None:
+        line = json.dumps(entry, separators=(",", ":")) + "\n"
+        with self._lock:
+            self.entries.setdefault(entry["key"], []).append(entry)
+            self.served[entry["key"]] = len(self.entries[entry["key"]])
+            self.stats["recorded"] += 1
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def generate(self, model, contents, config):
+        key = self._request_key("generate", model, contents, config)
+        entry = self._lookup(key)
+        if entry is not None:
+            return load_response(entry["response"])
+        self._miss(key, model)
+        response = self.inner.generate(model, contents, config)
+        self._append({"key": key, "kind": "generate", "model": model, "response": dump_response(response)})
+        return response
+
+    async def agenerate(self, model, contents, config):
+        key = self._request_key("generate", model, contents, config)
+        entry = self._lookup(key)
+        if entry is not None:
+            return load_response(entry["response"])
+        self._miss(key, model)
+        response = await self.inner.agenerate(model, contents, config)
+        self._append({"key": key, "kind": "generate", "model": model, "response": dump_response(response)})
+        return response
+
+    def generate_stream(self, model, contents, config):
+        key = self._request_key("stream", model, contents, config)
+        entry = self._lookup(key)
+        if entry is not None:
+            for chunk in entry["chunks"]:
+                yield load_response(chunk)
+            return
+        self._miss(key, model)
+        chunks = []
+        for chunk in self.inner.generate_stream(model, contents, config):
+            chunks.append(dump_response(chunk))
+            yield chunk
+        self._append({"key": key, "kind": "stream", "model": model, "chunks": chunks})
+
+    def create_cache(self, model, contents, tools, tool_config, ttl):
+        key = self._key("cache", model, contents, tools, tool_config)
+        entry = self._lookup(key)
+        if entry is not None:
+            handle = f"cassette/{key[:16]}"
+        else:
+            self._miss(key, model)
+            handle = self.inner.create_cache(model, contents, tools, tool_config, ttl)
+            if handle is None:
+                return None
+            self._append({"key": key, "kind": "cache", "model": model})
+        self.cache_keys[handle] = key
+        return handle
+
+    def delete_cache(self, handle):
+        self.cache_keys.pop(handle, None)
+        if self.inner is not None and not handle.startswith("cassette/"):
+            self.inner.delete_cache(handle)
+
+
+def dump_response(response) -> Dict[str, Any]:
+    if hasattr(response, "model_dump"):
+        return {"genai": response.model_dump(mode="json", exclude_none=True)}
+    return {"fake": {
+        "text": response.text,
+        "function_calls": [{"name": fc.name, "args": dict(fc.args or {})} for fc in response.function_calls or []],
+    }}
+
+
+def load_response(data: Dict[str, Any]):
+    if "genai" in data:
+        from google.genai import types
+        return types.GenerateContentResponse.model_validate(data["genai"])
+    return FakeResponse.build(data["fake"]["text"], data["fake"]["function_calls"])
+
+
+@dataclass
+class FakeFunctionCall:
+    name: str
+    args: Dict[str, Any]
+
+
+@dataclass
+class FakePart:
+    text: Optional[str] = None
+    function_call: Optional[FakeFunctionCall] = None
+
+
+@dataclass
+class FakeContent:
+    role: str = "model"
+    parts: List[FakePart] = field(default_factory=list)
+
+
+@dataclass
+class FakeCandidate:
+    content: FakeContent
+
+
+@dataclass
+class FakeResponse:
+    text: Optional[str]
+    function_calls: List[FakeFunctionCall]
+    candidates: List[FakeCandidate]
+
+    @classmethod
+    def build(cls, text: str = None, function_calls: List[Dict[str, Any]] = ()):
+        calls = [FakeFunctionCall(name=fc["name"], args=dict(fc.get("args", {}))) for fc in function_calls]
+        parts = ([FakePart(text=text)] if text else []) + [FakePart(function_call=fc) for fc in calls]
+        return cls(text=text, function_calls=calls, candidates=[FakeCandidate(FakeContent(parts=parts))])
+
+
+Step = Dict[str, Any]  # {"text": ..., "function_calls": [{"name": ..., "args": {...}}]}
+
+
+# tool name -> the agent that offers it, for telling requests apart in ScriptedBackend
+ROLES = {"propose_action": "action", "evaluate_action": "eval"}
+
+
+class ScriptedBackend(ModelBackend):
+    '''
+    Deterministic offline stand-in for Gemini.
+
+    `script` is a list of recorded steps replayed in order (cycling if
+    `cycle` is set), a dict of such lists keyed by role ("action" or
+    "eval", told apart by the tool the request offers) or by model name so
+    one backend can serve both agents, or a callable (model, contents) ->
+    step. Key by role when the agents share a model, as the fast eval route
+    and the action agent do.
+    Every call sleeps for `latency` seconds to mimic a model round trip;
+    streamed calls pay it before the first chunk and then emit text in
+    `chunk_chars` pieces followed by the function calls.
+    Context caches are kept in memory, and calls naming an unknown
+    cached_content fail the way the real API would.
+    '''
+    def __init__(self, script: Union[List[Step], Dict[str, List[Step]], Callable[[str, Any], Step]],
+                 latency: float = 0.0, cycle: bool = True, chunk_chars: int = 16):
+        self.script = script
+        self.latency = latency
+        self.chunk_chars = chunk_chars
+        self.cycle = cycle
+        self.calls = 0
+        self._iters = {}
+        # local stand-in for provider-side context caching
+        self.caches = {}
+        self.cached_calls = 0
+        self._handles = itertools.count()  # never reissued, so stale handles fail
+
+    def __getstate__(self):
+        # itertools objects won't pickle on newer Pythons; a copy, e.g. in a
+        # batch worker process, replays its script from the start
+        return dict(self.__dict__, _iters={}, _handles=next(self._handles))
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _handles=itertools.count(state["_handles"]))
+
+    def role(self, config) -> Optional[str]:
+        """
+        "action" or "eval" by the tool a request offers, directly or
+        through its context cache; None if it offers neither.
+        """
+        tools = getattr(config, "tools", None)
+        handle = getattr(config, "cached_content", None)
+        if not tools and handle in self.caches:
+            tools = self.caches[handle]["tools"]
+        for tool in tools or ():
+            for fd in getattr(tool, "function_declarations", None) or ():
+                name = fd.get("name") if isinstance(fd, dict) else getattr(fd, "name", None)
+                if name in ROLES:
+                    return ROLES[name]
+        return None
+
+    def _next_step(self, model, contents, config=None) -> Step:
+        if callable(self.script):
+            return self.script(model, contents)
+        key = model
+        if isinstance(self.script, dict):
+            role = self.role(config)
+            key = role if role in self.script else model
+        steps = self.script.get(key, []) if isinstance(self.script, dict) else self.script
+        it = self._iters.get(key)
+        if it is None:
+            it = self._iters[key] = itertools.cycle(steps) if self.cycle else iter(steps)
+        return next(it, {"text": "(script exhausted)"})
+
+    def create_cache(self, model, contents, tools, tool_config, ttl):
+        handle = f"cachedContents/local-{next(self._handles)}"
+        self.caches[handle] = {"model": model, "contents": contents, "tools": tools, "tool_config": tool_config}
+        return handle
+
+    def delete_cache(self, handle):
+        self.caches.pop(handle, None)
+
+    def _count_cached(self, config):
+        handle = getattr(config, "cached_content", None)
+        if handle is not None:
+            if handle not in self.caches:
+                raise KeyError(f"Unknown cached content {handle}")
+            self.cached_calls += 1
+
+    def generate(self, model, contents, config):
+        self.calls += 1
+        self._count_cached(config)
+        if self.latency:
+            time.sleep(self.latency)
+        step = self._next_step(model, contents, config)
+        return FakeResponse.build(step.get("text"), step.get("function_calls", ()))
+
+    async def agenerate(self, model, contents, config):
+        self.calls += 1
+        self._count_cached(config)
+        if self.latency:
+            import asyncio
+            await asyncio.sleep(self.latency)
+        step = self._next_step(model, contents, config)
+        return FakeResponse.build(step.get("text"), step.get("function_calls", ()))
+
+    def generate_stream(self, model, contents, config):
+        self.calls += 1
+        self._count_cached(config)
+        if self.latency:
+            time.sleep(self.latency)
+        step = self._next_step(model, contents, config)
+        text = step.get("text") or ""
+        for i in range(0, len(text), self.chunk_chars):
+            yield FakeResponse.build(text[i:i + self.chunk_chars])
+        if step.get("function_calls"):
+            yield FakeResponse.build(None, step["function_calls"])
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict
+
+from config import VERDICT_CACHE_PATH, CHECKPOINT_DIR
+from snapshot import IGNORE_DIRS
+from checkpoints import clone_file
+
+
+def make_workspace(repo_root: str, dest: str) -> str:
+    """
+    Create an isolated copy of repo_root at dest for one run.
+    Noise dirs (.git, venvs, node_modules, ...) and the repo's own
+    checkpoints, index and overlays are skipped.
+    """
+    shutil.copytree(
+        repo_root,
+        dest,
+        symlinks=True,
+        ignore=shutil.ignore_patterns(*IGNORE_DIRS, CHECKPOINT_DIR),
+        copy_function=clone_file,
+    )
+    return dest
+
+
+def load_goals(path: str):
+    with open(path, "r", encoding="utf-8") as f:
+        for i, line in enumerate(f):
+            line = line.strip()
+            if not line:
+                continue
+            job = json.loads(line)
+            job.setdefault("id", str(i))
+            if "goal" not in job:
+                job["goal"] = job.get("prompt", "")
+            yield job
+
+
+def run_one(job: Dict[str, Any], repo_root: str, work_dir: str, max_turns: int, keep: bool,
+            cache_path: str = None, backend=None) -> Dict[str, Any]:
+    """
+    Run a single goal in its own workspace. Executed inside a worker process.
+    """
+    # imported here so the parent process never needs model credentials
+    from main_loop import evaluate_prompt_events
+    from verdict_cache import VerdictCache
+
+    cache = VerdictCache(cache_path) if cache_path else None
+
+    workspace = tempfile.mkdtemp(prefix=f"run-{job['id']}-", dir=work_dir)
+    os.rmdir(workspace)
+    result = {"id": job["id"], "goal": job["goal"], "workspace": workspace}
+    start = time.perf_counter()
+    last_eval = None
+    verdict = "max_turns"
+    stop = None
+    try:
+        make_workspace(repo_root, workspace)
+        result["setup_s"] = round(time.perf_counter() - start, 4)
+        for event in evaluate_prompt_events(job["goal"], repo_root=workspace, max_turns=max_turns, cache=cache,
+                                            backend=backend):
+            if event["type"] == "turn":
+                last_eval = event["verdicts"][-1]
+            elif event["type"] == "done":
+                verdict = event["reason"]
+                stop = event["stop"]
+                result["routes"] = event["routes"]
+    except Exception as e:
+        verdict = "error"
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if not keep:
+            shutil.rmtree(workspace, ignore_errors=True)
+        if cache is not None:
+            result["verdict_cache"] = cache.stats()
+            cache.close()
+
+    result.update({
+        "latency_s": round(time.perf_counter() - start, 4),
+        "turns": stop["turns"] if stop else 0,
+        "verdict": verdict,
+        "stop": stop,
+        "last_decision": last_eval.to_dict() if last_eval is not None else None,
+    })
+    return result
+
+
+def run_batch(goals_path: str, report_path: str, repo_root: str = ".", workers: int = 4,
+              max_turns: int = 20, work_dir: str = None, keep: bool = False,
+              cache_path: str = VERDICT_CACHE_PATH, backend=None) -> int:
+    """
+    Run every goal in goals_path across a process pool of `workers`, streaming
+    one JSON line per finished run to report_path. Runs share the verdict
+    cache at cache_path (None disables it). `backend` (default: Gemini) is
+    pickled into each worker. Workers are spawned rather than forked, since
+    a fork of a process with live threads can inherit a held lock. Returns
+    the number of runs.
+    """
+    repo_root = os.path.abspath(repo_root)
+    work_dir = work_dir or tempfile.mkdtemp(prefix="agent-eval-batch-")
+    os.makedirs(work_dir, exist_ok=True)
+    count = 0
+    context = multiprocessing.get_context("spawn")
+    with open(report_path, "a", encoding="utf-8") as report, ProcessPoolExecutor(max_workers=workers,
+                                                                                 mp_context=context) as pool:
+        futures = {
+            pool.submit(run_one, job, repo_root, work_dir, max_turns, keep, cache_path, backend): job
+            for job in load_goals(goals_path)
+        }
+        for fut in as_completed(futures):
+            job = futures[fut]
+            try:
+                result = fut.result()
+            except Exception as e:
+                result = {"id": job["id"], "goal": job["goal"], "verdict": "error",
+                          "error": f"{type(e).__name__}: {e}"}
+            report.write(json.dumps(result, default=str) + "\n")
+            report.flush()
+            count += 1
+            print(f"[batch] {result['id']}: {result['verdict']} "
+                  f"({result.get('turns', 0)} turns, {result.get('latency_s', 0)}s)", file=sys.stderr)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run evaluate_prompt over a JSONL file of goals in isolated workspaces.")
+    parser.add_argument("goals", help='JSONL file, one {"id": ..., "goal": ...} object per line.')
+    parser.add_argument("--report", default="batch_report.jsonl", help="JSONL file results are appended to.")
+    parser.add_argument("--repo-root", default=".", help="Repo copied into each run's workspace.")
+    parser.add_argument("--workers", type=int, default=4, help="Max concurrent runs (default: 4).")
+    parser.add_argument("--max-turns", type=int, default=20, help="Turn cap per run (default: 20).")
+    parser.add_argument("--work-dir", default=None, help="Where workspaces are created (default: a temp dir).")
+    parser.add_argument("--keep", action="store_true", help="Keep workspaces after each run.")
+    parser.add_argument("--verdict-cache", default=VERDICT_CACHE_PATH, help="SQLite verdict cache shared by all runs.")
+    parser.add_argument("--no-verdict-cache", action="store_true", help="Evaluate every action with the model.")
+    args = parser.parse_args()
+
+    from llm_client import load_env
+
+    load_env()
+    if not os.getenv("GOOGLE_GENAI_API_KEY"):
+        raise SystemExit("Missing GOOGLE_GENAI_API_KEY environment variable.")
+
+    run_batch(args.goals, args.report, repo_root=args.repo_root, workers=args.workers,
+              max_turns=args.max_turns, work_dir=args.work_dir, keep=args.keep,
+              cache_path=None if args.no_verdict_cache else args.verdict_cache)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import contextlib
+import subprocess
+from typing import Any, Dict, List
+
+from backends import ScriptedBackend
+
+FILES_PER_DIR = 200
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    idx = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[idx]
+
+
+def make_synthetic_repo(root: str, n_files: int) -> str:
+    """
+    Create n_files small files spread over nested dirs of FILES_PER_DIR each.
+    """
+    for i in range(n_files):
+        d = os.path.join(root, f"pkg{i // (FILES_PER_DIR * FILES_PER_DIR)}", f"mod{(i // FILES_PER_DIR) % FILES_PER_DIR}")
+        if i % FILES_PER_DIR == 0:
+            os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, f"file{i}.py"), "w") as f:
+            f.write(f"x = {i}\n")
+    return root
+
+
+def bench_repo_summary(n_files: int, max_bytes: int = 60_000, repeats: int = 5) -> Dict[str, Any]:
+    """
+    Cost of producing the repo summary: a full parallel scan per call versus
+    the incremental RepoSnapshot (initial scan, refresh after one write, render).
+    """
+    from snapshot import RepoSnapshot, summarize_repo
+
+    root = tempfile.mkdtemp(prefix=f"bench-repo-{n_files}-")
+    try:
+        make_synthetic_repo(root, n_files)
+        walk = []
+        for _ in range(repeats):
+            t = time.perf_counter()
+            summarize_repo(root, max_bytes)
+            walk.append(time.perf_counter() - t)
+
+        t = time.perf_counter()
+        snap = RepoSnapshot(root)
+        initial = time.perf_counter() - t
+
+        incremental = []
+        target = os.path.join(root, "pkg0", "mod0", "file0.py")
+        for i in range(repeats):
+            with open(target, "w") as f:
+                f.write("x" * (i + 1))
+            t = time.perf_counter()
+            snap.mark_dirty(target)
+            snap.refresh()
+            snap.render(max_bytes)
+            incremental.append(time.perf_counter() - t)
+        return {
+            "bench": "repo_summary",
+            "files": n_files,
+            "walk_p50_ms": round(percentile(walk, 50) * 1e3, 3),
+            "snapshot_initial_ms": round(initial * 1e3, 3),
+            "snapshot_incremental_p50_ms": round(percentile(incremental, 50) * 1e3, 3),
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def synthetic_path(i: int) -> str:
+    """
+    Repo-relative path of file i of make_synthetic_repo.
+    """
+    return f"pkg{i // (FILES_PER_DIR * FILES_PER_DIR)}/mod{(i // FILES_PER_DIR) % FILES_PER_DIR}/file{i}.py"
+
+
+def scripted_session(n_files: int, n_steps: int, latency: float) -> ScriptedBackend:
+    """
+    Action model opens a different file on each of n_steps turns, so the
+    stall detector has nothing to flag, and then completes; eval model
+    approves everything.
+    """
+    actions = [
+        {"function_calls": [{"name": "propose_action", "args": {
+            "action_type": "OPEN_FILE", "target": synthetic_path(i * 7919 % n_files),
+            "contents_or_diff": "", "rationale": "benchmark read"}}]}
+        for i in range(n_steps)
+    ] + [
+        {"function_calls": [{"name": "propose_action", "args": {
+            "action_type": "COMPLETED", "target": "", "contents_or_diff": "", "rationale": "done"}}]}
+    ]
+    approve = [{"function_calls": [{"name": "evaluate_action", "args": {
+        "decision": "approve", "rationale": "benchmark", "confidence": 1.0}}]}]
+    return ScriptedBackend({"action": actions, "eval": approve}, latency=latency)
+
+
+def bench_loop(n_files: int, n_steps: int, latency: float) -> Dict[str, Any]:
+    """
+    Drive main_loop.evaluate_prompt_events against the scripted backend and
+    time each turn (action + eval + execute). Budgets are lifted so the run
+    covers all n_steps turns plus the COMPLETED one.
+    """
+    from main_loop import evaluate_prompt_events
+    from session import SessionController
+
+    root = tempfile.mkdtemp(prefix=f"bench-loop-{n_files}-")
+    try:
+        make_synthetic_repo(root, n_files)
+        backend = scripted_session(n_files, n_steps, latency)
+        controller = SessionController(max_turns=n_steps + 1, max_tokens=None, max_seconds=None,
+                                       repeat_limit=n_steps + 2, window=n_steps + 2)
+        steps = []
+        done = None
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            start = t = time.perf_counter()
+            for event in evaluate_prompt_events("benchmark", repo_root=root, backend=backend, controller=controller):
+                if event["type"] == "turn":
+                    now = time.perf_counter()
+                    steps.append(now - t)
+                    t = now
+                elif event["type"] == "done":
+                    done = event
+        total = time.perf_counter() - start
+        if done["reason"] != "completed" or len(steps) != n_steps + 1:
+            raise RuntimeError(f"scripted session stopped early: {done['reason']} after {len(steps)} turns")
+        return {
+            "bench": "evaluate_prompt",
+            "files": n_files,
+            "model_latency_ms": latency * 1e3,
+            "turns": len(steps),
+            "turns_per_s": round(len(steps) / total, 2) if total else 0.0,
+            "step_p50_ms": round(percentile(steps, 50) * 1e3, 3),
+            "step_p99_ms": round(percentile(steps, 99) * 1e3, 3),
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def bench_gate(n_files: int, rounds: int, latency: float) -> Dict[str, Any]:
+    import gate_gemini
+
+    root = tempfile.mkdtemp(prefix=f"bench-gate-{n_files}-")
+    try:
+        make_synthetic_repo(root, n_files)
+        backend = ScriptedBackend([{"function_calls": [{"name": "propose_action", "args": {
+            "action_type": "open_file", "target": "pkg0/mod0/file0.py",
+            "contents_or_diff": "", "rationale": "benchmark read"}}]}], latency=latency)
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            t = time.perf_counter()
+            gate_gemini.run_once("benchmark", max_tool_rounds=rounds, repo_root=root, backend=backend)
+            total = time.perf_counter() - t
+        return {
+            "bench": "gate_gemini.run_once",
+            "files": n_files,
+            "model_latency_ms": latency * 1e3,
+            "model_calls": backend.calls,
+            "total_ms": round(total * 1e3, 3),
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+# entry points whose cold start is guarded, and the modules they must not load up front
+IMPORT_TARGETS = {
+    "cli": "gate_gemini",
+    "loop": "main_loop",
+    "batch": "batch_eval",
+    "app": "app",
+}
+HEAVY_MODULES = ("google.genai", "dotenv", "PIL", "smolagents")
+
+
+def bench_imports(repeats: int = 5) -> List[Dict[str, Any]]:
+    """
+    Cold-start cost of each entry point: wall time of a fresh interpreter
+    importing it, and which heavy SDKs got imported along the way.
+    app is imported under streamlit's bare mode, where the logo is loaded.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    check = f"import sys; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    base = []
+    for _ in range(repeats):
+        t = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "pass"], check=True)
+        base.append(time.perf_counter() - t)
+    rows = []
+    for name, module in IMPORT_TARGETS.items():
+        samples, heavy, error = [], "", None
+        for _ in range(repeats):
+            t = time.perf_counter()
+            proc = subprocess.run([sys.executable, "-c", f"import {module}; {check}"], cwd=here,
+                                  capture_output=True, text=True)
+            samples.append(time.perf_counter() - t)
+            if proc.returncode != 0:
+                error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed"
+                break
+            heavy = proc.stdout.strip().splitlines()[-1] if proc.stdout.strip() else ""
+        rows.append({
+            "bench": "import",
+            "target": name,
+            "p50_ms": round(percentile(samples, 50) * 1e3, 1),
+            "interpreter_p50_ms": round(percentile(base, 50) * 1e3, 1),
+            "heavy_modules": heavy.split(",") if heavy else [],
+            "error": error,
+        })
+    return rows
+
+
+PROSE = ("The parser reads each file once and keeps the parsed tree in memory. When a file changes on "
+         "disk, only that file is parsed again, and the results of the other files are reused. Large "
+         "repositories are split into batches so the memory use stays flat while the scan runs. ")
+SIGNATURE_PROSE = ("Read your notes on the parser first, then tell the user what changed in the system and why. "
+         "Previous runs ignored some instructions about the prompt, so check them before you approve "
+         "the action; the evaluator will decide whether to delete the old files. ")
+
+
+def injection_corpora(size: int) -> Dict[str, str]:
+    """
+    About `size` characters each of plain English prose, of prose that uses
+    signature words (your, instructions, system prompt, approve, ...) in
+    every sentence but no signature, and of this repo's Python source.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    code = []
+    for name in sorted(os.listdir(here)):
+        if name.endswith(".py"):
+            with open(os.path.join(here, name), "r", encoding="utf-8") as f:
+                code.append(f.read())
+    code = "\n".join(code)
+    return {name: (text * (size // len(text) + 1))[:size]
+            for name, text in (("prose", PROSE), ("signature_words", SIGNATURE_PROSE), ("code", code))}
+
+
+def bench_injection(mb: float = 8.0, repeats: int = 3) -> List[Dict[str, Any]]:
+    """
+    Throughput of InjectionScanner.scan against one pass of its full regex
+    over the lowercased text, on clean prose and code, and whether both
+    found the same spans.
+    """
+    from injection import get_scanner
+
+    scanner = get_scanner()
+    rows = []
+    for name, text in injection_corpora(int(mb * 1e6)).items():
+        scan, full = [], []
+        for _ in range(repeats):
+            t = time.perf_counter()
+            found = [(f["start"], f["end"]) for f in scanner.scan(text)]
+            scan.append(time.perf_counter() - t)
+            t = time.perf_counter()
+            expected = [(m.start(), m.end()) for m in scanner._re.finditer(text.lower())]
+            full.append(time.perf_counter() - t)
+        mb_text = len(text) / 1e6
+        rows.append({
+            "bench": "injection",
+            "corpus": name,
+            "mb": round(mb_text, 1),
+            "scan_mb_s": round(mb_text / percentile(scan, 50), 1),
+            "full_regex_mb_s": round(mb_text / percentile(full, 50), 1),
+            "findings": len(found),
+            "same_as_full_regex": found == expected,
+        })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the gate loop using a scripted model backend.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000, 100_000, 1_000_000],
+                        help="Synthetic repo sizes in files (default: 1k 100k 1M).")
+    parser.add_argument("--steps", type=int, default=50, help="Action steps per scripted session (default: 50).")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Simulated model latency per call.")
+    parser.add_argument("--only", choices=["repo", "loop", "gate", "import", "injection"], nargs="+",
+                        default=["repo", "loop", "gate"])
+    parser.add_argument("--injection-mb", type=float, default=8.0,
+                        help="With --only injection: size of each text corpus in MB (default: 8).")
+    parser.add_argument("--max-import-ms", type=float, default=None,
+                        help="With --only import: fail if an entry point takes longer than this to import,"
+                             " or if cli/loop/batch import a heavy SDK eagerly.")
+    args = parser.parse_args()
+
+    if "import" in args.only:
+        failed = False
+        for row in bench_imports():
+            print(json.dumps(row))
+            if args.max_import_ms is not None and row["error"] is None:
+                slow = row["p50_ms"] > args.max_import_ms
+                eager = row["target"] != "app" and row["heavy_modules"]
+                failed = failed or slow or bool(eager)
+        if failed:
+            raise SystemExit("import-time budget exceeded")
+
+    if "injection" in args.only:
+        for row in bench_injection(args.injection_mb):
+            print(json.dumps(row))
+
+    latency = args.latency_ms / 1e3
+    for n in args.sizes:
+        if "repo" in args.only:
+            print(json.dumps(bench_repo_summary(n)))
+        if "loop" in args.only:
+            print(json.dumps(bench_loop(n, args.steps, latency)))
+        if "gate" in args.only:
+            print(json.dumps(bench_gate(n, args.steps, latency)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import os
+import json
+import time
+import uuid
+import argparse
+import shutil
+import hashlib
+import threading
+from typing import Dict, List, Optional
+
+from config import CHECKPOINT_DIR
+
+FICLONE = 0x40049409  # linux/fs.h: _IOW(0x94, 9, int)
+
+
+def clone_file(src: str, dst: str) -> bool:
+    """
+    Copy a file as a copy-on-write clone (reflink) where the filesystem
+    supports it (btrfs, xfs, ...), falling back to a regular copy. Returns
+    whether it was cloned.
+    """
+    try:
+        import fcntl
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        shutil.copystat(src, dst)
+        return True
+    except (ImportError, OSError):
+        shutil.copy2(src, dst)
+        return False
+
+
+def file_digest(path: str) -> str:
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+class CheckpointStore:
+    '''
+    Undo log for the files an agent changes, kept under
+    <repo>/.agent-eval (CHECKPOINT_DIR).
+
+    Before a WRITE_FILE/DELETE_FILE touches a path, `capture` saves its
+    pre-image once per checkpoint into a content-addressed object store
+    (objects/ab/cdef...), so identical contents are stored once. Objects are
+    reflinked where the filesystem supports it and copied otherwise, never
+    hardlinked: the live file may still be edited in place (by the user, or
+    after a failed write), which would change the object under every
+    checkpoint that refers to it. Cost scales with the files touched, not
+    with the size of the repo.
+
+    `begin()` opens a checkpoint (e.g. one per turn); `rollback(id)` restores
+    every path changed since that checkpoint was opened, so rolling back to
+    the first checkpoint undoes the whole session.
+    '''
+    def __init__(self, repo_root: str, store_dir: str = None):
+        self.repo_root = os.path.abspath(repo_root)
+        self.store_dir = store_dir or os.path.join(self.repo_root, CHECKPOINT_DIR)
+        self.objects_dir = os.path.join(self.store_dir, "objects")
+        self.checkpoints_dir = os.path.join(self.store_dir, "checkpoints")
+        os.makedirs(self.objects_dir, exist_ok=True)
+        os.makedirs(self.checkpoints_dir, exist_ok=True)
+        # checkpoint ids, oldest first; ids start with a timestamp
+        self.order: List[str] = sorted(n[:-5] for n in os.listdir(self.checkpoints_dir) if n.endswith(".json"))
+        self.current: Optional[str] = None
+        self.label = ""
+        self.created = 0.0
+        self.manifest: Dict[str, Optional[str]] = {}  # rel path -> object id, None if absent
+        self.stats = {"captured": 0, "cloned": 0, "copied": 0, "deduplicated": 0, "restored": 0}
+        self._lock = threading.Lock()
+
+    def _object_path(self, oid: str) -> str:
+        return os.path.join(self.objects_dir, oid[:2], oid[2:])
+
+    def _rel(self, path: str) -> str:
+        return os.path.relpath(os.path.abspath(path), self.repo_root).replace(os.sep, "/")
+
+    def begin(self, label: str = "") -> str:
+        """
+        Open a new checkpoint; later captures are recorded under it.
+        """
+        with self._lock:
+            self._save()
+            now = time.time_ns()
+            stamp = time.strftime('%Y%m%dT%H%M%S', time.localtime(now // 10**9))
+            cid = f"{stamp}.{now % 10**9:09d}-{uuid.uuid4().hex[:6]}"
+            self.order.append(cid)
+            self.current = cid
+            self.manifest = {}
+            self.label = label
+            self.created = time.time()
+            self._save()
+            return cid
+
+    def _save(self) -> None:
+        if self.current is None:
+            return
+        data = {"id": self.current, "label": self.label, "created": self.created, "files": self.manifest}
+        tmp = os.path.join(self.checkpoints_dir, f".{self.current}.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp, os.path.join(self.checkpoints_dir, f"{self.current}.json"))
+
+    def store(self, path: str) -> str:
+        """
+        Add the current contents of `path` to the object store and return its id.
+        """
+        # hash the private copy, so the id matches even if `path` changes meanwhile
+        tmp = os.path.join(self.store_dir, f".object-{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            cloned = clone_file(path, tmp)
+            oid = file_digest(tmp)
+            obj = self._object_path(oid)
+            if os.path.exists(obj):
+                self.stats["deduplicated"] += 1
+                return oid
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            os.replace(tmp, obj)
+            self.stats["cloned" if cloned else "copied"] += 1
+            return oid
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def capture(self, path: str) -> None:
+        """
+        Record the pre-image of `path` in the open checkpoint, unless it was
+        already captured there. Call before changing the file.
+        """
+        with self._lock:
+            if self.current is None:
+                return
+            rel = self._rel(path)
+            if rel in self.manifest:
+                return
+            self.manifest[rel] = self.store(path) if os.path.isfile(path) else None
+            self.stats["captured"] += 1
+            self._save()
+
+    def _info(self, cid: str):
+        if cid == self.current:
+            return self.label, self.created
+        with open(os.path.join(self.checkpoints_dir, f"{cid}.json"), "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return data.get("label", ""), data.get("created", 0.0)
+
+    def _load(self, cid: str) -> Dict[str, Optional[str]]:
+        if cid == self.current:
+            return self.manifest
+        with open(os.path.join(self.checkpoints_dir, f"{cid}.json"), "r", encoding="utf-8") as f:
+            return json.load(f)["files"]
+
+    def rollback(self, cid: str = None) -> List[str]:
+        """
+        Restore every path changed since checkpoint `cid` (default: the open
+        one) was begun. Returns the restored paths, relative to the repo.
+        """
+        with self._lock:
+            cid = cid or self.current
+            if cid not in self.order:
+                raise KeyError(f"Unknown checkpoint: {cid}")
+            idx = self.order.index(cid)
+            # oldest pre-image wins, so apply newest first
+            restored = {}
+            for c in reversed(self.order[idx:]):
+                restored.update(self._load(c))
+            for rel, oid in restored.items():
+                self._restore(rel, oid)
+            self.stats["restored"] += len(restored)
+            # the checkpoint stays open, now empty
+            for c in self.order[idx + 1:]:
+                self._remove_checkpoint(c)
+            del self.order[idx + 1:]
+            self.label, self.created = self._info(cid)
+            self.current = cid
+            self.manifest = {}
+            self._save()
+            return sorted(restored)
+
+    def _restore(self, rel: str, oid: Optional[str]) -> None:
+        path = os.path.join(self.repo_root, rel)
+        if oid is None:
+            if os.path.lexists(path):
+                os.remove(path)
+            return
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+        # a copy, so that later edits to the restored file cannot reach the object
+        clone_file(self._object_path(oid), tmp)
+        os.replace(tmp, path)
+
+    def _remove_checkpoint(self, cid: str) -> None:
+        try:
+            os.remove(os.path.join(self.checkpoints_dir, f"{cid}.json"))
+        except FileNotFoundError:
+            pass
+
+    def discard(self) -> None:
+        """
+        Forget every checkpoint of the repo, keeping the changes, and drop
+        the objects they referred to.
+        """
+        with self._lock:
+            for cid in self.order:
+                self._remove_checkpoint(cid)
+            self.order.clear()
+            self.current = None
+            self.manifest = {}
+        self.gc()
+
+    def gc(self) -> int:
+        """
+        Remove objects that no checkpoint on disk refers to. Returns how many.
+        """
+        with self._lock:
+            live = set()
+            for name in os.listdir(self.checkpoints_dir):
+                if name.endswith(".json"):
+                    with open(os.path.join(self.checkpoints_dir, name), "r", encoding="utf-8") as f:
+                        live.update(oid for oid in json.load(f)["files"].values() if oid)
+            removed = 0
+            for prefix in os.listdir(self.objects_dir):
+                for rest in os.listdir(os.path.join(self.objects_dir, prefix)):
+                    if prefix + rest not in live and not rest.endswith(".tmp"):
+                        os.remove(os.path.join(self.objects_dir, prefix, rest))
+                        removed += 1
+                try:
+                    os.rmdir(os.path.join(self.objects_dir, prefix))
+                except OSError:
+                    pass  # not empty
+            return removed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="List, roll back or clean up agent checkpoints of a repo.")
+    ap.add_argument("--repo", default=".", help="Path to repo root")
+    sub = ap.add_subparsers(dest="command", required=True)
+    sub.add_parser("list", help="List checkpoints, oldest first")
+    rb = sub.add_parser("rollback", help="Undo every change made since a checkpoint")
+    rb.add_argument("checkpoint")
+    sub.add_parser("gc", help="Remove checkpoints and unreferenced objects, keeping the changes")
+    args = ap.parse_args()
+
+    store = CheckpointStore(args.repo)
+    if args.command == "list":
+        for cid in store.order:
+            label, _ = store._info(cid)
+            print(cid, label, len(store._load(cid)), "file(s)")
+    elif args.command == "rollback":
+        for rel in store.rollback(args.checkpoint):
+            print("restored", rel)
+    else:
+        store.discard()
+
+
+if __name__ == "__main__":
+    main()
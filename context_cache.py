@@ -0,0 +1,143 @@
+import time
+import json
+import hashlib
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from config import CONTEXT_CACHE_TTL, CONTEXT_CACHE_MIN_CHARS
+
+
+def _fingerprint(model, prefix_texts, tools_key) -> str:
+    h = hashlib.sha256()
+    h.update(model.encode("utf-8"))
+    for text in prefix_texts:
+        h.update(b"\0")
+        h.update(text.encode("utf-8"))
+    h.update(json.dumps(tools_key, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+class ContextCacheManager:
+    '''
+    Registers the stable prefix of a request (primer, tool schemas, repo
+    snapshot) with the backend's context cache once and hands out its
+    handle for later calls, so each turn only sends the new content.
+
+    There is one active cache per slot and model (e.g. ("action", model),
+    ("eval", fast model), ("eval", strong model)), so eval routes on
+    different models keep their own caches. When the prefix of a slot
+    changes, for instance because the repo snapshot did, a new cache is
+    registered and the old one deleted. `get` leases the handle it returns
+    and the caller gives it back with `release` once the request is done;
+    a replaced cache still leased by a request in flight is only deleted
+    when the last lease is released. Prefixes shorter than `min_chars` are
+    not worth caching and are sent inline.
+    '''
+    def __init__(self, backend, ttl: float = CONTEXT_CACHE_TTL, min_chars: int = CONTEXT_CACHE_MIN_CHARS):
+        self.backend = backend
+        self.ttl = ttl
+        self.min_chars = min_chars
+        self.slots: Dict[Tuple[str, str], Dict[str, Any]] = {}  # (slot, model) -> entry
+        self.leases: Dict[str, int] = {}  # handle -> requests using it
+        self.retired: Dict[str, Dict[str, Any]] = {}  # replaced entries still leased, by handle
+        self.failed = set()
+        self.stats = {"created": 0, "reused": 0, "invalidated": 0, "inline": 0, "errors": 0}
+        self._lock = threading.Lock()
+        self._slot_locks: Dict[Tuple[str, str], threading.Lock] = {}  # held while a slot's cache is created
+
+    def get(self, slot: str, model: str, prefix_texts, contents, tools, tool_config,
+            tools_key=None) -> Optional[str]:
+        """
+        Leased handle of a cache holding `contents` + `tools`/`tool_config`
+        for `model`, or None if the request should be sent without one.
+        `prefix_texts` and `tools_key` (e.g. the tool schema and calling
+        mode) are the plain values the cache is keyed on. Pass the handle
+        to `release` after the request.
+        """
+        if sum(len(t) for t in prefix_texts) < self.min_chars:
+            self.stats["inline"] += 1
+            return None
+        key = _fingerprint(model, prefix_texts, tools_key)
+        with self._lock:
+            slot_lock = self._slot_locks.setdefault((slot, model), threading.Lock())
+        # create_cache is a network round trip: only callers of the same slot
+        # wait for it, the others and release() go on under self._lock
+        with slot_lock:
+            with self._lock:
+                if key in self.failed:
+                    self.stats["inline"] += 1
+                    return None
+                entry = self.slots.get((slot, model))
+                # refresh a little before the provider expires it
+                if entry and entry["key"] == key and time.monotonic() - entry["created"] < 0.9 * self.ttl:
+                    self.stats["reused"] += 1
+                    return self._lease(entry["handle"])
+                stale = None
+                if entry:
+                    stale = self._retire(entry)
+                    self.stats["invalidated"] += 1
+                    del self.slots[(slot, model)]
+            if stale is not None:
+                self._delete(stale)
+            try:
+                handle = self.backend.create_cache(model, contents, tools, tool_config, self.ttl)
+            except Exception:
+                with self._lock:
+                    self.failed.add(key)
+                    self.stats["errors"] += 1
+                return None
+            with self._lock:
+                if handle is None:
+                    self.failed.add(key)
+                    self.stats["inline"] += 1
+                    return None
+                self.slots[(slot, model)] = {"key": key, "handle": handle, "created": time.monotonic()}
+                self.stats["created"] += 1
+                return self._lease(handle)
+
+    def _lease(self, handle: str) -> str:
+        self.leases[handle] = self.leases.get(handle, 0) + 1
+        return handle
+
+    def release(self, handle: Optional[str]) -> None:
+        """
+        Return a handle from `get`; a replaced cache is deleted once no
+        request uses it.
+        """
+        if handle is None:
+            return
+        with self._lock:
+            left = self.leases.get(handle, 0) - 1
+            if left > 0:
+                self.leases[handle] = left
+                return
+            self.leases.pop(handle, None)
+            entry = self.retired.pop(handle, None)
+        if entry is not None:
+            self._delete(entry)
+
+    def _retire(self, entry) -> Optional[Dict[str, Any]]:
+        """
+        Keep a replaced entry until its leases are released. Returns it if
+        it has none, for the caller to delete outside the lock.
+        """
+        if self.leases.get(entry["handle"]):
+            self.retired[entry["handle"]] = entry
+            return None
+        return entry
+
+    def _delete(self, entry) -> None:
+        try:
+            self.backend.delete_cache(entry["handle"])
+        except Exception:
+            # it expires on its own
+            pass
+
+    def close(self) -> None:
+        with self._lock:
+            entries = list(self.slots.values()) + list(self.retired.values())
+            self.slots.clear()
+            self.retired.clear()
+            self.leases.clear()
+        for entry in entries:
+            self._delete(entry)
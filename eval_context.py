@@ -0,0 +1,90 @@
+import re
+import threading
+from typing import Dict, Optional, Tuple
+
+from config import CHECK_STR, CHECK_STEP_STR
+
+_LINE = re.compile(r"^(\S.*) \((\d+) bytes(?:, crc ([0-9a-f]{8}))?\)$", re.MULTILINE)
+
+
+def parse_state(state: str) -> Dict[str, Tuple[int, Optional[str]]]:
+    """
+    path -> (size, crc) for every "path (N bytes, crc xxxxxxxx)" line of a
+    summarize_repo text. The crc is None on lines without one.
+    """
+    return {m.group(1): (int(m.group(2)), m.group(3)) for m in _LINE.finditer(state or "")}
+
+
+def diff_states(old: Dict[str, Tuple[int, Optional[str]]], new: Dict[str, Tuple[int, Optional[str]]]) -> str:
+    lines = []
+    for path in sorted(new.keys() - old.keys()):
+        lines.append(f"+ {path} ({new[path][0]} bytes)")
+    for path in sorted(old.keys() - new.keys()):
+        lines.append(f"- {path}")
+    for path in sorted(p for p in old.keys() & new.keys() if old[p] != new[p]):
+        (old_size, _), (new_size, _) = old[path], new[path]
+        if old_size != new_size:
+            lines.append(f"~ {path} ({old_size} -> {new_size} bytes)")
+        else:
+            lines.append(f"~ {path} ({new_size} bytes, edited)")
+    return "\n".join(lines)
+
+
+class EvalContext:
+    '''
+    Builds the EvalAgent prompt for a session.
+
+    The full repo state is rendered into CHECK_STR once and reused verbatim
+    as a stable prefix; each evaluation then only adds the added/removed/
+    changed files since that base plus the proposed action. When the diff
+    grows past `rebase_ratio` of the base, the current state becomes the
+    new base.
+    '''
+    def __init__(self, goal: str, template: str = CHECK_STR, step_template: str = CHECK_STEP_STR,
+                 rebase_ratio: float = 0.5):
+        self.goal = goal
+        self.template = template
+        self.step_template = step_template
+        self.rebase_ratio = rebase_ratio
+        self.base_state = None
+        self.base_files = {}
+        self.prefix = ""
+        self.changes = ""
+        self._state = None
+        self._lock = threading.Lock()
+        self.rebases = 0
+
+    def _rebase(self, state: str, files: Dict[str, Tuple[int, Optional[str]]]) -> None:
+        self.base_state = state
+        self.base_files = files
+        self.prefix = self.template.format(goal=self.goal, repo=state)
+        self.changes = ""
+        self.rebases += 1
+
+    def sync(self, state: str) -> None:
+        if state is None or state == self._state:
+            return
+        self._state = state
+        files = parse_state(state)
+        if self.base_state is None:
+            self._rebase(state, files)
+            return
+        changes = diff_states(self.base_files, files)
+        if len(changes) > self.rebase_ratio * len(self.base_state):
+            self._rebase(state, files)
+        else:
+            self.changes = changes
+
+    def render(self, state: str, action) -> Tuple[str, str]:
+        """
+        Returns (prefix, step): the session prefix, identical across calls
+        until the next rebase, and the per-evaluation message.
+        """
+        with self._lock:
+            self.sync(state)
+            prefix, changes = self.prefix, self.changes
+        changes = (
+            f"Repo changes since the layout above (+ added, - removed, ~ changed):\n{changes}\n"
+            if changes else "The repo is unchanged since the layout above.\n"
+        )
+        return prefix, self.step_template.format(changes=changes, action=action)
@@ -0,0 +1,158 @@
+import os
+import re
+import mmap
+from typing import Any, Dict, Optional
+
+from config import READ_MAX_BYTES, READ_MAX_MATCHES, READ_GREP_MAX_SCAN_BYTES
+
+BINARY_SNIFF_BYTES = 8192
+
+# the optional `read` argument of propose_action for OPEN_FILE
+READ_SCHEMA = {
+    "type": "object",
+    "description": (
+        "Optional, OPEN_FILE only: which part of the file to read. Use at most one of"
+        " a byte range, a line range, head, tail or grep. Without it the start of the file is read."
+    ),
+    "properties": {
+        "start_byte": {"type": "integer", "description": "First byte (0-based)."},
+        "end_byte": {"type": "integer", "description": "End byte (exclusive)."},
+        "start_line": {"type": "integer", "description": "First line (1-based)."},
+        "end_line": {"type": "integer", "description": "Last line (inclusive)."},
+        "head": {"type": "integer", "description": "Read the first N lines."},
+        "tail": {"type": "integer", "description": "Read the last N lines."},
+        "grep": {"type": "string", "description": (
+            "Regex; return only matching lines with their line numbers. Repeated groups that"
+            " contain a repeat themselves, like (a+)+, are rejected.")},
+    },
+}
+
+
+def is_binary(buf) -> bool:
+    return b"\0" in buf[:BINARY_SNIFF_BYTES]
+
+
+def _line_start(mm, line: int) -> int:
+    """
+    Offset of 1-based `line`, or the file size if there are fewer lines.
+    """
+    pos = 0
+    for _ in range(max(line, 1) - 1):
+        pos = mm.find(b"\n", pos)
+        if pos < 0:
+            return len(mm)
+        pos += 1
+    return pos
+
+
+def _tail_start(mm, n: int) -> int:
+    end = len(mm)
+    if end and mm[end - 1:end] == b"\n":
+        end -= 1
+    for _ in range(n):
+        end = mm.rfind(b"\n", 0, end)
+        if end < 0:
+            return 0
+    return end + 1
+
+
+def _nested_quantifier(pattern: str) -> bool:
+    """
+    Whether a repeated group contains a repeat itself, e.g. (a+)+ or
+    (\\w+\\s?)*, the usual shape of catastrophic backtracking.
+    """
+    stack = [False]  # per open group: whether it holds a quantifier
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            i += 2
+            continue
+        if c == "[":
+            i += 2 if pattern[i + 1:i + 2] == "]" else 1
+            while i < len(pattern) and pattern[i] != "]":
+                i += 2 if pattern[i] == "\\" else 1
+        elif c == "(":
+            stack.append(False)
+            if pattern[i + 1:i + 2] == "?":
+                i += 1  # (?:, (?P<...> etc., not a quantifier
+        elif c == ")" and len(stack) > 1:
+            inner = stack.pop()
+            if inner and pattern[i + 1:i + 2] in ("*", "+", "{"):
+                return True
+            stack[-1] = stack[-1] or inner
+        elif c in "*+?{":
+            stack[-1] = True
+        i += 1
+    return False
+
+
+def _grep(mm, pattern: str, max_bytes: int, max_matches: int, max_scan: int):
+    """
+    Matching lines of the first `max_scan` bytes as "lineno:line" text.
+    Returns (text, matches, truncated).
+    """
+    if _nested_quantifier(pattern):
+        raise ValueError(f"grep pattern has a repeated group that repeats inside: {pattern!r}")
+    regex = re.compile(pattern.encode("utf-8"), re.MULTILINE)
+    out, size, matches = [], 0, 0
+    lineno, counted = 1, 0
+    last_line = -1
+    for m in regex.finditer(mm, 0, max_scan):
+        start = mm.rfind(b"\n", 0, m.start()) + 1
+        if start == last_line or start == len(mm):
+            continue  # same line, or the empty "line" after a final newline
+        end = mm.find(b"\n", m.start())
+        end = len(mm) if end < 0 else end
+        lineno += mm[counted:start].count(b"\n")
+        counted = start
+        line = f"{lineno}:{mm[start:end].decode('utf-8', errors='replace')}\n"
+        if size + len(line) > max_bytes or matches >= max_matches:
+            return "".join(out), matches, True
+        out.append(line)
+        size += len(line)
+        matches += 1
+        last_line = start
+    return "".join(out), matches, len(mm) > max_scan
+
+
+def read_file(path: str, read: Optional[Dict[str, Any]] = None, max_bytes: int = READ_MAX_BYTES,
+              max_matches: int = READ_MAX_MATCHES, max_scan: int = READ_GREP_MAX_SCAN_BYTES) -> Dict[str, Any]:
+    """
+    Read the slice of `path` described by `read` (see READ_SCHEMA) through
+    mmap, so only the requested part is copied and decoded. At most
+    `max_bytes` are returned, and grep only searches the first `max_scan`.
+    Binary files are reported, not decoded.
+    Returns the fields of an OPEN_FILE result.
+    """
+    read = read or {}
+    size = os.path.getsize(path)
+    result = {"size": size}
+    if size == 0:
+        return dict(result, content="", range=[0, 0], truncated=False)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        if is_binary(mm):
+            return dict(result, binary=True, content=f"<binary file, {size} bytes>")
+        if read.get("grep"):
+            content, matches, truncated = _grep(mm, read["grep"], max_bytes, max_matches, max_scan)
+            return dict(result, content=content, matches=matches, truncated=truncated)
+
+        if read.get("tail") is not None:
+            start, end = _tail_start(mm, int(read["tail"])), size
+        elif read.get("head") is not None:
+            start = 0
+            end = _line_start(mm, int(read["head"]) + 1)
+        elif read.get("start_line") is not None or read.get("end_line") is not None:
+            start = _line_start(mm, int(read.get("start_line") or 1))
+            end = _line_start(mm, int(read["end_line"]) + 1) if read.get("end_line") is not None else size
+        else:
+            start = int(read.get("start_byte") or 0)
+            end = int(read["end_byte"]) if read.get("end_byte") is not None else size
+        start = min(max(start, 0), size)
+        end = min(max(end, start), size)
+        truncated = end - start > max_bytes
+        if truncated:
+            end = start + max_bytes
+        # a cut may split a multi-byte character; replace rather than fail
+        content = mm[start:end].decode("utf-8", errors="replace")
+    return dict(result, content=content, range=[start, end], truncated=truncated)
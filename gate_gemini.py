@@ -4,44 +4,17 @@ import json
 import argparse
 from typing import Any, Dict
 
-import google.genai as genai
-from google.genai import types
+from backends import GeminiBackend, TracedBackend, CassetteBackend
+from llm_client import load_env
+from file_reads import read_file, READ_SCHEMA
+from patching import write_file
+from snapshot import summarize_repo
+from injection import guard_read
+from telemetry import telemetry
+from config import CASSETTE_PATH, CASSETTE_MODE
 
 MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")  # fast + supports tools
 
-IGNORE_DIRS = {".git", ".venv", "venv", "__pycache__", ".mypy_cache", ".pytest_cache", "node_modules"}
-IGNORE_FILES = {".DS_Store"}
-
-def summarize_repo(root: str, max_bytes: int = 60_000) -> str:
-    """
-    Returns a compact text summary of the repo (paths + small file heads)
-    capped by max_bytes. Skips common noise.
-    """
-    lines = []
-    total = 0
-    root = os.path.abspath(root)
-    for dirpath, dirnames, filenames in os.walk(root):
-        # prune ignored dirs
-        dirnames[:] = [d for d in dirnames if d not in IGNORE_DIRS and not d.startswith(".")]
-        rel_dir = os.path.relpath(dirpath, root)
-        if rel_dir == ".":
-            rel_dir = ""
-        for fn in sorted(filenames):
-            if fn in IGNORE_FILES or fn.startswith("."):
-                continue
-            rel_path = os.path.join(rel_dir, fn) if rel_dir else fn
-            try:
-                size = os.path.getsize(os.path.join(root, rel_path))
-            except Exception:
-                continue
-            line = f"{rel_path} ({size} bytes)"
-            if total + len(line) + 1 > max_bytes:
-                lines.append("…(truncated)")
-                return "\n".join(lines)
-            lines.append(line)
-            total += len(line) + 1
-    return "\n".join(lines)
-
 
 def mock_eval_always_decline(action: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -93,13 +66,15 @@ def make_propose_action_declaration() -> Dict[str, Any]:
                     "type": "string",
                     "description": (
                         "For file actions, provide full file contents or a unified diff."
+                        " Prefer a unified diff (---/+++ headers and @@ hunks) for small changes to large files."
                         " For shell, provide the exact command."
                     )
                 },
                 "rationale": {
                     "type": "string",
                     "description": "Why this action is necessary in 1–3 sentences."
-                }
+                },
+                "read": READ_SCHEMA
             },
             "required": ["action_type", "target", "contents_or_diff", "rationale"]
         }
@@ -113,8 +88,11 @@ Rules:
 - Prefer small, auditable steps. Never propose destructive commands.
 """
 
-def run_once(user_prompt: str, force_action_mode: bool = False, max_tool_rounds: int = 3, repo_root=".", repo_bytes=60000) -> None:
-    client = genai.Client(api_key=os.environ["GOOGLE_GENAI_API_KEY"])
+@telemetry.traced("run_once")
+def run_once(user_prompt: str, force_action_mode: bool = False, max_tool_rounds: int = 3, repo_root=".", repo_bytes=60000, backend=None) -> None:
+    from google.genai import types  # deferred so --help and imports stay fast
+
+    backend = TracedBackend(backend or GeminiBackend(), telemetry)
 
     tools = [types.Tool(function_declarations=[make_propose_action_declaration()])]
 
@@ -136,7 +114,8 @@ def run_once(user_prompt: str, force_action_mode: bool = False, max_tool_rounds:
 
 
     # Start the conversation
-    repo_summary = summarize_repo(repo_root, repo_bytes)
+    with telemetry.span("summarize_repo"):
+        repo_summary = summarize_repo(repo_root, repo_bytes, goal=user_prompt)
     repo_prompt = f"Project context (read-only summary):\n{repo_summary}"
     contents = [
         types.Content(role="user", parts=[types.Part.from_text(text=SYSTEM_PRIMER)]),
@@ -145,7 +124,7 @@ def run_once(user_prompt: str, force_action_mode: bool = False, max_tool_rounds:
     ]
 
     # First turn
-    response = client.models.generate_content(model=MODEL, contents=contents, config=config)
+    response = backend.generate(model=MODEL, contents=contents, config=config)
     print_model_text(response)
 
     rounds = 0
@@ -164,9 +143,13 @@ def run_once(user_prompt: str, force_action_mode: bool = False, max_tool_rounds:
             # Send to our mock eval (declines everything)
             # eval_result = mock_eval_always_decline(tool_call.args)
             eval_result = mock_eval_always_approve(tool_call.args)
+        telemetry.count("verdicts_total", action=str(tool_call.args.get("action_type", "")).upper(),
+                        decision="approve" if eval_result.get("approved") else "decline", rule="mock", cached=False)
 
         if eval_result.get("approved"):
-            exec_result = execute_action(tool_call.args, repo_root=repo_root)
+            with telemetry.span("execute_action", target=tool_call.args.get("target", "")):
+                exec_result = execute_action(tool_call.args, repo_root=repo_root)
+            telemetry.record_file_io(exec_result)
             tool_payload = {"result": {"gate": eval_result, "execution": exec_result}}
         else:
             tool_payload = {"result": {"gate": eval_result}}
@@ -182,7 +165,7 @@ def run_once(user_prompt: str, force_action_mode: bool = False, max_tool_rounds:
         contents.append(types.Content(role="user", parts=[function_response_part]))
 
         # Ask Gemini to continue, now that we supplied the tool result (decline)
-        response = client.models.generate_content(model=MODEL, contents=contents, config=config)
+        response = backend.generate(model=MODEL, contents=contents, config=config)
         print_model_text(response)
 
     # If still requesting tools after our cap, stop cleanly.
@@ -204,22 +187,12 @@ def execute_action(action, repo_root):
     try:
         if at =="open_file":
             path = _safe_join(repo_root, target)
-            with open(path, "rb") as f:
-                data=f.read(200_000)
-            try:
-                text = data.decode("utf-8")
-            except UnicodeDecodeError:
-                text = data.decode("latin1", errors="replace")
-            return {"ok": True, "action": at, "target": target, "content": text}
+            return guard_read({"ok": True, "action": at, "target": target, **read_file(path, action.get("read"))})
 
         elif at =="write_file":
             path = _safe_join(repo_root, target)
-            dir_path = os.path.dirname(path)
-            if dir_path:
-                os.makedirs(dir_path, exist_ok=True)
-            with open(path, "w", encoding="utf-8") as f:
-                f.write(payload)
-            return {"ok": True, "action": action, "target": target}
+            result = write_file(path, payload)
+            return {"ok": result.pop("ok"), "action": at, "target": target, **result}
         
         elif at =="delete_file":
             path = _safe_join(repo_root, target)
@@ -236,7 +209,7 @@ def execute_action(action, repo_root):
         return {"ok": False, "error": str(e)}
 
 
-def print_model_text(response: types.GenerateContentResponse) -> None:
+def print_model_text(response: "types.GenerateContentResponse") -> None:
     """
     Print the model's natural language output, if any.
     """
@@ -279,13 +252,25 @@ def main():
                         help="Max back-and-forth rounds after tool calls (default: 3).")
     parser.add_argument("--repo-root", default=".", help="Path to repo root to summarize.")
     parser.add_argument("--repo-bytes", type=int, default=60000, help="Max bytes of repo summary.")
+    parser.add_argument("--trace", default=None, help="Append spans to this JSONL file.")
+    parser.add_argument("--cassette", default=CASSETTE_PATH,
+                        help="Record model calls to / replay them from this JSONL cassette.")
+    parser.add_argument("--cassette-mode", choices=CassetteBackend.MODES, default=CASSETTE_MODE,
+                        help="record, replay (offline, fail on unknown requests) or auto (default).")
 
     args = parser.parse_args()
+    if args.trace:
+        telemetry.trace_path = args.trace
+
+    backend = None
+    if args.cassette:
+        backend = CassetteBackend(GeminiBackend(), args.cassette, args.cassette_mode)
 
-    if not os.getenv("GOOGLE_GENAI_API_KEY"):
+    load_env()
+    if not os.getenv("GOOGLE_GENAI_API_KEY") and args.cassette_mode != "replay":
         raise SystemExit("Missing GOOGLE_GENAI_API_KEY environment variable.")
 
-    run_once(args.prompt, force_action_mode=args.force_action, max_tool_rounds=args.max_tool_rounds, repo_root=args.repo_root, repo_bytes=args.repo_bytes)
+    run_once(args.prompt, force_action_mode=args.force_action, max_tool_rounds=args.max_tool_rounds, repo_root=args.repo_root, repo_bytes=args.repo_bytes, backend=backend)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,480 @@
+#!/usr/bin/env python3
+import os
+import json
+import time
+import uuid
+import argparse
+import threading
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from backends import GeminiBackend, RateLimitedBackend, CassetteBackend
+from telemetry import telemetry
+from config import (GATE_SERVICE_PORT, GATE_SERVICE_WORKERS, GATE_SERVICE_QUEUE_SIZE, GATE_TENANT_MAX_QUEUED,
+                    GATE_TENANT_CONCURRENCY, GATE_TENANT_RPM, GATE_SERVICE_KEEP_JOBS, GATE_SERVICE_RETRY_AFTER,
+                    VERDICT_CACHE_PATH, CASSETTE_PATH, CASSETTE_MODE, MAX_PARALLEL_ACTIONS)
+
+
+class QueueFull(Exception):
+    def __init__(self, message: str, retry_after: int = GATE_SERVICE_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _plain(value):
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_plain(v) for v in value]
+    if isinstance(value, dict):
+        return {k: _plain(v) for k, v in value.items()}
+    return value
+
+
+def encode_event(event: Dict[str, Any]) -> str:
+    """
+    One NDJSON line for an evaluate_prompt_events event.
+    """
+    return json.dumps(_plain(event), default=str)
+
+
+@dataclass
+class Job:
+    '''
+    One evaluate_prompt session. Its events are kept as NDJSON lines so any
+    number of clients can follow it, from the start or from where they left
+    off, and a client going away does not stop the session.
+    '''
+    id: str
+    tenant: str
+    goal: str
+    repo_root: str
+    max_turns: Optional[int] = None
+    status: str = "queued"  # queued | running | done | error
+    position: int = 0  # jobs ahead of it when queued
+    submitted: float = field(default_factory=time.time)
+    started: Optional[float] = None
+    finished: Optional[float] = None
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    events: List[str] = field(default_factory=list, repr=False)
+    cond: threading.Condition = field(default_factory=threading.Condition, repr=False)
+
+    def emit(self, line: str) -> None:
+        with self.cond:
+            self.events.append(line)
+            self.cond.notify_all()
+
+    def finish(self, status: str, result=None, error=None) -> None:
+        with self.cond:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished = time.time()
+            self.cond.notify_all()
+
+    def follow(self, start: int = 0):
+        """
+        Yield event lines from index `start` as they arrive, until the job
+        is finished.
+        """
+        i = start
+        while True:
+            with self.cond:
+                while i >= len(self.events) and self.finished is None:
+                    self.cond.wait()
+                batch = self.events[i:]
+                finished = self.finished is not None
+            yield from batch
+            i += len(batch)
+            if finished:
+                return
+
+    def to_dict(self) -> dict:
+        return {"id": self.id, "tenant": self.tenant, "goal": self.goal, "status": self.status,
+                "submitted": self.submitted, "started": self.started, "finished": self.finished,
+                "events": len(self.events), "result": self.result, "error": self.error}
+
+
+class Scheduler:
+    '''
+    Bounded job queue shared by all tenants.
+
+    Each tenant has its own FIFO; `get` serves the tenants round-robin, so
+    a tenant with a long backlog cannot starve the others. A tenant is
+    skipped while it has `tenant_concurrency` sessions running, and a job
+    waits while another session is working in the same repo. `put` raises
+    QueueFull once `max_queued` jobs (or `tenant_max_queued` for the
+    tenant) are waiting; that is the service's backpressure.
+    '''
+    def __init__(self, max_queued: int = GATE_SERVICE_QUEUE_SIZE, tenant_max_queued: int = GATE_TENANT_MAX_QUEUED,
+                 tenant_concurrency: int = GATE_TENANT_CONCURRENCY):
+        self.max_queued = max_queued
+        self.tenant_max_queued = tenant_max_queued
+        self.tenant_concurrency = tenant_concurrency
+        self.queues: "OrderedDict[str, deque]" = OrderedDict()  # tenant -> jobs, in round-robin order
+        self.running = Counter()  # tenant -> running jobs
+        self.busy_repos = set()
+        self.size = 0
+        self.closed = False
+        self.cond = threading.Condition()
+
+    def put(self, job: Job) -> int:
+        """
+        Queue a job and return how many jobs are ahead of it.
+        """
+        with self.cond:
+            if self.closed:
+                raise QueueFull("service is shutting down")
+            if self.size >= self.max_queued:
+                raise QueueFull(f"queue is full ({self.max_queued} sessions waiting)")
+            q = self.queues.setdefault(job.tenant, deque())
+            if len(q) >= self.tenant_max_queued:
+                raise QueueFull(f"tenant {job.tenant!r} has {len(q)} sessions waiting")
+            q.append(job)
+            self.size += 1
+            self.cond.notify_all()
+            return self.size - 1
+
+    def _pick(self) -> Optional[Job]:
+        for tenant, q in self.queues.items():
+            if self.running[tenant] >= self.tenant_concurrency or q[0].repo_root in self.busy_repos:
+                continue
+            job = q.popleft()
+            if q:
+                self.queues.move_to_end(tenant)
+            else:
+                del self.queues[tenant]
+            self.size -= 1
+            self.running[tenant] += 1
+            self.busy_repos.add(job.repo_root)
+            return job
+        return None
+
+    def get(self) -> Optional[Job]:
+        """
+        Block until a job may run; None once the scheduler is closed.
+        """
+        with self.cond:
+            while not self.closed:
+                job = self._pick()
+                if job is not None:
+                    return job
+                self.cond.wait()
+            return None
+
+    def done(self, job: Job) -> None:
+        with self.cond:
+            self.running[job.tenant] -= 1
+            if not self.running[job.tenant]:
+                del self.running[job.tenant]
+            self.busy_repos.discard(job.repo_root)
+            self.cond.notify_all()
+
+    def close(self) -> None:
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.cond:
+            return {"queued": self.size, "max_queued": self.max_queued,
+                    "queued_by_tenant": {t: len(q) for t, q in self.queues.items()},
+                    "running_by_tenant": dict(self.running)}
+
+
+class GateService:
+    '''
+    Runs evaluate_prompt sessions for many clients in one process.
+
+    Sessions are queued in a Scheduler and run by `workers` threads. All of
+    them share one model backend (and so one client and connection pool) and
+    one verdict cache; each tenant's model calls go through its own
+    RateLimitedBackend of `tenant_rpm` requests per minute. Each worker
+    runs the model calls and actions of its session on a pool of its own
+    (`session_threads` threads), so a busy or rate-limited tenant cannot
+    hold up another tenant's turns. Sessions run in `repo_root`, or in a
+    directory below it named by the request.
+    '''
+    def __init__(self, repo_root: str = ".", backend=None, cache=None, workers: int = GATE_SERVICE_WORKERS,
+                 scheduler: Scheduler = None, tenant_rpm: float = GATE_TENANT_RPM,
+                 keep_jobs: int = GATE_SERVICE_KEEP_JOBS, session_threads: int = MAX_PARALLEL_ACTIONS):
+        self.repo_root = os.path.realpath(repo_root)
+        self.backend = backend or GeminiBackend()
+        self.cache = cache
+        self.scheduler = scheduler or Scheduler()
+        self.tenant_rpm = tenant_rpm
+        self.keep_jobs = keep_jobs
+        self.session_threads = session_threads
+        self.jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self.limiters: Dict[str, RateLimitedBackend] = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self.threads = [threading.Thread(target=self._work, daemon=True, name=f"gate-worker-{i}")
+                        for i in range(workers)]
+        for t in self.threads:
+            t.start()
+
+    def resolve_repo(self, repo: Optional[str]) -> str:
+        if not repo:
+            return self.repo_root
+        # resolved, so a symlink below repo_root cannot lead out of it
+        path = os.path.realpath(os.path.join(self.repo_root, repo))
+        if os.path.commonpath([path, self.repo_root]) != self.repo_root:
+            raise ValueError(f"repo must be inside {self.repo_root}")
+        if not os.path.isdir(path):
+            raise ValueError(f"repo {repo!r} does not exist")
+        return path
+
+    def submit(self, goal: str, tenant: str = "default", repo: str = None, max_turns: int = None) -> Job:
+        """
+        Queue a session. Raises ValueError for a bad request and QueueFull
+        when the queue has no room.
+        """
+        if not goal or not isinstance(goal, str):
+            raise ValueError("goal must be a non-empty string")
+        if not tenant or not isinstance(tenant, str):
+            raise ValueError("tenant must be a non-empty string")
+        if repo is not None and not isinstance(repo, str):
+            raise ValueError("repo must be a string")
+        if max_turns is not None and (not isinstance(max_turns, int) or isinstance(max_turns, bool) or max_turns < 1):
+            raise ValueError("max_turns must be a positive integer")
+        job = Job(id=uuid.uuid4().hex[:12], tenant=tenant, goal=goal, repo_root=self.resolve_repo(repo),
+                  max_turns=max_turns)
+        try:
+            job.position = self.scheduler.put(job)
+        except QueueFull:
+            telemetry.count("gate_sessions_total", outcome="rejected")
+            raise
+        telemetry.count("gate_sessions_total", outcome="accepted")
+        with self._lock:
+            self.jobs[job.id] = job
+            self._evict()
+        return job
+
+    def _evict(self) -> None:
+        finished = [j.id for j in self.jobs.values() if j.finished is not None]
+        for job_id in finished[:max(0, len(self.jobs) - self.keep_jobs)]:
+            del self.jobs[job_id]
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def backend_for(self, tenant: str):
+        with self._lock:
+            limiter = self.limiters.get(tenant)
+            if limiter is None:
+                limiter = self.limiters[tenant] = RateLimitedBackend(self.backend, self.tenant_rpm)
+            return limiter
+
+    def _work(self) -> None:
+        with ThreadPoolExecutor(max_workers=self.session_threads,
+                                thread_name_prefix=threading.current_thread().name) as executor:
+            while True:
+                job = self.scheduler.get()
+                if job is None:
+                    return
+                try:
+                    self._run(job, executor)
+                finally:
+                    self.scheduler.done(job)
+
+    def _run(self, job: Job, executor=None) -> None:
+        from main_loop import evaluate_prompt_events
+
+        job.status = "running"
+        job.started = time.time()
+        telemetry.observe("gate_queue_wait_seconds", job.started - job.submitted)
+        result = None
+        try:
+            with telemetry.span("gate_session", job=job.id, tenant=job.tenant):
+                for event in evaluate_prompt_events(job.goal, repo_root=job.repo_root, max_turns=job.max_turns,
+                                                    backend=self.backend_for(job.tenant), cache=self.cache,
+                                                    executor=executor):
+                    job.emit(encode_event(event))
+                    if event["type"] == "done":
+                        result = {"reason": event["reason"], "stop": event["stop"], "checkpoint": event["checkpoint"]}
+        except Exception as e:
+            job.emit(json.dumps({"agent": "service", "type": "error", "error": f"{type(e).__name__}: {e}"}))
+            job.finish("error", error=f"{type(e).__name__}: {e}")
+            telemetry.count("gate_sessions_total", outcome="error")
+            return
+        job.finish("done", result=result)
+        telemetry.count("gate_sessions_total", outcome="done")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            status = Counter(j.status for j in self.jobs.values())
+        stats = self.scheduler.stats()
+        stats.update({"workers": len(self.threads), "jobs": dict(status),
+                      "rate_limit_wait_s": {t: round(b.waited_s, 3) for t, b in self.limiters.items()}})
+        if self.cache is not None:
+            stats["verdict_cache"] = self.cache.stats()
+        return stats
+
+    def serve(self, port: int = GATE_SERVICE_PORT, host: str = "127.0.0.1"):
+        """
+        Serve the HTTP API from a daemon thread:
+
+          POST /sessions             {"goal", "tenant"?, "repo"?, "max_turns"?, "stream"?}
+                                     -> 202 {"id", "position"}, or the event stream with "stream": true;
+                                        429 with Retry-After when the queue is full
+          GET  /sessions/<id>        -> job status and result
+          GET  /sessions/<id>/events -> NDJSON event stream (?from=n to resume)
+          GET  /health               -> queue and worker stats
+          GET  /metrics              -> Prometheus metrics
+
+        The tenant may also be given in an X-Tenant header.
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        from urllib.parse import urlparse, parse_qs
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _json(self, code, body, headers=()):
+                data = json.dumps(body, default=str).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in headers:
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, job, start=0):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.send_header("X-Session-Id", job.id)
+                self.end_headers()
+                try:
+                    for line in job.follow(start):
+                        self.wfile.write(line.encode("utf-8") + b"\n")
+                        self.wfile.flush()
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # the session keeps running; the client can resume with ?from=n
+
+            def do_POST(self):
+                if urlparse(self.path).path != "/sessions":
+                    self.send_error(404)
+                    return
+                try:
+                    body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                    if not isinstance(body, dict):
+                        raise ValueError("body must be a JSON object")
+                    if not isinstance(body.get("stream", False), bool):
+                        raise ValueError("stream must be true or false")
+                    job = service.submit(body.get("goal", ""), tenant=body.get("tenant") or self.headers.get(
+                        "X-Tenant", "default"), repo=body.get("repo"), max_turns=body.get("max_turns"))
+                except ValueError as e:
+                    self._json(400, {"error": str(e)})
+                    return
+                except QueueFull as e:
+                    self._json(429, {"error": str(e)}, [("Retry-After", str(e.retry_after))])
+                    return
+                if body.get("stream"):
+                    self._stream(job)
+                else:
+                    self._json(202, {"id": job.id, "status": job.status, "position": job.position},
+                               [("Location", f"/sessions/{job.id}")])
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                parts = url.path.strip("/").split("/")
+                if url.path == "/health":
+                    self._json(200, service.stats())
+                elif url.path == "/metrics":
+                    data = telemetry.render_prometheus().encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/plain; version=0.0.4")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                elif parts[0] == "sessions" and len(parts) in (2, 3):
+                    job = service.get(parts[1])
+                    if job is None:
+                        self._json(404, {"error": "unknown session"})
+                    elif len(parts) == 2:
+                        self._json(200, job.to_dict())
+                    elif parts[2] == "events":
+                        try:
+                            start = int(parse_qs(url.query, keep_blank_values=True).get("from", ["0"])[0])
+                            if start < 0:
+                                raise ValueError
+                        except ValueError:
+                            self._json(400, {"error": "from must be a non-negative integer"})
+                            return
+                        self._stream(job, start)
+                    else:
+                        self.send_error(404)
+                else:
+                    self.send_error(404)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="gate-http").start()
+        return self._server
+
+    def close(self) -> None:
+        self.scheduler.close()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+        for t in self.threads:
+            t.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve evaluate_prompt sessions over HTTP to many clients.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=GATE_SERVICE_PORT)
+    parser.add_argument("--repo-root", default=".", help="Sessions run here or in a directory below it.")
+    parser.add_argument("--workers", type=int, default=GATE_SERVICE_WORKERS, help="Sessions run at once.")
+    parser.add_argument("--queue-size", type=int, default=GATE_SERVICE_QUEUE_SIZE,
+                        help="Queued sessions before new ones are refused with 429.")
+    parser.add_argument("--tenant-queue-size", type=int, default=GATE_TENANT_MAX_QUEUED)
+    parser.add_argument("--tenant-concurrency", type=int, default=GATE_TENANT_CONCURRENCY,
+                        help="Running sessions per tenant.")
+    parser.add_argument("--tenant-rpm", type=float, default=GATE_TENANT_RPM, help="Model requests per minute per tenant.")
+    parser.add_argument("--verdict-cache", default=VERDICT_CACHE_PATH, help="SQLite verdict cache shared by all sessions.")
+    parser.add_argument("--no-verdict-cache", action="store_true", help="Evaluate every action with the model.")
+    parser.add_argument("--cassette", default=CASSETTE_PATH,
+                        help="Record model calls to / replay them from this JSONL cassette (or set AGENT_EVAL_CASSETTE).")
+    parser.add_argument("--cassette-mode", choices=CassetteBackend.MODES, default=CASSETTE_MODE,
+                        help="record, replay (offline, fail on unknown requests) or auto (default).")
+    args = parser.parse_args()
+
+    from llm_client import load_env
+    from verdict_cache import VerdictCache
+
+    backend = GeminiBackend()
+    if args.cassette:
+        backend = CassetteBackend(backend, args.cassette, args.cassette_mode)
+    load_env()
+    if not os.getenv("GOOGLE_GENAI_API_KEY") and not (args.cassette and args.cassette_mode == "replay"):
+        raise SystemExit("Missing GOOGLE_GENAI_API_KEY environment variable.")
+
+    cache = None if args.no_verdict_cache else VerdictCache(args.verdict_cache)
+    scheduler = Scheduler(args.queue_size, args.tenant_queue_size, args.tenant_concurrency)
+    service = GateService(args.repo_root, backend=backend, cache=cache, workers=args.workers, scheduler=scheduler,
+                          tenant_rpm=args.tenant_rpm)
+    service.serve(args.port, args.host)
+    print(f"[gate] serving on http://{args.host}:{args.port} with {args.workers} workers")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+        if cache is not None:
+            cache.close()
+
+
+if __name__ == "__main__":
+    main()
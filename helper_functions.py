@@ -1,7 +1,4 @@
-from google.genai import types
-
-
-def print_model_text(response: types.GenerateContentResponse) -> None:
+def print_model_text(response: "types.GenerateContentResponse") -> None:
     """
     Print the model's natural language output, if any.
     """
@@ -21,7 +18,6 @@ def print_model_text(response: types.GenerateContentResponse) -> None:
             pass
         if chunks:
             print("\n".join(chunks).strip())
-    res = []
     try:
         if response.function_calls:
             for i, fc in enumerate(response.function_calls, 1):
@@ -29,11 +25,41 @@ def print_model_text(response: types.GenerateContentResponse) -> None:
                 print("args:")
                 try:
                     import json as _json
-                    res.append(_json.dumps(fc.args, indent=2, sort_keys=True))
                     print(_json.dumps(fc.args, indent=2, sort_keys=True))
                 except Exception:
                     print(str(fc.args))
     except Exception:
        pass
 
-    return res
\ No newline at end of file
+
+def function_calls(response, name: str = None):
+    """
+    The args of every function call in the response (optionally only calls
+    to `name`), taken straight from the SDK objects without re-serializing.
+    """
+    try:
+        calls = response.function_calls or []
+    except Exception:
+        return []
+    return [fc.args or {} for fc in calls if name is None or fc.name == name]
+
+
+def stream_deltas(chunk):
+    """
+    Split one streamed response chunk into (text, function_calls).
+    Reads the parts directly, since .text on a chunk that also carries
+    function calls only returns the text parts with a warning.
+    """
+    texts = []
+    calls = []
+    try:
+        parts = chunk.candidates[0].content.parts or []
+    except Exception:
+        parts = []
+    for p in parts:
+        if getattr(p, "text", None):
+            texts.append(p.text)
+        fc = getattr(p, "function_call", None)
+        if fc is not None:
+            calls.append(fc)
+    return "".join(texts), calls
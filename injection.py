@@ -0,0 +1,529 @@
+#!/usr/bin/env python3
+import os
+import re
+import argparse
+import functools
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from config import INJECTION_SIGNATURES, INJECTION_SIGNATURES_PATH, INJECTION_PATTERNS, INJECTION_ACTION
+
+TAG_OPEN = "<<possible prompt injection: "
+TAG_CLOSE = ">>"
+REDACTED = "[redacted: possible prompt injection]"
+
+
+# a pattern that can match more than this many characters is not anchored
+MAX_PATTERN_WIDTH = 4096
+# how far to look around an anchor for the rest of a phrase before giving up
+# on anchors and running the full regex
+MAX_PHRASE_REACH = 4096
+
+_OR = object()  # a "|" between alternatives in _tokens
+
+
+def _class_end(pattern: str, i: int) -> int:
+    """
+    Offset just past the character set that starts at pattern[i] ("[").
+    """
+    j = i + 1
+    if pattern[j:j + 1] == "^":
+        j += 1
+    if pattern[j:j + 1] == "]":
+        j += 1
+    while j < len(pattern) and pattern[j] != "]":
+        j += 2 if pattern[j] == "\\" else 1
+    if j >= len(pattern):
+        raise ValueError(pattern)
+    return j + 1
+
+
+def _group_end(pattern: str, i: int) -> int:
+    """
+    Offset just past the group that starts at pattern[i] ("(").
+    """
+    depth = 0
+    j = i
+    while j < len(pattern):
+        c = pattern[j]
+        if c == "\\":
+            j += 2
+            continue
+        if c == "[":
+            j = _class_end(pattern, j)
+            continue
+        depth += {"(": 1, ")": -1}.get(c, 0)
+        j += 1
+        if depth == 0:
+            return j
+    raise ValueError(pattern)
+
+
+def _tokens(pattern: str):
+    """
+    The top-level items of a regex as (char, width): char is the character
+    a plain item always matches, None for anything else, or _OR between
+    alternatives; width is the most characters the item can match.
+
+    Only a small subset of the syntax is understood: plain and escaped
+    characters, \\d \\s \\w and their negations, \\b, ".", "^", character
+    sets, plain and (?:...) groups with alternatives, and the "?" and
+    "{m}"/"{m,n}" quantifiers. ValueError for anything else (*, +, "$",
+    lookarounds, flags, named groups, backreferences...).
+    """
+    i = 0
+    while i < len(pattern):
+        c = pattern[i]
+        if c == "\\":
+            e = pattern[i + 1:i + 2]
+            if e and not e.isalnum():
+                item = (e, 1)
+            elif e and e in "dDsSwW":
+                item = (None, 1)
+            elif e and e in "bB":
+                item = (None, 0)
+            else:
+                raise ValueError(pattern)
+            i += 2
+        elif c == "[":
+            j = _class_end(pattern, i)
+            item, i = (None, 1), j
+        elif c == "(":
+            j = _group_end(pattern, i)
+            body = pattern[i + 1:j - 1]
+            if body.startswith("?:"):
+                body = body[2:]
+            elif body.startswith("?"):
+                raise ValueError(pattern)
+            item, i = (None, _width(body)), j
+        elif c == "|":
+            yield _OR, 0
+            i += 1
+            continue
+        elif c in ".^":
+            item, i = (None, 1 if c == "." else 0), i + 1
+        elif c in "$*+?{)":
+            raise ValueError(pattern)
+        else:
+            item, i = (c, 1), i + 1
+        if pattern[i:i + 1] == "?":
+            item = (None, item[1])
+            i += 1
+        elif pattern[i:i + 1] == "{":
+            m = re.match(r"\{(\d+)(?:,(\d+))?\}", pattern[i:])
+            if m is None:
+                raise ValueError(pattern)
+            item = (None, item[1] * int(m.group(2) or m.group(1)))
+            i += m.end()
+            if pattern[i:i + 1] == "?":
+                i += 1  # lazy
+        if pattern[i:i + 1] in ("*", "+"):
+            raise ValueError(pattern)
+        yield item
+
+
+def _width(pattern: str) -> int:
+    """
+    The most characters a pattern in the _tokens subset can match.
+    """
+    widths = [0]
+    for char, width in _tokens(pattern):
+        if char is _OR:
+            widths.append(0)
+        else:
+            widths[-1] += width
+    return max(widths)
+
+
+def _anchor(pattern: str) -> Optional[Tuple[str, int, int, Tuple[str, ...]]]:
+    """
+    (literal, offset, width, others) for a regex: the longest run of plain
+    characters at its top level, which every match contains; the most
+    characters a match can have before the run starts; the most it can
+    have in all; and the other top-level runs, which every match contains
+    too. None when the pattern is outside the subset _tokens understands,
+    has a top-level alternation, can be wider than MAX_PATTERN_WIDTH, or
+    has no run of 4 or more characters.
+    """
+    try:
+        items = list(_tokens(pattern))
+    except ValueError:
+        return None
+    if any(char is _OR for char, _ in items):
+        return None
+    width = sum(w for _, w in items)
+    if width > MAX_PATTERN_WIDTH:
+        return None
+    runs = []  # (literal, max chars before it)
+    run = []
+    before = 0  # max width of the items ahead of the current run
+    for char, w in items + [(None, 0)]:
+        if char is not None:
+            run.append(char)
+            continue
+        if run:
+            runs.append(("".join(run).lower(), before))
+        before += len(run) + w
+        run = []
+    if not runs or max(len(r) for r, _ in runs) < 4:
+        return None
+    literal, offset = max(runs, key=lambda r: len(r[0]))
+    return literal, offset, width, tuple(r for r, _ in runs if r != literal)
+
+
+def _has_any(window: str, needs: List[Tuple[str, ...]]) -> bool:
+    """
+    Whether every string of one of the tuples in `needs` occurs in window.
+    """
+    for others in needs:
+        for w in others:
+            if w not in window:
+                break
+        else:
+            return True
+    return False
+
+
+def _trie(phrases: Iterable[str]) -> Dict[str, Any]:
+    root = {}
+    for phrase in phrases:
+        node = root
+        for word in phrase.lower().split():
+            node = node.setdefault(word, {})
+        node[""] = {}  # a phrase ends here
+    return root
+
+
+def _trie_pattern(node: Dict[str, Any]) -> Optional[str]:
+    """
+    Regex for the word sequences below a trie node, with shared prefixes
+    factored out so the engine never tries the same prefix twice.
+    """
+    branches = []
+    for word, child in sorted(node.items()):
+        if not word:
+            continue
+        rest = _trie_pattern(child)
+        if rest is None:
+            branches.append(re.escape(word))
+        else:
+            tail = r"\s+" + rest
+            branches.append(re.escape(word) + (f"(?:{tail})?" if "" in child else tail))
+    if not branches:
+        return None
+    return branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+
+
+class InjectionScanner:
+    '''
+    Finds prompt-injection signatures in text.
+
+    Phrases are compiled into one trie-shaped regex, a word-level stand-in
+    for an Aho-Corasick automaton that runs in the re engine. They match
+    case-insensitively with any whitespace between words, and at word
+    boundaries. The regex `patterns` are alternated into the same
+    expression, so one pass finds every signature. `add` extends the set
+    and recompiles.
+
+    The regex only runs near an anchor: for each phrase, the word it shares
+    with the most other phrases, and for each pattern, a literal every match
+    must contain. Anchors are found with str.find over the lowercased text.
+    Around each one, a window reaches as many words (for phrases) or
+    characters (for patterns) as a signature holding that anchor can span.
+    A window is dropped unless the other words (or literals) of one of
+    those signatures occur in it; the rest are merged and the full regex
+    runs over each, so the findings are exactly those of one pass over the
+    whole text.
+
+    Pattern anchors come from reading the pattern text itself, which only
+    covers a small subset of the regex syntax (see _tokens). A pattern
+    outside it, with no literal of 4 or more characters, or with unbounded
+    width makes the whole text go through the full regex. This is a pure
+    Python prefilter, not a DFA: `bench.py --only injection` measures
+    30-90 MB/s on code and prose, but text dense with signature words
+    scans barely faster than the full regex alone (about 13 MB/s).
+    '''
+    def __init__(self, phrases: Iterable[str] = INJECTION_SIGNATURES, patterns: Iterable[str] = INJECTION_PATTERNS):
+        self.phrases = tuple(dict.fromkeys(p.strip().lower() for p in phrases if p.strip()))
+        self.patterns = tuple(patterns)
+        self._compile()
+
+    @classmethod
+    def from_file(cls, path: str, phrases: Iterable[str] = INJECTION_SIGNATURES,
+                  patterns: Iterable[str] = INJECTION_PATTERNS) -> "InjectionScanner":
+        """
+        Default signatures plus the phrases in `path`, one per line (# for
+        comments).
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            extra = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+        return cls(list(phrases) + extra, patterns)
+
+    @staticmethod
+    def _regex(phrases, patterns, flags=0):
+        parts = []
+        trie = _trie_pattern(_trie(phrases))
+        if trie is not None:
+            parts.append(rf"(?P<phrase>\b{trie}\b)")
+        if patterns:
+            parts.append("(?P<pattern>" + "|".join(f"(?:{p})" for p in patterns) + ")")
+        return re.compile("|".join(parts), flags) if parts else None
+
+    def _compile(self) -> None:
+        self._re = self._regex(self.phrases, self.patterns)  # run on lowercased text
+        self._re_nocase = self._regex(self.phrases, self.patterns, re.IGNORECASE)
+        coverage = {}
+        for phrase in self.phrases:
+            for word in set(phrase.split()):
+                coverage[word] = coverage.get(word, 0) + 1
+        # phrase anchor -> [most words before it, most words after it, the other words of each phrase]
+        self.words = {}
+        for phrase in self.phrases:
+            words = phrase.split()
+            # a word shared with many phrases keeps the number of passes down
+            anchor = max([w for w in words if len(w) >= 4] or words, key=lambda w: (coverage[w], len(w)))
+            entry = self.words.setdefault(anchor, [0, 0, []])
+            for i, word in enumerate(words):
+                if word == anchor:
+                    entry[0], entry[1] = max(entry[0], i), max(entry[1], len(words) - 1 - i)
+            entry[2].append(tuple(set(words) - {anchor}))
+        # pattern anchor -> [most chars before it, most chars after its start, the other runs of each pattern]
+        self.literals = {}
+        for pattern in self.patterns:
+            found = _anchor(pattern)
+            if found is None:
+                self.literals = None
+                break
+            literal, before, width, others = found
+            entry = self.literals.setdefault(literal, [0, 0, []])
+            entry[0], entry[1] = max(entry[0], before), max(entry[1], width - before)
+            entry[2].append(others)
+        self.overlap = max([len(p) * 2 for p in self.phrases] + [256])  # carried between stream chunks
+
+    @staticmethod
+    def _back(low: str, i: int, words: int) -> Optional[int]:
+        """
+        A position at or before the start of the `words`-th word before
+        offset i, or None if it is more than MAX_PHRASE_REACH back.
+        """
+        if not words:
+            return i
+        for reach in (64, 256, MAX_PHRASE_REACH):
+            lo = max(0, i - reach)
+            parts = low[lo:i].rsplit(None, words)
+            if len(parts) > words:
+                return lo + len(parts[0])
+            if lo == 0:
+                return 0
+        return None
+
+    @staticmethod
+    def _ahead(low: str, i: int, words: int) -> Optional[int]:
+        """
+        A position at or after the end of the `words`-th word after the one
+        at offset i, or None if it is more than MAX_PHRASE_REACH ahead.
+        """
+        for reach in (64, 256, MAX_PHRASE_REACH):
+            hi = min(len(low), i + reach)
+            parts = low[i:hi].split(None, words + 1)
+            if len(parts) > words + 1:
+                return hi - len(parts[-1])
+            if hi == len(low):
+                return hi
+        return None
+
+    def _windows(self, low: str) -> Optional[List[Tuple[int, int]]]:
+        """
+        Sorted, disjoint (start, end) ranges of `low` that hold every match
+        of the full regex: around each anchor, as far as a signature that
+        contains it can reach, when the rest of one such signature's words
+        or literals occur there too. None when that cannot be bounded.
+        """
+        spans = []
+        for anchor, (back, ahead, needs) in self.words.items():
+            i = low.find(anchor)
+            while i != -1:
+                start, end = self._back(low, i, back), self._ahead(low, i, ahead)
+                if start is None or end is None:
+                    return None
+                if _has_any(low[start:end], needs):
+                    spans.append((start, end))
+                i = low.find(anchor, i + 1)
+        for literal, (before, after, needs) in self.literals.items():
+            i = low.find(literal)
+            while i != -1:
+                start, end = max(0, i - before), i + after
+                if _has_any(low[start:end], needs):
+                    spans.append((start, end))
+                i = low.find(literal, i + 1)
+        spans.sort()
+        merged = []
+        for start, end in spans:
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return merged
+
+    def _matches(self, text: str):
+        if self._re is None:
+            return []
+        low = text.lower()
+        if len(low) != len(text):
+            # lowercasing moved offsets (rare non-ASCII); match the original instead
+            return list(self._re_nocase.finditer(text))
+        windows = self._windows(low) if self.literals is not None else None
+        if windows is None:
+            return list(self._re.finditer(low))
+        # No match crosses a window edge, so scanning each window from its
+        # start finds exactly what one pass over the whole text would. The
+        # scan sees one character past `end` so that \b can look at it.
+        found = []
+        pos = 0
+        for start, end in windows:
+            start = max(start, pos)
+            matches = list(self._re.finditer(low, start, end + 1))
+            if matches and matches[-1].end() > end:
+                # cutting the text off made a \b match that the full text would not
+                matches = []
+                for m in self._re.finditer(low, start):
+                    if m.start() >= end:
+                        break
+                    matches.append(m)
+            found.extend(matches)
+            if matches:
+                pos = matches[-1].end()
+        return found
+
+    def add(self, phrases: Iterable[str] = (), patterns: Iterable[str] = ()) -> None:
+        self.phrases = tuple(dict.fromkeys(self.phrases + tuple(p.strip().lower() for p in phrases if p.strip())))
+        self.patterns = self.patterns + tuple(patterns)
+        self._compile()
+
+    def search(self, text: str) -> bool:
+        return bool(text) and bool(self._matches(text))
+
+    def scan(self, text: str) -> List[Dict[str, Any]]:
+        """
+        Every match as {"start", "end", "line", "kind", "text"}; kind is
+        "phrase" or "pattern".
+        """
+        if not text:
+            return []
+        findings = []
+        line, pos = 1, 0
+        for m in self._matches(text):
+            if findings and m.start() < findings[-1]["end"]:
+                continue  # overlaps the previous match
+            line += text.count("\n", pos, m.start())
+            pos = m.start()
+            findings.append({"start": m.start(), "end": m.end(), "line": line, "kind": m.lastgroup,
+                             "text": " ".join(text[m.start():m.end()].split())})
+        return findings
+
+    def scan_chunks(self, chunks: Iterable[str]):
+        """
+        Streaming scan over consecutive pieces of one text. Yields findings
+        with offsets into the whole text; matches that straddle a chunk
+        boundary are found through `overlap` characters carried over.
+        """
+        carried = ""
+        offset = 0  # of `carried` in the whole text
+        for chunk in chunks:
+            buf = carried + chunk
+            for f in self.scan(buf):
+                if f["end"] > len(carried):
+                    yield dict(f, start=f["start"] + offset, end=f["end"] + offset, line=None)
+            keep = min(len(buf), self.overlap)
+            offset += len(buf) - keep
+            carried = buf[len(buf) - keep:]
+
+    def apply(self, text: str, mode: str = INJECTION_ACTION) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Returns (text, findings) with each match wrapped in a tag ("tag") or
+        replaced ("redact"); "off" returns the text unchanged.
+        """
+        if mode == "off":
+            return text, []
+        findings = self.scan(text)
+        if not findings:
+            return text, findings
+        out = []
+        pos = 0
+        for f in findings:
+            out.append(text[pos:f["start"]])
+            out.append(REDACTED if mode == "redact" else TAG_OPEN + text[f["start"]:f["end"]] + TAG_CLOSE)
+            pos = f["end"]
+        out.append(text[pos:])
+        return "".join(out), findings
+
+
+@functools.lru_cache(maxsize=1)
+def get_scanner() -> InjectionScanner:
+    """
+    The process-wide scanner: INJECTION_SIGNATURES and INJECTION_PATTERNS
+    plus the phrases in INJECTION_SIGNATURES_PATH, if set.
+    """
+    if INJECTION_SIGNATURES_PATH:
+        return InjectionScanner.from_file(INJECTION_SIGNATURES_PATH)
+    return InjectionScanner()
+
+
+def guard_text(text: Optional[str], mode: str = INJECTION_ACTION) -> Optional[str]:
+    """
+    Tag or redact suspicious spans in text bound for a model prompt.
+    """
+    if not text or mode == "off":
+        return text
+    return get_scanner().apply(text, mode)[0]
+
+
+def guard_read(result: Dict[str, Any], mode: str = INJECTION_ACTION) -> Dict[str, Any]:
+    """
+    Tag or redact suspicious spans in an OPEN_FILE result's content (grep
+    hits included) and list them under "injection" for the gate.
+    """
+    if mode == "off" or not result.get("ok"):
+        return result
+    scanner = get_scanner()
+    flags = []
+    if isinstance(result.get("content"), str):
+        result["content"], found = scanner.apply(result["content"], mode)
+        flags.extend({"line": f["line"], "kind": f["kind"], "text": f["text"]} for f in found)
+    if flags:
+        result["injection"] = flags
+    return result
+
+
+def scan_file(path: str, chunk_bytes: int = 1 << 20, scanner: InjectionScanner = None):
+    scanner = scanner or get_scanner()
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        yield from scanner.scan_chunks(iter(lambda: f.read(chunk_bytes), ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scan files for prompt-injection signatures.")
+    parser.add_argument("paths", nargs="*", default=["."], help="Files or directories (default: the current one).")
+    args = parser.parse_args()
+
+    from snapshot import RepoSnapshot
+
+    hits = 0
+    for path in args.paths:
+        if os.path.isdir(path):
+            files = [os.path.join(path, rel) for rel, _, _ in RepoSnapshot(path).entries()]
+        else:
+            files = [path]
+        for file in files:
+            try:
+                findings = list(scan_file(file))
+            except OSError as e:
+                print(f"{file}: {e}")
+                continue
+            for f in findings:
+                hits += 1
+                print(f"{file}:{f['start']}: [{f['kind']}] {f['text']}")
+    raise SystemExit(1 if hits else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import os
+import threading
+
+# google.genai and dotenv take most of the startup time, so they are only
+# imported once a model is actually called.
+
+_clients = {}
+_lock = threading.Lock()
+_env_loaded = False
+
+
+def load_env() -> None:
+    """
+    Load .env into os.environ, once.
+    """
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def get_client(api_key: str = None) -> "genai.Client":
+    """
+    Return the process-wide genai.Client for `api_key`.
+
+    Every agent shares the same client, so the sync (`client.models`) and async
+    (`client.aio.models`) paths reuse one HTTP connection pool instead of each
+    ActionAgent/EvalAgent opening its own.
+    """
+    if api_key is None:
+        load_env()
+        api_key = os.environ["GOOGLE_GENAI_API_KEY"]
+    client = _clients.get(api_key)
+    if client is None:
+        with _lock:
+            client = _clients.get(api_key)
+            if client is None:
+                import google.genai as genai
+                client = _clients[api_key] = genai.Client(api_key=api_key)
+    return client
+
+
+def generate(model, contents, config, api_key: str = None):
+    return get_client(api_key).models.generate_content(model=model, contents=contents, config=config)
+
+
+async def agenerate(model, contents, config, api_key: str = None):
+    return await get_client(api_key).aio.models.generate_content(model=model, contents=contents, config=config)
+
+
+def generate_stream(model, contents, config, api_key: str = None):
+    return get_client(api_key).models.generate_content_stream(model=model, contents=contents, config=config)
+
+
+def create_cache(model, contents, tools, tool_config, ttl: float, api_key: str = None) -> str:
+    from google.genai import types
+    cache = get_client(api_key).caches.create(
+        model=model,
+        config=types.CreateCachedContentConfig(
+            contents=contents,
+            tools=tools,
+            tool_config=tool_config,
+            ttl=f"{int(ttl)}s",
+        ),
+    )
+    return cache.name
+
+
+def delete_cache(name: str, api_key: str = None) -> None:
+    get_client(api_key).caches.delete(name=name)
@@ -1,50 +1,368 @@
 from models import ActionAgent, EvalAgent
 from actions import Action
+from policy import PolicyEngine
+from backends import GeminiBackend, TracedBackend, CassetteBackend, RateLimitedBackend, find_backend
+from context_cache import ContextCacheManager
+from memory import SessionMemory, compact_result, estimate_tokens
+from checkpoints import CheckpointStore
+from retrieval import RetrievalIndex
+from routing import Router
+from telemetry import telemetry
+from speculation import Speculation
+from session import SessionController
+from config import MAX_PARALLEL_ACTIONS, CONTEXT_CACHE_ENABLED, CHECKPOINTS_ENABLED, CASSETTE_PATH, CASSETTE_MODE
+from config import SPECULATIVE_EXECUTION, SESSION_MAX_TURNS, RETRIEVAL_ENABLED, ROUTING_ENABLED
 # from config import CHECK_STR
-import ast
-
-def evaluate_prompt(prompt):
-    action_agent = ActionAgent()
-    state = action_agent.summarize_repo()
-    eval_agent = EvalAgent(goal=prompt)
-    eval_agent.current_state = state
-
-    while True:
-        res = ast.literal_eval(action_agent.prompt(user_prompt=prompt)[0]) # TODO - do multiple actions
-        print(res)
-        yield res
-        res_eval = ast.literal_eval(eval_agent.prompt(prompt=res)[0])
-        print(res_eval)
-        yield res_eval
-        if res_eval['decision'] == "decline":
-            prompt+=f"Action: {res["action_type"]} was declined because: {res_eval['rationale']}. Please try again."
-        elif res_eval['decision'] == "approve" and res["action_type"]== "COMPLETED":
-            print("Task completed successfully.")
-            break
-        elif res_eval['decision'] == "approve":
-            print("GOING TO EXECUTE ACTION")
-            action_result = action_agent.execute_action(action=Action[res['action_type']],target=res['target'],payload=res['contents_or_diff'])
-            prompt+=f"Action: {res['action_type']} was accepted and completed by the agent. Action result was: {action_result}"
-
-        new_state = action_agent.summarize_repo()
-        eval_agent.current_state = new_state
-
-
-    '''
-    get response from action
-
-    evaluate with eval
-
-    if good: action_agent.execute()
-    
-    prompt = ''
-    agent = ActionAgent()
-    state = agent.summarize_repo()
-    eval_agent = EvalAgent(goal=prompt)
-    eval_agent.current_state = state
-    res = agent.prompt('read the files')
-    print(res)
-
-    res_eval = eval_agent.prompt(prompt=res)
-    print(res_eval)
-    '''     
\ No newline at end of file
+import queue
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+# shared by every session for evaluating and executing actions within a turn
+_executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_ACTIONS, thread_name_prefix="gate")
+
+def make_agents(prompt, repo_root='.', backend=None, cache=None):
+    """
+    Agents for one session, sharing a backend and, when enabled, a context
+    cache for their stable prompt prefixes. The caller closes the cache.
+    With checkpoints enabled, the action agent records pre-images of the
+    files it changes so turns can be rolled back, and with retrieval enabled
+    it keeps a search index of the repo for the goal. With routing enabled,
+    evaluations cascade from a cheap model to a stronger one. Model calls are traced
+    when telemetry is enabled, and recorded to or replayed from
+    CASSETTE_PATH when it is set and the backend is not a cassette already.
+    """
+    backend = backend or GeminiBackend()
+    if CASSETTE_PATH and find_backend(backend, CassetteBackend) is None:
+        backend = CassetteBackend(backend, CASSETTE_PATH, CASSETTE_MODE)
+    if telemetry.enabled:
+        backend = TracedBackend(backend, telemetry)
+    context_cache = ContextCacheManager(backend) if CONTEXT_CACHE_ENABLED else None
+    checkpoints = CheckpointStore(repo_root) if CHECKPOINTS_ENABLED else None
+    index = RetrievalIndex(repo_root) if RETRIEVAL_ENABLED else None
+    action_agent = ActionAgent(repo_root=repo_root, backend=backend, context_cache=context_cache,
+                               checkpoints=checkpoints, goal=prompt, index=index)
+    router = Router.default(repo_root) if ROUTING_ENABLED else None
+    eval_agent = EvalAgent(goal=prompt, backend=backend, policy=PolicyEngine(repo_root=repo_root), cache=cache,
+                           context_cache=context_cache, router=router)
+    return action_agent, eval_agent, context_cache
+
+
+def evaluate_prompt(prompt, repo_root='.', max_turns=None, backend=None, cache=None, speculative=None,
+                    controller=None, executor=None):
+    """
+    Yields ProposedAction and EvalVerdict objects alternately for every
+    proposed action.
+    """
+    for event in evaluate_prompt_events(prompt, repo_root=repo_root, max_turns=max_turns, backend=backend, cache=cache,
+                                        speculative=speculative, controller=controller, executor=executor):
+        if event["type"] == "turn":
+            for res, res_eval in zip(event["actions"], event["verdicts"]):
+                yield res
+                yield res_eval
+
+
+def evaluate_prompt_events(prompt, repo_root='.', max_turns=None, backend=None, cache=None, speculative=None,
+                           controller=None, executor=None):
+    """
+    Event stream for a session. Model output is streamed as it arrives:
+
+      {"agent": "action", "type": "text", "text": ...}
+      {"agent": "action", "type": "function_call", "name": ..., "args": {...}}
+      {"agent": "eval", "type": "text", "index": i, "text": ...}
+      {"agent": "eval", "type": "function_call", "index": i, "name": ..., "args": {...}}
+      {"agent": "eval", "type": "verdict", "index": i, "action": ProposedAction, "verdict": EvalVerdict}
+      {"agent": "loop", "type": "turn", "actions": [ProposedAction], "verdicts": [EvalVerdict], "results": [...],
+       "prompt_tokens": n, "checkpoint": id}
+      {"agent": "loop", "type": "done", "reason": "completed" | "max_turns" | ..., "stop": {...}, "checkpoint": id,
+       "routes": Router.stats() or None}
+
+    `index` ties eval events to the i-th action of the turn, since the
+    actions of a turn are evaluated concurrently. `checkpoint` is the
+    CheckpointStore id to roll back to in order to undo the turn (or, on the
+    done event, the whole session); None when checkpoints are disabled.
+
+    The session ends when the goal is completed or a SessionController
+    budget or stall check trips; `stop` on the done event says which (see
+    StopReason). `max_turns` defaults to SESSION_MAX_TURNS; a `controller`
+    replaces the default budgets altogether.
+
+    With `speculative` (default SPECULATIVE_EXECUTION), actions run in an
+    overlay while they are evaluated and are committed or discarded once
+    the verdicts are in.
+
+    Model calls and actions run on `executor`, by default a pool shared by
+    every session in the process. When the backend is rate limited, the
+    session thread waits for the turn's model calls before handing them to
+    the pool.
+    """
+    if speculative is None:
+        speculative = SPECULATIVE_EXECUTION
+    executor = executor or _executor
+    limiter = find_backend(backend, RateLimitedBackend)
+    pace = limiter.wait_for if limiter is not None else None
+    with telemetry.span("session", repo_root=repo_root) as session:
+        action_agent, eval_agent, context_cache = make_agents(prompt, repo_root, backend, cache)
+        with telemetry.span("summarize_repo"):
+            eval_agent.current_state = action_agent.summarize_repo()
+        memory = SessionMemory(prompt)
+        controller = controller or make_controller(max_turns)
+        first_checkpoint = None
+        try:
+            while True:
+                user_prompt = memory.render(prefix_tokens(action_agent))
+                stop = controller.start_turn(memory.sizes[-1])
+                if stop:
+                    break
+                turns = session["turns"] = controller.turns
+                with telemetry.span("turn", turn=turns):
+                    with telemetry.span("action") as attrs:
+                        attrs["prompt_tokens"] = memory.sizes[-1]
+                        actions = (yield from _pump([(action_agent.stream_prompt, (user_prompt,))], executor=executor,
+                                                    pace=pace))[0]
+                    if not actions:
+                        memory.add(NO_ACTION_FEEDBACK)
+                        stop = review_turn(controller, memory, [], [])
+                        if stop:
+                            break
+                        continue
+                    spec = Speculation(action_agent, actions, executor) if speculative else None
+                    # every proposed action is evaluated concurrently
+                    with telemetry.span("eval", actions=len(actions)):
+                        verdicts = yield from _pump([(eval_agent.decide, (res,)) for res in actions],
+                                                    verdict_events=actions, executor=executor, pace=pace)
+                    telemetry.record_verdicts(actions, verdicts)
+                    checkpoint = begin_checkpoint(action_agent, turns)
+                    first_checkpoint = first_checkpoint or checkpoint
+                    with telemetry.span("execute", speculative=speculative):
+                        results = (spec.finish(verdicts) if spec
+                                   else execute_approved(action_agent, actions, verdicts, executor))
+                    eval_agent.note_injections(results)
+                    yield {"agent": "loop", "type": "turn", "actions": actions, "verdicts": verdicts,
+                           "results": results, "prompt_tokens": memory.sizes[-1], "checkpoint": checkpoint}
+                    if remember_turn(memory, actions, verdicts, results):
+                        stop = controller.stop("completed")
+                        break
+                    stop = review_turn(controller, memory, actions, verdicts)
+                    if stop:
+                        break
+
+                    with telemetry.span("summarize_repo"):
+                        eval_agent.current_state = action_agent.summarize_repo()
+            session["reason"] = stop.reason
+            yield {"agent": "loop", "type": "done", "reason": stop.reason, "stop": stop.to_dict(),
+                   "checkpoint": first_checkpoint,
+                   "routes": eval_agent.router.stats() if eval_agent.router is not None else None}
+        finally:
+            if context_cache is not None:
+                context_cache.close()
+            if action_agent.index is not None:
+                action_agent.index.close()
+
+
+def _pump(calls, verdict_events=None, executor=None, pace=None):
+    """
+    Run each fn(*args, emit) on `executor` (the shared pool by default) and
+    yield the events they emit while they run. Returns their results in
+    order. With `verdict_events`, a verdict event is also yielded as each
+    call finishes. `pace(n)` is called first, on this thread, to wait for
+    the rate limit.
+    """
+    executor = executor or _executor
+    if pace is not None:
+        pace(len(calls))
+    events = queue.Queue()
+    for i, (fn, args) in enumerate(calls):
+        def run(i=i, fn=fn, args=args):
+            try:
+                result = fn(*args, lambda e: events.put(dict(e, index=i) if verdict_events else e))
+            except BaseException as exc:
+                events.put((i, exc))
+                return
+            events.put((i, result))
+        # carry the current span over to the worker thread
+        executor.submit(contextvars.copy_context().run, run)
+
+    results = [None] * len(calls)
+    pending = len(calls)
+    while pending:
+        event = events.get()
+        if isinstance(event, tuple):
+            i, result = event
+            if isinstance(result, BaseException):
+                raise result
+            results[i] = result
+            pending -= 1
+            if verdict_events:
+                yield {"agent": "eval", "type": "verdict", "index": i, "action": verdict_events[i], "verdict": result}
+        else:
+            yield event
+    return results
+
+
+
+async def aevaluate_prompt(prompt, repo_root='.', max_turns=None, backend=None, cache=None, speculative=None,
+                           controller=None):
+    """
+    asyncio version of evaluate_prompt. Model calls go through the shared
+    async client, and file/repo work runs in a worker thread, so many
+    sessions can share one event loop without blocking each other.
+    """
+    import asyncio
+
+    if speculative is None:
+        speculative = SPECULATIVE_EXECUTION
+    with telemetry.span("session", repo_root=repo_root, mode="async") as session:
+        action_agent, eval_agent, context_cache = make_agents(prompt, repo_root, backend, cache)
+        with telemetry.span("summarize_repo"):
+            eval_agent.current_state = await asyncio.to_thread(action_agent.summarize_repo)
+        memory = SessionMemory(prompt)
+        controller = controller or make_controller(max_turns)
+        try:
+            while True:
+                user_prompt = memory.render(await asyncio.to_thread(prefix_tokens, action_agent))
+                stop = controller.start_turn(memory.sizes[-1])
+                if stop:
+                    break
+                turns = session["turns"] = controller.turns
+                with telemetry.span("action") as attrs:
+                    attrs["prompt_tokens"] = memory.sizes[-1]
+                    actions = await action_agent.aprompt(user_prompt=user_prompt)
+                if not actions:
+                    memory.add(NO_ACTION_FEEDBACK)
+                    stop = review_turn(controller, memory, [], [])
+                    if stop:
+                        break
+                    continue
+                spec = Speculation(action_agent, actions, _executor) if speculative else None
+                with telemetry.span("eval", actions=len(actions)):
+                    verdicts = await asyncio.gather(*(eval_agent.adecide(res) for res in actions))
+                telemetry.record_verdicts(actions, verdicts)
+                for res, res_eval in zip(actions, verdicts):
+                    yield res
+                    yield res_eval
+                begin_checkpoint(action_agent, turns)
+                with telemetry.span("execute", speculative=speculative):
+                    if spec:
+                        results = await asyncio.to_thread(spec.finish, verdicts)
+                    else:
+                        results = await asyncio.to_thread(execute_approved, action_agent, actions, verdicts)
+                eval_agent.note_injections(results)
+                if remember_turn(memory, actions, verdicts, results):
+                    stop = controller.stop("completed")
+                    break
+                stop = review_turn(controller, memory, actions, verdicts)
+                if stop:
+                    break
+
+                with telemetry.span("summarize_repo"):
+                    eval_agent.current_state = await asyncio.to_thread(action_agent.summarize_repo)
+            session["reason"] = stop.reason
+        finally:
+            if context_cache is not None:
+                context_cache.close()
+            if action_agent.index is not None:
+                action_agent.index.close()
+
+
+def prefix_tokens(action_agent):
+    """
+    Estimated tokens of the fixed sections of the next action request,
+    which count against the session memory budget.
+    """
+    return estimate_tokens("".join(action_agent.prefix_texts()))
+
+
+NO_ACTION_FEEDBACK = "No action was proposed. Call propose_action, or propose COMPLETED if the goal is achieved."
+
+
+def is_executable(res, res_eval):
+    return res_eval.approved and res.action_type != "COMPLETED"
+
+
+def make_controller(max_turns=None):
+    return SessionController(max_turns=SESSION_MAX_TURNS if max_turns is None else max_turns)
+
+
+def review_turn(controller, memory, actions, verdicts):
+    """
+    Let the controller check the turn for stalls. A warning is passed on to
+    the model through the session memory; returns a StopReason to end the
+    session, or None.
+    """
+    outcome = controller.end_turn(actions, verdicts)
+    if "warn" in outcome:
+        memory.add(outcome["warn"])
+    stop = outcome.get("stop")
+    if stop:
+        telemetry.count("session_stops_total", reason=stop.reason)
+    return stop
+
+
+def begin_checkpoint(action_agent, turn):
+    if action_agent.checkpoints is None:
+        return None
+    return action_agent.checkpoints.begin(f"turn {turn}")
+
+
+def execute_approved(action_agent, actions, verdicts, executor=None):
+    """
+    Execute every approved action. Actions on different paths run in parallel;
+    actions on the same path run one after another in the order proposed.
+    Returns results aligned with `actions` (None where nothing was executed).
+    """
+    results = [None] * len(actions)
+    groups = {}
+    for i, (res, res_eval) in enumerate(zip(actions, verdicts)):
+        if is_executable(res, res_eval):
+            groups.setdefault(action_agent.path_key(res.target), []).append(i)
+
+    def run_group(indices):
+        for i in indices:
+            res = actions[i]
+            try:
+                action = Action[res.action_type]
+            except KeyError:
+                results[i] = {"ok": False, "error": f"Unknown action_type: {res.action_type}"}
+                continue
+            results[i] = action_agent.execute_action(action=action,target=res.target,payload=res.contents_or_diff,
+                                                      read=res.read)
+
+    if len(groups) == 1:
+        run_group(next(iter(groups.values())))
+    else:
+        executor = executor or _executor
+        futures = [executor.submit(contextvars.copy_context().run, run_group, g) for g in groups.values()]
+        for f in futures:
+            f.result()
+    return results
+
+
+def remember_turn(memory, actions, verdicts, results):
+    """
+    Add the turn to the session memory, both verbatim and with tool results
+    compacted. Returns whether the task is done.
+    """
+    feedback, done = turn_feedback(actions, verdicts, results)
+    compact, _ = turn_feedback(actions, verdicts, [compact_result(r) for r in results])
+    memory.add(feedback, compact)
+    if done:
+        telemetry.count("session_stops_total", reason="completed")
+    return done
+
+
+def turn_feedback(actions, verdicts, results):
+    """
+    Feedback for every action of the turn, sent back to the model in one go.
+    Returns the text and whether the task is done; completion reaches the
+    caller as the loop's "done" event.
+    """
+    feedback = ""
+    done = False
+    for res, res_eval, action_result in zip(actions, verdicts, results):
+        if not res_eval.approved:
+            feedback+=f"Action: {res.action_type} on {res.target} was declined because: {res_eval.rationale}. Please try again."
+        elif res.action_type== "COMPLETED":
+            done = True
+        else:
+            feedback+=f"Action: {res.action_type} on {res.target} was accepted and completed by the agent. Action result was: {action_result}"
+    return feedback, done
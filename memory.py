@@ -0,0 +1,82 @@
+import hashlib
+from dataclasses import dataclass
+from typing import Any, List
+
+from config import MEMORY_KEEP_RECENT, MEMORY_TOKEN_BUDGET, CHARS_PER_TOKEN
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def compact_result(result: Any) -> Any:
+    """
+    Replace bulky tool output (OPEN_FILE bodies) with a hash and line count,
+    keeping every other field of the result as is.
+    """
+    if not isinstance(result, dict) or not isinstance(result.get("content"), str):
+        return result
+    content = result["content"]
+    digest = hashlib.sha256(content.encode("utf-8", errors="replace")).hexdigest()[:12]
+    compacted = dict(result)
+    compacted["content"] = f"<{content.count(chr(10)) + 1} lines, {len(content)} chars, sha256:{digest} - open the file again if needed>"
+    return compacted
+
+
+@dataclass
+class Turn:
+    text: str     # verbatim, used while the turn is recent
+    compact: str  # used once the turn has aged out of the recent window
+
+
+class SessionMemory:
+    '''
+    Conversation memory for one evaluate_prompt session.
+
+    The goal is always kept. The last `keep_recent` turns are kept verbatim,
+    older ones in compacted form (file bodies replaced by hashes). If the
+    rendered prompt is still over `token_budget`, the oldest turns are
+    dropped, then recent turns other than the latest are compacted too, and
+    finally the recent text is cut from the front.
+
+    The budget covers the whole call: render() is told how many tokens the
+    fixed sections sent with the history (primer, repo summary, excerpts)
+    take, and only the rest is left for the history.
+    '''
+    def __init__(self, goal: str, keep_recent: int = MEMORY_KEEP_RECENT, token_budget: int = MEMORY_TOKEN_BUDGET):
+        self.goal = goal
+        self.keep_recent = keep_recent
+        self.token_budget = token_budget
+        self.turns: List[Turn] = []
+        self.sizes: List[int] = []  # estimated prompt tokens of each render()
+
+    def add(self, text: str, compact: str = None) -> None:
+        if text:
+            self.turns.append(Turn(text, text if compact is None else compact))
+
+    def render(self, reserved_tokens: int = 0) -> str:
+        budget_chars = max(0, self.token_budget - reserved_tokens) * CHARS_PER_TOKEN
+        split = max(0, len(self.turns) - self.keep_recent)
+        older = [t.compact for t in self.turns[:split]]
+        recent = "".join(t.text for t in self.turns[split:])
+
+        dropped = 0
+        while older and len(self.goal) + sum(map(len, older)) + len(recent) > budget_chars:
+            older.pop(0)
+            dropped += 1
+        if len(self.goal) + sum(map(len, older)) + len(recent) > budget_chars and self.turns:
+            # only the latest turn stays verbatim
+            recent = "".join(t.compact for t in self.turns[split:-1]) + self.turns[-1].text
+        head = self.goal
+        if dropped:
+            head += f"\n[{dropped} earlier turn(s) omitted]\n"
+        history = "".join(older)
+
+        room = budget_chars - len(head) - len(history)
+        if len(recent) > room:
+            marker = "…(truncated)"
+            recent = marker + recent[len(recent) - max(0, room - len(marker)):]
+
+        text = head + history + recent
+        self.sizes.append(reserved_tokens + estimate_tokens(text))
+        return text
@@ -0,0 +1,251 @@
+import os
+import re
+import tempfile
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+from config import PATCH_MAX_FUZZ
+
+_HUNK_RE = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+_DIFF_START_RE = re.compile(r"\A\s*(?:diff |--- |@@ -\d)")
+# files whose contents are diffs; a WRITE_FILE to them is never applied as one
+DIFF_SUFFIXES = (".patch", ".diff")
+
+
+class PatchConflict(Exception):
+    '''
+    A hunk's context could not be found in the file. Nothing is written.
+    '''
+    def __init__(self, conflicts: List[str]):
+        super().__init__("; ".join(conflicts))
+        self.conflicts = conflicts
+
+
+@dataclass
+class Hunk:
+    header: str
+    old_start: int  # 1-based, as in the header
+    lines: List[Tuple[str, str]] = field(default_factory=list)  # (" " | "-" | "+", text)
+    no_eol: bool = False  # "\ No newline at end of file" after the last added line
+
+    def old(self, trim: int = 0) -> List[str]:
+        return [t for tag, t in self._trimmed(trim)[0] if tag != "+"]
+
+    def new(self, trim: int = 0) -> List[str]:
+        return [t for tag, t in self._trimmed(trim)[0] if tag != "-"]
+
+    def _trimmed(self, trim: int):
+        """
+        The hunk lines with up to `trim` context lines dropped from either
+        end (fuzz), and how many were dropped from the front.
+        """
+        lines = self.lines
+        lead = 0
+        while lead < min(trim, len(lines)) and lines[lead][0] == " ":
+            lead += 1
+        tail = 0
+        while tail < min(trim, len(lines) - lead) and lines[-1 - tail][0] == " ":
+            tail += 1
+        return lines[lead:len(lines) - tail], lead
+
+
+def split_lines(text: str) -> List[str]:
+    """
+    Lines of `text` split on "\n" only, with a trailing "\r" dropped.
+    str.splitlines would also break on form feeds, \x1c-\x1e, \x85 and
+    \u2028, which are ordinary characters inside a source line.
+    """
+    lines = text.split("\n")
+    last = lines.pop()  # after the final newline; empty if the text ends with one
+    lines = [l[:-1] if l.endswith("\r") else l for l in lines]
+    return lines + [last] if last else lines
+
+
+def is_unified_diff(payload: str) -> bool:
+    return bool(_DIFF_START_RE.match(payload)) and any(_HUNK_RE.match(l) for l in split_lines(payload))
+
+
+def parse_diff(payload: str) -> List[Hunk]:
+    """
+    Hunks of a single-file unified diff. Line counts in the hunk headers are
+    not trusted, since models often get them wrong; a hunk runs until the
+    next header.
+    """
+    hunks = []
+    for line in split_lines(payload):
+        m = _HUNK_RE.match(line)
+        if m:
+            hunks.append(Hunk(line, int(m.group(1))))
+        elif not hunks or line.startswith(("--- ", "+++ ", "diff ", "index ")):
+            continue
+        elif line.startswith("\\"):
+            hunks[-1].no_eol = True
+        elif line[:1] in (" ", "-", "+"):
+            hunks[-1].lines.append((line[0], line[1:]))
+        elif line == "":
+            # context line whose leading space was stripped
+            hunks[-1].lines.append((" ", ""))
+    return hunks
+
+
+def _matches(lines: List[str], at: int, old: List[str], loose: bool) -> bool:
+    if at + len(old) > len(lines):
+        return False
+    if loose:
+        return all(lines[at + i].rstrip() == o.rstrip() for i, o in enumerate(old))
+    return lines[at:at + len(old)] == old
+
+
+def _locate(lines: List[str], old: List[str], expected: int, lo: int, loose: bool) -> Optional[int]:
+    """
+    Position of `old` in `lines` at or after `lo`, nearest to `expected`.
+    """
+    if not old:
+        return min(max(expected, lo), len(lines))
+    for delta in range(len(lines) + 1):
+        for at in (expected - delta, expected + delta) if delta else (expected,):
+            if at >= lo and _matches(lines, at, old, loose):
+                return at
+        if expected - delta < lo and expected + delta > len(lines):
+            break
+    return None
+
+
+def apply_patch(text: str, payload: str, max_fuzz: int = PATCH_MAX_FUZZ) -> Tuple[str, dict]:
+    """
+    Apply a unified diff to `text`. Each hunk is placed nearest to the line
+    its header names; if its context is not found exactly, trailing
+    whitespace is ignored and then up to `max_fuzz` context lines are
+    dropped from each end. Raises PatchConflict listing every hunk that
+    does not apply, in which case nothing is changed.
+    Returns the new text and a summary of how the hunks were applied.
+    """
+    hunks = parse_diff(payload)
+    if not hunks:
+        raise PatchConflict(["no hunks found in diff"])
+    newline = "\r\n" if "\r\n" in text else "\n"  # for added lines; unchanged ones keep theirs
+    ends_with_eol = text.endswith("\n")
+    lines = split_lines(text)
+    eols = ["\r\n" if l.endswith("\r") else "\n" for l in text.split("\n")[:len(lines)]]
+
+    placed, conflicts = [], []
+    lo, offset, max_used_fuzz = 0, 0, 0
+    for n, hunk in enumerate(hunks, 1):
+        found = None
+        for fuzz in range(max_fuzz + 1):
+            lead = hunk._trimmed(fuzz)[1]
+            old = hunk.old(fuzz)
+            expected = max(hunk.old_start - 1, 0) + offset + lead
+            for loose in (False, True):
+                at = _locate(lines, old, expected, lo, loose)
+                if at is not None:
+                    found = (at, len(old), hunk._trimmed(fuzz)[0], fuzz)
+                    break
+            if found:
+                break
+        if found is None:
+            conflicts.append(f"hunk {n} ({hunk.header}) does not apply: context not found")
+            continue
+        at, old_len, hunk_lines, fuzz = found
+        placed.append((at, old_len, hunk_lines))
+        offset = at - (max(hunk.old_start - 1, 0) + hunk._trimmed(fuzz)[1])
+        lo = at + old_len
+        max_used_fuzz = max(max_used_fuzz, fuzz)
+    if conflicts:
+        raise PatchConflict(conflicts)
+
+    out, pos = [], 0  # (line, its line ending)
+    for at, old_len, hunk_lines in placed:
+        out.extend(zip(lines[pos:at], eols[pos:at]))
+        for tag, text in hunk_lines:
+            if tag == "+":
+                out.append((text, newline))
+            else:
+                if tag == " ":
+                    # context stays as it is in the file, ending included
+                    out.append((lines[at], eols[at]))
+                at += 1
+        pos = at
+    out.extend(zip(lines[pos:], eols[pos:]))
+    # keep the file's final newline unless the diff says otherwise
+    touches_end = placed[-1][0] + placed[-1][1] >= len(lines)
+    eol = not hunks[-1].no_eol if touches_end else ends_with_eol
+    new_text = "".join(l + e for l, e in out[:-1])
+    if out:
+        new_text += out[-1][0] + (out[-1][1] if eol else "")
+    return new_text, {"hunks": len(hunks), "fuzz": max_used_fuzz}
+
+
+def _common_prefix(a: bytes, b: bytes) -> int:
+    # binary search over slice comparisons, which run in C
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def bytes_changed(old: bytes, new: bytes) -> int:
+    """
+    Size of the region that differs, from the first to the last changed byte.
+    """
+    prefix = _common_prefix(old, new)
+    suffix = _common_prefix(old[prefix:][::-1], new[prefix:][::-1])
+    return max(len(old), len(new)) - prefix - suffix
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """
+    Write `data` to a temporary file next to `path` and rename it into
+    place, so readers see either the old or the new file, never a partial one.
+    A symlink is followed, so the file it points to is replaced, not the link.
+    """
+    path = os.path.realpath(path)
+    dir_path = os.path.dirname(path) or "."
+    os.makedirs(dir_path, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dir_path, prefix=".tmp-", suffix="-" + os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp, os.stat(path).st_mode & 0o7777)
+        except FileNotFoundError:
+            os.chmod(tmp, 0o644)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def write_file(path: str, payload: str) -> dict:
+    """
+    WRITE_FILE: apply `payload` as a unified diff if it is one, otherwise
+    write it as the full contents. A .patch or .diff target always gets the
+    payload as its contents. Returns the fields of the action result.
+    """
+    try:
+        with open(path, "rb") as f:
+            old = f.read()
+    except FileNotFoundError:
+        old = b""
+    if is_unified_diff(payload) and not path.endswith(DIFF_SUFFIXES):
+        try:
+            text, info = apply_patch(old.decode("utf-8"), payload)
+        except UnicodeDecodeError:
+            return {"ok": False, "error": "Cannot patch a file that is not UTF-8 text"}
+        except PatchConflict as e:
+            return {"ok": False, "error": f"Patch conflict: {e}", "conflicts": e.conflicts}
+        info["mode"] = "patch"
+    else:
+        text, info = payload, {"mode": "full"}
+    new = text.encode("utf-8")
+    atomic_write(path, new)
+    return dict(info, ok=True, bytes_written=len(new), bytes_changed=bytes_changed(old, new))
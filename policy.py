@@ -0,0 +1,120 @@
+import os
+import re
+import json
+import fnmatch
+from dataclasses import dataclass, field, asdict
+from typing import Any, Dict, List, Optional, Sequence
+
+from actions import ProposedAction, EvalVerdict
+from config import PROTECTED_PATHS, SECRET_PATHS, CHECKPOINT_DIR
+from injection import get_scanner
+
+
+@dataclass
+class Rule:
+    '''
+    A declarative pre-gate rule. Every condition that is set must match for
+    the rule to fire; unset conditions match anything.
+    '''
+    name: str
+    decision: str                       # "approve" or "decline"
+    rationale: str
+    actions: Sequence[str] = ()         # Action names, e.g. ("OPEN_FILE",)
+    paths: Sequence[str] = ()           # globs over the repo-relative target
+    inside_repo: Optional[bool] = None  # target resolves inside repo_root
+    max_payload: Optional[int] = None   # payload length <= max_payload
+    min_payload: Optional[int] = None   # payload length >= min_payload
+    patterns: Sequence[str] = ()        # regexes searched in the payload
+    injection: Optional[bool] = None    # payload has an injection signature (injection.py)
+    _path_re: Any = field(default=None, init=False, repr=False, compare=False)
+    _payload_re: Any = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.decision not in ("approve", "decline"):
+            raise ValueError(f"Rule {self.name}: decision must be 'approve' or 'decline'")
+        self.actions = tuple(self.actions)
+        self.paths = tuple(self.paths)
+        self.patterns = tuple(self.patterns)
+        if self.paths:
+            self._path_re = re.compile("|".join(fnmatch.translate(p) for p in self.paths))
+        if self.patterns:
+            self._payload_re = re.compile("|".join(f"(?:{p})" for p in self.patterns), re.IGNORECASE)
+
+    def matches(self, action_type: str, target: str, inside: bool, payload: str) -> bool:
+        if self.actions and action_type not in self.actions:
+            return False
+        if self.inside_repo is not None and inside != self.inside_repo:
+            return False
+        if self._path_re is not None and not (
+            self._path_re.match(target) or self._path_re.match(os.path.basename(target))
+        ):
+            return False
+        if self.max_payload is not None and len(payload) > self.max_payload:
+            return False
+        if self.min_payload is not None and len(payload) < self.min_payload:
+            return False
+        if self._payload_re is not None and not self._payload_re.search(payload):
+            return False
+        if self.injection is not None and get_scanner().search(payload) != self.injection:
+            return False
+        return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {k: v for k, v in asdict(self).items() if not k.startswith("_")}
+
+
+DEFAULT_RULES = [
+    Rule("decline-outside-repo", "decline", "Target resolves outside the repository.",
+         inside_repo=False),
+    Rule("decline-protected-delete", "decline", "Deleting protected files is not allowed.",
+         actions=("DELETE_FILE",), paths=PROTECTED_PATHS),
+    Rule("decline-checkpoint-store", "decline", "The checkpoint store is managed by the gate, not the agent.",
+         actions=("WRITE_FILE", "DELETE_FILE"), paths=(f"{CHECKPOINT_DIR}/*",)),
+    Rule("decline-injection-write", "decline", "Payload contains a known prompt-injection string.",
+         actions=("WRITE_FILE",), injection=True),
+    Rule("decline-secret-read", "decline", "The file usually holds credentials.",
+         actions=("OPEN_FILE",), paths=SECRET_PATHS),
+    Rule("approve-read-in-repo", "approve", "Reading files inside the repository is always allowed.",
+         actions=("OPEN_FILE",), inside_repo=True),
+]
+
+
+class PolicyEngine:
+    '''
+    Local rule-based pre-gate that runs before EvalAgent's model call.
+    Rules are checked in order and the first match decides; if nothing
+    matches the action is ambiguous and goes to the LLM.
+    '''
+    def __init__(self, rules: List[Rule] = None, repo_root: str = '.'):
+        self.rules = list(DEFAULT_RULES if rules is None else rules)
+        self.repo_root = os.path.realpath(repo_root)
+
+    @classmethod
+    def from_file(cls, path: str, repo_root: str = '.') -> "PolicyEngine":
+        """
+        Load rules from a JSON list of Rule fields.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            rules = [Rule(**r) for r in json.load(f)]
+        return cls(rules, repo_root=repo_root)
+
+    def _resolve(self, target: str):
+        # symlinks are followed, so a link inside the repo to ~/.ssh counts as outside
+        p = os.path.realpath(os.path.join(self.repo_root, target))
+        inside = p == self.repo_root or p.startswith(self.repo_root + os.sep)
+        rel = os.path.relpath(p, self.repo_root) if inside else target
+        return rel.replace(os.sep, "/"), inside
+
+    def decide(self, res: ProposedAction) -> Optional[EvalVerdict]:
+        """
+        Returns the verdict of the first rule that fires, or None when the
+        action needs the LLM evaluator.
+        """
+        if res.action_type == "COMPLETED":
+            # whether the goal is achieved is a judgement call
+            return None
+        rel, inside = self._resolve(res.target)
+        for rule in self.rules:
+            if rule.matches(res.action_type, rel, inside, res.contents_or_diff):
+                return EvalVerdict(rule.decision, rule.rationale, rule=rule.name)
+        return None
@@ -0,0 +1,256 @@
+import os
+import re
+import sqlite3
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from scanner import goal_terms, is_excluded
+from injection import guard_text
+from config import (CHECKPOINT_DIR, RETRIEVAL_TOP_K, RETRIEVAL_CHUNK_LINES, RETRIEVAL_MAX_CHARS,
+                    RETRIEVAL_MAX_FILE_BYTES)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chunk_paths (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chunk_paths_path ON chunk_paths(path);
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks USING fts5(
+    path, symbols, text, start_line UNINDEXED, end_line UNINDEXED
+);
+"""
+
+# definitions in the common languages: def/class, function, fn, struct, ...
+_SYMBOL = re.compile(
+    r"^\s*(?:export\s+)?(?:pub\s+)?(?:async\s+)?"
+    r"(?:def|class|function|func|fn|struct|interface|enum|trait|type|const|let|var)\s+([A-Za-z_]\w*)",
+    re.MULTILINE)
+_CAMEL = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+# bm25 weights of the path, symbols and text columns
+WEIGHTS = (4.0, 2.0, 1.0)
+
+
+def symbols(text: str) -> str:
+    """
+    Names defined in a chunk, with camelCase and snake_case split into words
+    so "parseDiff" is found by "parse diff".
+    """
+    names = _SYMBOL.findall(text)
+    words = [w.lower() for name in names for w in _CAMEL.findall(name)]
+    return " ".join(names + words)
+
+
+def chunk_text(text: str, lines_per_chunk: int = RETRIEVAL_CHUNK_LINES) -> List[Tuple[int, int, str]]:
+    """
+    (start_line, end_line, text) chunks of `lines_per_chunk` lines, 1-based.
+    """
+    lines = text.splitlines()
+    return [(i + 1, min(i + lines_per_chunk, len(lines)), "\n".join(lines[i:i + lines_per_chunk]))
+            for i in range(0, len(lines), lines_per_chunk)]
+
+
+def fts_query(goal: str) -> Optional[str]:
+    terms = sorted(goal_terms(goal))
+    if not terms:
+        return None
+    return " OR ".join('"' + t.replace('"', '""') + '"' for t in terms)
+
+
+class RetrievalIndex:
+    '''
+    On-disk BM25 index of a repo's text files, for finding the code a goal
+    is about without spending turns on OPEN_FILE.
+
+    Files are split into chunks of RETRIEVAL_CHUNK_LINES lines, and each
+    chunk is indexed by path, defined symbols and text. SQLite FTS5 keeps the
+    inverted index and ranks with bm25(). The index lives in
+    <repo>/.agent-eval/index.sqlite and survives sessions. `sync` compares it
+    to a snapshot's (path, mtime, size) entries and re-indexes only what
+    changed. Between syncs, `update` is called for every path the agent
+    writes or deletes; paths the repo walk leaves out (dotfiles such as
+    .env, ignored files) are not indexed there either. The database is only
+    created once there is something to put in it.
+    '''
+    def __init__(self, repo_root: str, path: str = None, max_file_bytes: int = RETRIEVAL_MAX_FILE_BYTES,
+                 chunk_lines: int = RETRIEVAL_CHUNK_LINES):
+        self.repo_root = os.path.abspath(repo_root)
+        self.path = path or os.path.join(self.repo_root, CHECKPOINT_DIR, "index.sqlite")
+        self.max_file_bytes = max_file_bytes
+        self.chunk_lines = chunk_lines
+        self.synced = False
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _open(self, create: bool) -> bool:
+        """
+        Connect to the database, creating it if `create`. Returns whether
+        there is one. Called with the lock held.
+        """
+        if self._conn is not None:
+            return True
+        if not create and (self.path == ":memory:" or not os.path.exists(self.path)):
+            return False
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        return True
+
+    def _rel(self, path: str) -> str:
+        if os.path.isabs(path):
+            path = os.path.relpath(path, self.repo_root)
+        return os.path.normpath(path)
+
+    def _remove(self, rel: str) -> None:
+        self._conn.execute("DELETE FROM chunks WHERE rowid IN (SELECT id FROM chunk_paths WHERE path = ?)", (rel,))
+        self._conn.execute("DELETE FROM chunk_paths WHERE path = ?", (rel,))
+        self._conn.execute("DELETE FROM files WHERE path = ?", (rel,))
+
+    def _add(self, rel: str, mtime_ns: int, size: int) -> None:
+        self._conn.execute("INSERT INTO files VALUES (?, ?, ?)", (rel, mtime_ns, size))
+        if size > self.max_file_bytes:
+            return  # listed, so it is not re-read on every sync, but not searchable
+        try:
+            with open(os.path.join(self.repo_root, rel), "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        if b"\0" in data[:8192]:
+            return
+        text = data.decode("utf-8", errors="replace")
+        for start, end, chunk in chunk_text(text, self.chunk_lines) or [(1, 1, "")]:
+            cur = self._conn.execute("INSERT INTO chunk_paths (path) VALUES (?)", (rel,))
+            self._conn.execute(
+                "INSERT INTO chunks (rowid, path, symbols, text, start_line, end_line) VALUES (?, ?, ?, ?, ?, ?)",
+                (cur.lastrowid, rel.replace(os.sep, " "), symbols(chunk), chunk, start, end))
+
+    def sync(self, entries: Iterable[Tuple[str, int, int]]) -> Dict[str, int]:
+        """
+        Bring the index in line with (rel_path, mtime_ns, size) entries, e.g.
+        RepoSnapshot.entries(). Returns counts of added, updated and removed
+        files.
+        """
+        counts = {"added": 0, "updated": 0, "removed": 0}
+        with self._lock:
+            if not self._open(create=False):
+                entries = list(entries)
+                if not entries:
+                    self.synced = True
+                    return counts
+                self._open(create=True)
+            known = {path: (mtime, size) for path, mtime, size in self._conn.execute("SELECT * FROM files")}
+            self._conn.execute("BEGIN")
+            try:
+                for rel, mtime, size in entries:
+                    old = known.pop(rel, None)
+                    if old == (mtime, size):
+                        continue
+                    if old is not None:
+                        self._remove(rel)
+                    self._add(rel, mtime, size)
+                    counts["updated" if old else "added"] += 1
+                for rel in known:
+                    self._remove(rel)
+                    counts["removed"] += 1
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self.synced = True
+        return counts
+
+    def update(self, path: str) -> None:
+        """
+        Re-index one file after it was written, or drop it after it was
+        deleted. `path` is absolute or relative to the repo root. Paths
+        the repo walk excludes are only ever dropped.
+        """
+        rel = self._rel(path)
+        st = None
+        if not is_excluded(self.repo_root, rel):
+            try:
+                st = os.stat(os.path.join(self.repo_root, rel))
+            except OSError:
+                pass
+        with self._lock:
+            if not self._open(create=st is not None):
+                return
+            self._conn.execute("BEGIN")
+            try:
+                self._remove(rel)
+                if st is not None:
+                    self._add(rel, st.st_mtime_ns, st.st_size)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def search(self, query: str, k: int = RETRIEVAL_TOP_K, per_file: int = 2) -> List[Dict[str, Any]]:
+        """
+        The `k` chunks that best match the query words by bm25, at most
+        `per_file` from one file. Each hit is a dict with path, start_line,
+        end_line, score and text.
+        """
+        q = fts_query(query)
+        if q is None:
+            return []
+        with self._lock:
+            if not self._open(create=False):
+                return []
+            rows = self._conn.execute(
+                "SELECT chunk_paths.path, start_line, end_line, bm25(chunks, ?, ?, ?) AS score, text "
+                "FROM chunks JOIN chunk_paths ON chunk_paths.id = chunks.rowid "
+                "WHERE chunks MATCH ? ORDER BY score LIMIT ?",
+                (*WEIGHTS, q, k * per_file * 2)).fetchall()
+        hits = []
+        seen = {}
+        for path, start, end, score, text in rows:
+            if seen.get(path, 0) >= per_file:
+                continue
+            seen[path] = seen.get(path, 0) + 1
+            hits.append({"path": path, "start_line": start, "end_line": end, "score": round(-score, 3),
+                         "text": text})
+            if len(hits) == k:
+                break
+        return hits
+
+    def excerpts(self, goal: str, k: int = RETRIEVAL_TOP_K, max_chars: int = RETRIEVAL_MAX_CHARS) -> str:
+        """
+        Prompt text with the best matching chunks for the goal, in file
+        order, within max_chars. Empty if nothing matches.
+        """
+        hits = self.search(goal, k)
+        blocks = []
+        total = 0
+        for hit in sorted(hits, key=lambda h: (h["path"], h["start_line"])):
+            block = f"--- {hit['path']} lines {hit['start_line']}-{hit['end_line']} ---\n{guard_text(hit['text'])}"
+            if total + len(block) > max_chars:
+                continue
+            blocks.append(block)
+            total += len(block) + 1
+        if not blocks:
+            return ""
+        return ("Excerpts relevant to the goal, from a local search index "
+                "(open the file for the full, current text):\n" + "\n".join(blocks))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            if not self._open(create=False):
+                return {"files": 0, "chunks": 0}
+            files = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            chunks = self._conn.execute("SELECT COUNT(*) FROM chunk_paths").fetchone()[0]
+        return {"files": files, "chunks": chunks}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import fnmatch
+import threading
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Sequence
+
+from actions import ProposedAction, EvalVerdict
+from injection import get_scanner
+from telemetry import telemetry
+from config import (EVAL_ROUTES, ROUTING_ESCALATE_ACTIONS, ROUTING_SENSITIVE_PATHS, ROUTING_PATH, MODEL_PRICES)
+
+
+@dataclass
+class Route:
+    '''
+    One step of the eval cascade: the model asked and the confidence its
+    verdict needs to stand. Below it, the next route is asked.
+    '''
+    name: str
+    model: str
+    min_confidence: float = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def usage_cost(model: str, usage) -> Dict[str, float]:
+    """
+    Prompt and output tokens of a response's usage_metadata and their price
+    in MODEL_PRICES (0 for unknown models).
+    """
+    prompt = getattr(usage, "prompt_token_count", None) or 0
+    output = getattr(usage, "candidates_token_count", None) or 0
+    price_in, price_out = MODEL_PRICES.get(model, (0.0, 0.0))
+    return {"prompt_tokens": prompt, "output_tokens": output,
+            "cost_usd": (prompt * price_in + output * price_out) / 1e6}
+
+
+class Router:
+    '''
+    Chooses which eval models judge an action, cheapest first.
+
+    Every action that the policy engine and the verdict cache leave open
+    goes to the first route; its verdict stands when the reported
+    confidence reaches the route's min_confidence, otherwise the next route
+    is asked, and the last one always decides. High-risk actions go
+    straight to the last route: the action types in `escalate_actions`,
+    writes or deletes of `sensitive_paths`, and payloads with a
+    prompt-injection signature. Per-route calls, outcomes, latency, tokens
+    and cost are kept in `stats()` and counted in telemetry.
+    '''
+    def __init__(self, routes: Sequence[Route] = None, escalate_actions: Sequence[str] = ROUTING_ESCALATE_ACTIONS,
+                 sensitive_paths: Sequence[str] = ROUTING_SENSITIVE_PATHS, repo_root: str = '.'):
+        self.routes = list(routes) if routes is not None else [Route(*r) for r in EVAL_ROUTES]
+        if not self.routes:
+            raise ValueError("Router needs at least one route")
+        self.escalate_actions = tuple(escalate_actions)
+        self.sensitive_paths = tuple(sensitive_paths)
+        self.repo_root = os.path.abspath(repo_root)
+        self._path_re = (re.compile("|".join(fnmatch.translate(p) for p in self.sensitive_paths))
+                         if self.sensitive_paths else None)
+        self._lock = threading.Lock()
+        self._stats = {r.name: {"calls": 0, "decided": 0, "escalated": 0, "seconds": 0.0, "prompt_tokens": 0,
+                                "output_tokens": 0, "cost_usd": 0.0} for r in self.routes}
+        self.risky = 0  # actions sent straight to the last route
+
+    @classmethod
+    def from_file(cls, path: str, repo_root: str = '.') -> "Router":
+        """
+        Load a routing policy from JSON: {"routes": [Route fields, ...],
+        "escalate_actions": [...], "sensitive_paths": [...]}. Keys left out
+        keep their defaults.
+        """
+        with open(path, "r", encoding="utf-8") as f:
+            spec = json.load(f)
+        kwargs = {k: spec[k] for k in ("escalate_actions", "sensitive_paths") if k in spec}
+        if "routes" in spec:
+            kwargs["routes"] = [Route(**r) for r in spec["routes"]]
+        return cls(repo_root=repo_root, **kwargs)
+
+    @classmethod
+    def default(cls, repo_root: str = '.') -> "Router":
+        if ROUTING_PATH:
+            return cls.from_file(ROUTING_PATH, repo_root=repo_root)
+        return cls(repo_root=repo_root)
+
+    def key(self) -> str:
+        """
+        Identifies the cascade in verdict cache keys.
+        """
+        return "+".join(f"{r.model}@{r.min_confidence:g}" for r in self.routes)
+
+    def risk(self, res: ProposedAction) -> Optional[str]:
+        """
+        Why the action must go to the strongest route, or None.
+        """
+        if res.action_type in self.escalate_actions:
+            return res.action_type
+        if res.action_type in ("WRITE_FILE", "DELETE_FILE") and self._path_re is not None:
+            p = os.path.abspath(os.path.join(self.repo_root, res.target))
+            rel = os.path.relpath(p, self.repo_root).replace(os.sep, "/")
+            if self._path_re.match(rel) or self._path_re.match(os.path.basename(rel)):
+                return "sensitive path"
+        if res.contents_or_diff and get_scanner().search(res.contents_or_diff):
+            return "injection"
+        return None
+
+    def plan(self, res: ProposedAction) -> List[Route]:
+        """
+        The routes to try for an action, in order.
+        """
+        reason = self.risk(res)
+        if reason is None or len(self.routes) == 1:
+            return self.routes
+        with self._lock:
+            self.risky += 1
+        telemetry.count("eval_route_escalations_total", reason=reason)
+        return self.routes[-1:]
+
+    def accepts(self, route: Route, verdict: Optional[EvalVerdict], last: bool) -> bool:
+        if last:
+            return True
+        return verdict is not None and (verdict.confidence or 0.0) >= route.min_confidence
+
+    def record(self, route: Route, seconds: float, decided: bool, usage=None) -> None:
+        cost = usage_cost(route.model, usage)
+        outcome = "decided" if decided else "escalated"
+        with self._lock:
+            s = self._stats[route.name]
+            s["calls"] += 1
+            s[outcome] += 1
+            s["seconds"] += seconds
+            for k, v in cost.items():
+                s[k] += v
+        telemetry.count("eval_route_calls_total", route=route.name, model=route.model, outcome=outcome)
+        telemetry.observe("eval_route_seconds", seconds, route=route.name)
+        if cost["cost_usd"]:
+            telemetry.count("eval_route_cost_usd_total", cost["cost_usd"], route=route.name)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Per route: calls, how many it decided or escalated, mean latency,
+        tokens and cost; plus the share of actions decided on the first
+        route.
+        """
+        with self._lock:
+            routes = {}
+            for r in self.routes:
+                s = dict(self._stats[r.name])
+                s["mean_seconds"] = round(s["seconds"] / s["calls"], 4) if s["calls"] else None
+                s["seconds"] = round(s["seconds"], 4)
+                s["cost_usd"] = round(s["cost_usd"], 6)
+                routes[r.name] = dict(s, model=r.model)
+            first = self._stats[self.routes[0].name]
+            total = sum(s["decided"] for s in self._stats.values())
+        return {"routes": routes, "risky": self.risky,
+                "fast_path_share": round(first["decided"] / total, 3) if total else None}
@@ -0,0 +1,428 @@
+import os
+import re
+import zlib
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from config import SCAN_WORKERS, REPO_HEAD_FILES, REPO_HEAD_BYTES, REPO_HEAD_LINES
+
+IGNORE_DIRS = {".git", ".venv", "venv", "__pycache__", ".mypy_cache", ".pytest_cache", "node_modules"}
+IGNORE_FILES = {".DS_Store"}
+
+# files worth showing early whatever the goal is
+KEY_FILES = {"readme.md", "readme.rst", "readme.txt", "readme", "pyproject.toml", "setup.py", "setup.cfg",
+             "requirements.txt", "package.json", "cargo.toml", "go.mod", "makefile", "dockerfile", "main.py",
+             "app.py", "config.py"}
+STOP_WORDS = {"the", "and", "for", "with", "that", "this", "from", "into", "file", "files", "make", "sure",
+              "should", "please", "add", "use", "all", "are", "not", "can", "repo", "code"}
+
+_WORD = re.compile(r"[a-z0-9]+")
+_executor = None
+
+
+def _pool(workers: int) -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan")
+    return _executor
+
+
+def _join(rel_dir: str, name: str) -> str:
+    return os.path.join(rel_dir, name) if rel_dir else name
+
+
+def _translate(pattern: str) -> str:
+    """
+    Regex for a gitignore glob: * and ? stay within one path segment, **
+    crosses segments, [...] is a character class.
+    """
+    out = []
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith("**/", i):
+            out.append("(?:.*/)?")
+            i += 3
+            continue
+        if pattern.startswith("**", i):
+            out.append(".*")
+            i += 2
+            continue
+        if c == "*":
+            out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[" and pattern.find("]", i + 2) != -1:
+            j = pattern.find("]", i + 2)
+            body = pattern[i + 1:j].replace("\\", "\\\\")
+            out.append("[" + ("^" + body[1:] if body.startswith("!") else body) + "]")
+            i = j + 1
+            continue
+        elif c == "\\" and i + 1 < n:
+            out.append(re.escape(pattern[i + 1]))
+            i += 2
+            continue
+        else:
+            out.append(re.escape(c))
+        i += 1
+    return "".join(out)
+
+
+class GitIgnore:
+    '''
+    The compiled rules of one .gitignore, matched against paths relative to
+    its directory. The last matching rule wins, so "!pattern" re-includes
+    what an earlier rule excluded. Without negations, all rules are folded
+    into one regex per kind (files, dirs) so a path is checked in one match.
+    '''
+    def __init__(self, lines: Iterable[str]):
+        self.lines = []
+        self.rules = []  # (regex, negate, dir_only)
+        for line in lines:
+            line = line.rstrip("\r\n").rstrip()
+            if not line or line.startswith("#"):
+                continue
+            self.lines.append(line)
+            negate = line.startswith("!")
+            if negate or line.startswith(("\\!", "\\#")):
+                line = line[1:]
+            dir_only = line.endswith("/")
+            line = line.rstrip("/")
+            if not line:
+                continue
+            # a slash anywhere but the end anchors the pattern to this directory
+            anchor = "^" if "/" in line else "^(?:.*/)?"
+            self.rules.append((anchor + _translate(line.lstrip("/")) + "$", negate, dir_only))
+        self.lines = tuple(self.lines)
+        self._combined = None
+        if not any(negate for _, negate, _ in self.rules):
+            files = [r for r, _, dir_only in self.rules if not dir_only]
+            dirs = [r for r, _, _ in self.rules]
+            self._combined = (re.compile("|".join(files)) if files else None,
+                              re.compile("|".join(dirs)) if dirs else None)
+        self.rules = [(re.compile(r), negate, dir_only) for r, negate, dir_only in self.rules]
+
+    @classmethod
+    def load(cls, path: str) -> Optional["GitIgnore"]:
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                ignore = cls(f)
+        except OSError:
+            return None
+        return ignore if ignore.rules else None
+
+    def __eq__(self, other):
+        return isinstance(other, GitIgnore) and self.lines == other.lines
+
+    def match(self, rel_path: str, is_dir: bool) -> Optional[bool]:
+        """
+        True if the path is ignored, False if a rule re-includes it, None
+        if no rule applies.
+        """
+        if self._combined is not None:
+            regex = self._combined[1 if is_dir else 0]
+            return True if regex is not None and regex.match(rel_path) else None
+        for regex, negate, dir_only in reversed(self.rules):
+            if dir_only and not is_dir:
+                continue
+            if regex.match(rel_path):
+                return not negate
+        return None
+
+
+def ignore_chain(ignores: Dict[str, GitIgnore], rel_dir: str) -> List[Tuple[str, GitIgnore]]:
+    """
+    The .gitignore rules that apply inside `rel_dir` from its ancestors
+    (not its own), outermost first.
+    """
+    chain = []
+    if rel_dir and "" in ignores:
+        chain.append(("", ignores[""]))
+    parts = rel_dir.split(os.sep) if rel_dir else []
+    for i in range(1, len(parts)):
+        d = os.sep.join(parts[:i])
+        if d in ignores:
+            chain.append((d, ignores[d]))
+    return chain
+
+
+def is_ignored(chain, rel_path: str, is_dir: bool) -> bool:
+    # the deepest .gitignore with an opinion decides
+    for base, ignore in reversed(chain):
+        verdict = ignore.match(rel_path[len(base) + 1:] if base else rel_path, is_dir)
+        if verdict is not None:
+            return verdict
+    return False
+
+
+def is_excluded(root: str, rel_path: str) -> bool:
+    """
+    Whether a walk of `root` would leave out the file at `rel_path`: it is a
+    dotfile, sits in a noise or dot dir, is excluded by a .gitignore on the
+    way down, or lies outside the root.
+    """
+    parts = os.path.normpath(rel_path).split(os.sep)
+    if any(name in IGNORE_DIRS or name.startswith(".") for name in parts[:-1]):
+        return True
+    if parts[-1] in IGNORE_FILES or parts[-1].startswith("."):
+        return True
+    chain = []
+    for i in range(len(parts)):
+        rel_dir = os.sep.join(parts[:i])
+        if rel_dir and chain and is_ignored(chain, rel_dir, True):
+            return True
+        own = GitIgnore.load(os.path.join(root, rel_dir, ".gitignore"))
+        if own is not None:
+            chain.append((rel_dir, own))
+    return bool(chain) and is_ignored(chain, os.sep.join(parts), False)
+
+
+def scan_dir(root: str, rel_dir: str, chain=()):
+    """
+    One os.scandir pass over a directory. Returns (subdirs, {filename:
+    (mtime_ns, size)}, own GitIgnore or None), or None if it is unreadable.
+    Noise dirs, dotfiles and whatever .gitignore excludes are skipped.
+    """
+    abs_dir = os.path.join(root, rel_dir) if rel_dir else root
+    try:
+        entries = list(os.scandir(abs_dir))
+    except OSError:
+        return None
+    own = None
+    if any(entry.name == ".gitignore" for entry in entries):
+        own = GitIgnore.load(os.path.join(abs_dir, ".gitignore"))
+        if own is not None:
+            chain = list(chain) + [(rel_dir, own)]
+    subdirs = []
+    files = {}
+    for entry in entries:
+        name = entry.name
+        try:
+            is_dir = entry.is_dir()
+        except OSError:
+            continue
+        if is_dir:
+            if name in IGNORE_DIRS or name.startswith("."):
+                continue
+            # os.walk lists symlinked dirs but does not descend into them
+            if not entry.is_symlink() and not (chain and is_ignored(chain, _join(rel_dir, name), True)):
+                subdirs.append(name)
+            continue
+        if name in IGNORE_FILES or name.startswith("."):
+            continue
+        if chain and is_ignored(chain, _join(rel_dir, name), False):
+            continue
+        try:
+            st = entry.stat()  # cached on the DirEntry
+        except OSError:
+            continue
+        files[name] = (st.st_mtime_ns, st.st_size)
+    return subdirs, files, own
+
+
+def walk(root: str, start: str = "", ignores: Dict[str, GitIgnore] = None, workers: int = SCAN_WORKERS):
+    """
+    Scan the tree under `start`, one directory per task on a thread pool.
+    Yields (rel_dir, subdirs, files) as directories finish, parents before
+    their children. `ignores` (rel_dir -> GitIgnore) must hold the rules
+    of the ancestors of `start`; the ones found below it are added.
+    """
+    ignores = {} if ignores is None else ignores
+
+    def settle(rel_dir, scanned):
+        subdirs, files, own = scanned
+        if own is not None:
+            ignores[rel_dir] = own
+        else:
+            ignores.pop(rel_dir, None)
+        return rel_dir, subdirs, files
+
+    if workers <= 1:
+        stack = [start]
+        while stack:
+            rel_dir = stack.pop()
+            scanned = scan_dir(root, rel_dir, ignore_chain(ignores, rel_dir))
+            if scanned is not None:
+                yield settle(rel_dir, scanned)
+                stack.extend(_join(rel_dir, d) for d in scanned[0])
+        return
+
+    pool = _pool(workers)
+    pending = {pool.submit(scan_dir, root, start, ignore_chain(ignores, start)): start}
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            rel_dir = pending.pop(future)
+            scanned = future.result()
+            if scanned is None:
+                continue
+            yield settle(rel_dir, scanned)
+            for d in scanned[0]:
+                child = _join(rel_dir, d)
+                pending[pool.submit(scan_dir, root, child, ignore_chain(ignores, child))] = child
+
+
+def read_head(path: str, max_bytes: int = REPO_HEAD_BYTES, max_lines: int = REPO_HEAD_LINES) -> Optional[str]:
+    """
+    The first non-blank lines of a text file, or None for binary and
+    unreadable files.
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read(max_bytes)
+    except OSError:
+        return None
+    if b"\0" in data:
+        return None
+    lines = data.decode("utf-8", errors="replace").splitlines()
+    if len(data) == max_bytes and len(lines) > 1:
+        lines.pop()  # cut mid-line
+    lines = [line.rstrip() for line in lines if line.strip()]
+    return "\n".join(lines[:max_lines]) or None
+
+
+def read_checksum(path: str, chunk_bytes: int = 2**20) -> Optional[str]:
+    """
+    CRC-32 of a file's content as 8 hex digits, or None if it can't be read.
+    """
+    crc = 0
+    try:
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_bytes):
+                crc = zlib.crc32(chunk, crc)
+    except OSError:
+        return None
+    return f"{crc:08x}"
+
+
+def _read_many(read: Callable[[str], Optional[str]], root: str, rel_paths: List[str],
+               workers: int) -> Dict[str, Optional[str]]:
+    paths = [os.path.join(root, p) for p in rel_paths]
+    if workers <= 1 or len(paths) < 4:
+        results = map(read, paths)
+    else:
+        results = _pool(workers).map(read, paths)
+    return dict(zip(rel_paths, results))
+
+
+def read_heads(root: str, rel_paths: List[str], workers: int = SCAN_WORKERS) -> Dict[str, Optional[str]]:
+    """
+    read_head for many files at once on the scan pool.
+    """
+    return _read_many(read_head, root, rel_paths, workers)
+
+
+def read_checksums(root: str, rel_paths: List[str], workers: int = SCAN_WORKERS) -> Dict[str, Optional[str]]:
+    """
+    read_checksum for many files at once on the scan pool.
+    """
+    return _read_many(read_checksum, root, rel_paths, workers)
+
+
+def goal_terms(goal: Optional[str]) -> set:
+    return {w for w in _WORD.findall((goal or "").lower()) if len(w) > 2 and w not in STOP_WORDS}
+
+
+def score(rel_path: str, size: int, terms: set, head: str = None) -> float:
+    """
+    Relevance of a file to the goal: goal words in its name count most, then
+    in its directories and its head; key project files and shallow paths
+    get a small boost, empty, huge and lock files a penalty.
+    """
+    lowered = rel_path.lower()
+    name = os.path.basename(lowered)
+    name_words = set(_WORD.findall(name))
+    name_stems = {w[:5] for w in name_words if len(w) >= 5}
+    dir_words = set(_WORD.findall(os.path.dirname(lowered)))
+    s = 0.0
+    for t in terms:
+        if t in name_words:
+            s += 4
+        elif t in name or (len(t) >= 5 and t[:5] in name_stems):
+            s += 2
+        elif t in dir_words:
+            s += 2
+        elif t in lowered:
+            s += 1
+    if head and terms:
+        head_words = set(_WORD.findall(head.lower()))
+        s += sum(1 for t in terms if t in head_words)
+    if name in KEY_FILES:
+        s += 2
+    s -= 0.2 * lowered.count(os.sep)
+    if size == 0:
+        s -= 1
+    if name.endswith(".lock") or size > 1_000_000:
+        s -= 3
+    return s
+
+
+def render_summary(entries: List[Tuple[str, int, int]], max_bytes: int = 60_000, goal: str = None,
+                   heads: Callable[[List[Tuple[str, int, int]]], Dict[str, Optional[str]]] = None,
+                   head_files: int = REPO_HEAD_FILES, scores: Dict[str, Tuple[int, float]] = None,
+                   checksums: Callable[[List[Tuple[str, int, int]]], Dict[str, Optional[str]]] = None) -> str:
+    """
+    summarize_repo text for (rel_path, mtime_ns, size) entries in walk order:
+    one "path (size bytes)" line per file, followed by the indented head of
+    the `head_files` files most relevant to `goal`, all within max_bytes.
+    With `checksums(entries)` (rel_path -> crc text) each line becomes
+    "path (size bytes, crc xxxxxxxx)", so same-size edits change it too.
+
+    If not every path fits, the most relevant ones are kept. Heads get the
+    bytes left after the paths. `heads(entries)` returns rel_path -> head
+    text for the entries asked for. `scores` (rel_path -> (size, score))
+    carries path scores for the same goal over from earlier calls.
+    """
+    terms = goal_terms(goal)
+    scores = {} if scores is None else scores
+
+    def rank(indices):
+        keys = {}
+        for i in indices:
+            rel_path, _, size = entries[i]
+            cached = scores.get(rel_path)
+            if cached is None or cached[0] != size:
+                cached = scores[rel_path] = (size, score(rel_path, size, terms))
+            keys[i] = -cached[1]
+        return sorted(keys, key=keys.__getitem__)
+
+    crcs = checksums(entries) if checksums is not None else {}
+    lines = [f"{rel_path} ({size} bytes, crc {crcs[rel_path]})" if crcs.get(rel_path) else f"{rel_path} ({size} bytes)"
+             for rel_path, _, size in entries]
+    total = sum(map(len, lines)) + len(lines)
+    order = None
+    keep = range(len(entries))
+    if total > max_bytes:
+        order = rank(range(len(entries)))
+        budget = max_bytes - 48  # room for the truncation marker
+        keep = []
+        total = 0
+        for i in order:
+            if total + len(lines[i]) + 1 > budget:
+                break
+            keep.append(i)
+            total += len(lines[i]) + 1
+    kept = set(keep)
+
+    shown = {}
+    if heads is not None and head_files > 0 and total < max_bytes:
+        if order is None:
+            order = rank(keep)
+        candidates = [i for i in order if i in kept and entries[i][2] > 0][:head_files * 2]
+        texts = heads([entries[i] for i in candidates])
+        candidates = [i for i in candidates if texts.get(entries[i][0])]
+        candidates.sort(key=lambda i: -score(entries[i][0], entries[i][2], terms, texts[entries[i][0]]))
+        for i in candidates[:head_files]:
+            block = "\n".join("    " + line for line in texts[entries[i][0]].splitlines())
+            if total + len(block) + 1 <= max_bytes:
+                shown[i] = block
+                total += len(block) + 1
+
+    out = []
+    for i in sorted(kept):
+        out.append(lines[i])
+        if i in shown:
+            out.append(shown[i])
+    if len(kept) < len(entries):
+        out.append(f"…(truncated, {len(entries) - len(kept)} more files)")
+    return "\n".join(out)
@@ -0,0 +1,127 @@
+import json
+import time
+import hashlib
+from collections import Counter
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional
+
+from verdict_cache import normalize_action
+from config import (SESSION_MAX_TURNS, SESSION_TOKEN_BUDGET, SESSION_MAX_SECONDS, SESSION_REPEAT_LIMIT,
+                    SESSION_OSCILLATION_WINDOW, SESSION_MAX_IDLE_TURNS)
+
+
+def fingerprint(res, res_eval) -> str:
+    """
+    Identity of a proposed action and its verdict, ignoring the rationale.
+    """
+    payload = json.dumps([normalize_action(res), res_eval.decision], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+@dataclass
+class StopReason:
+    '''
+    Why a session ended. `reason` is one of: completed, max_turns,
+    token_budget, wall_clock, repeated_action, oscillation, no_progress.
+    '''
+    reason: str
+    detail: str = ""
+    turns: int = 0
+    tokens: int = 0
+    elapsed_s: float = 0.0
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+class SessionController:
+    '''
+    Decides whether an evaluate_prompt session keeps going.
+
+    Budgets (turns, estimated prompt tokens, wall-clock seconds) are checked
+    before each turn. After each turn the actions are fingerprinted together
+    with their verdicts to catch an agent that is stuck:
+
+      - the same declined action proposed `repeat_limit` times, or the same
+        turn repeated `repeat_limit` times in a row,
+      - the last `window` turns alternating between two sets of actions
+        (A, B, A, B, ...),
+      - `max_idle_turns` turns in a row without a proposed action.
+
+    The first time a stuck pattern shows up the caller gets a warning to pass
+    on to the model (escalation); if it persists, the session is stopped.
+    '''
+    def __init__(self, max_turns: Optional[int] = SESSION_MAX_TURNS, max_tokens: Optional[int] = SESSION_TOKEN_BUDGET,
+                 max_seconds: Optional[float] = SESSION_MAX_SECONDS, repeat_limit: int = SESSION_REPEAT_LIMIT,
+                 window: int = SESSION_OSCILLATION_WINDOW, max_idle_turns: int = SESSION_MAX_IDLE_TURNS):
+        self.max_turns = max_turns
+        self.max_tokens = max_tokens
+        self.max_seconds = max_seconds
+        self.repeat_limit = repeat_limit
+        self.window = window
+        self.max_idle_turns = max_idle_turns
+        self.started = time.monotonic()
+        self.turns = 0
+        self.tokens = 0
+        self.idle = 0
+        self.declined = Counter()  # fingerprint -> times proposed and declined
+        self.history: List[frozenset] = []  # fingerprints of each turn
+        self.warned = set()
+
+    def stop(self, reason: str, detail: str = "") -> StopReason:
+        return StopReason(reason, detail, self.turns, self.tokens, round(time.monotonic() - self.started, 3))
+
+    def start_turn(self, prompt_tokens: int = 0) -> Optional[StopReason]:
+        """
+        Call before a turn; returns a StopReason if a budget is used up.
+        """
+        if self.max_turns is not None and self.turns >= self.max_turns:
+            return self.stop("max_turns", f"reached {self.max_turns} turns")
+        if self.max_seconds is not None and time.monotonic() - self.started >= self.max_seconds:
+            return self.stop("wall_clock", f"exceeded {self.max_seconds}s")
+        if self.max_tokens is not None and self.tokens + prompt_tokens > self.max_tokens:
+            return self.stop("token_budget", f"next prompt would exceed {self.max_tokens} tokens")
+        self.turns += 1
+        self.tokens += prompt_tokens
+        return None
+
+    def end_turn(self, actions, verdicts) -> Dict[str, Any]:
+        """
+        Call after a turn. Returns {"stop": StopReason} to end the session,
+        {"warn": text} to pass a warning to the model, or {} to go on.
+        """
+        if not actions:
+            self.idle += 1
+            if self.idle >= self.max_idle_turns:
+                return {"stop": self.stop("no_progress", f"{self.idle} turns without a proposed action")}
+            return {}
+        self.idle = 0
+
+        prints = [fingerprint(res, res_eval) for res, res_eval in zip(actions, verdicts)]
+        turn = frozenset(prints)
+        self.history.append(turn)
+        for fp, res, res_eval in zip(prints, actions, verdicts):
+            if res_eval.approved:
+                continue
+            self.declined[fp] += 1
+            if self.declined[fp] >= self.repeat_limit:
+                return self._escalate("repeated_action", fp,
+                                      f"{res.action_type} on {res.target or '(no target)'} was declined "
+                                      f"{self.declined[fp]} times")
+
+        same = self.history[-self.repeat_limit:]
+        if len(same) == self.repeat_limit and len(set(same)) == 1:
+            return self._escalate("repeated_action", turn,
+                                  f"the same actions were proposed {self.repeat_limit} turns in a row")
+        recent = self.history[-self.window:]
+        if len(recent) == self.window and len(set(recent)) == 2 and all(a != b for a, b in zip(recent, recent[1:])):
+            return self._escalate("oscillation", frozenset(recent),
+                                  f"alternating between the same two sets of actions for {self.window} turns")
+        return {}
+
+    def _escalate(self, reason: str, key, detail: str) -> Dict[str, Any]:
+        if (reason, key) in self.warned:
+            return {"stop": self.stop(reason, detail)}
+        self.warned.add((reason, key))
+        return {"warn": (f"Warning: {detail}. Proposing it again will end the session. "
+                         "Propose a different action, or COMPLETED if the goal cannot be achieved.")}
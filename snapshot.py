@@ -0,0 +1,169 @@
+import os
+
+from config import SCAN_WORKERS
+from injection import guard_text
+from scanner import (IGNORE_DIRS, IGNORE_FILES, scan_dir, walk, ignore_chain, read_heads, read_checksums,
+                     render_summary)
+
+
+class RepoSnapshot:
+    '''
+    Incrementally maintained index of a repo, keyed by (path, mtime, size).
+
+    The tree is walked once up front, directories in parallel (see
+    scanner.walk), honoring .gitignore files. After that only directories
+    marked dirty (e.g. by WRITE_FILE/DELETE_FILE in execute_action) are
+    re-scanned, and the summarize_repo text is rendered from the index; only
+    file heads and checksums not read before are read from disk. Changes
+    made outside the loop are not seen until they are marked dirty or
+    `rescan()` is called.
+    '''
+    def __init__(self, root: str = '.', workers: int = SCAN_WORKERS):
+        self.root = os.path.abspath(root)
+        self.workers = workers
+        # rel_dir -> (subdirs in walk order, {filename: (mtime_ns, size)})
+        self.dirs = {}
+        self.ignores = {}  # rel_dir -> GitIgnore of that directory
+        self.heads = {}  # rel_path -> (mtime_ns, size, head text or None)
+        self.checksums = {}  # rel_path -> (mtime_ns, size, crc text or None)
+        self.scores = {}  # goal -> {rel_path: (size, relevance)}
+        self.dirty = set()
+        self._rendered = {}
+        self.rescan()
+
+    def rescan(self) -> None:
+        self.dirs.clear()
+        self.ignores.clear()
+        self.dirty.clear()
+        self._rendered.clear()
+        self._scan_tree("")
+
+    def _scan_dir(self, rel_dir: str):
+        scanned = scan_dir(self.root, rel_dir, ignore_chain(self.ignores, rel_dir))
+        if scanned is None:
+            return None
+        subdirs, files, own = scanned
+        if own is not None:
+            self.ignores[rel_dir] = own
+        else:
+            self.ignores.pop(rel_dir, None)
+        return subdirs, files
+
+    def _scan_tree(self, rel_dir: str) -> None:
+        for current, subdirs, files in walk(self.root, rel_dir, self.ignores, self.workers):
+            self.dirs[current] = (subdirs, files)
+
+    def _drop_tree(self, rel_dir: str) -> None:
+        prefix = rel_dir + os.sep
+        for d in [d for d in self.dirs if d == rel_dir or d.startswith(prefix)]:
+            del self.dirs[d]
+            self.ignores.pop(d, None)
+
+    def mark_dirty(self, path: str) -> None:
+        '''
+        Mark the directory holding `path` (absolute or relative to root) for
+        re-scanning. Falls back to the nearest indexed ancestor so that newly
+        created directories are discovered on the next refresh.
+        '''
+        if os.path.isabs(path):
+            path = os.path.relpath(path, self.root)
+        rel_dir = os.path.dirname(os.path.normpath(path))
+        if rel_dir == ".":
+            rel_dir = ""
+        while rel_dir and rel_dir not in self.dirs:
+            rel_dir = os.path.dirname(rel_dir)
+        self.dirty.add(rel_dir)
+
+    def refresh(self) -> bool:
+        '''
+        Re-scan dirty directories. Returns True if the index changed.
+        '''
+        changed = False
+        for rel_dir in sorted(self.dirty, key=len):
+            old = self.dirs.get(rel_dir)
+            if old is None and rel_dir:
+                # already dropped as part of a removed parent
+                continue
+            old_ignore = self.ignores.get(rel_dir)
+            scanned = self._scan_dir(rel_dir)
+            if scanned is None:
+                self._drop_tree(rel_dir)
+                changed = True
+                continue
+            rules_changed = self.ignores.get(rel_dir) != old_ignore
+            if scanned == old and not rules_changed:
+                continue
+            changed = True
+            self.dirs[rel_dir] = scanned
+            old_subdirs = set(old[0]) if old else set()
+            if rules_changed:
+                # everything below was filtered with the old rules
+                for d in old_subdirs:
+                    self._drop_tree(os.path.join(rel_dir, d) if rel_dir else d)
+                old_subdirs = set()
+            for d in old_subdirs - set(scanned[0]):
+                self._drop_tree(os.path.join(rel_dir, d) if rel_dir else d)
+            for d in scanned[0]:
+                if d not in old_subdirs:
+                    self._scan_tree(os.path.join(rel_dir, d) if rel_dir else d)
+        self.dirty.clear()
+        if changed:
+            self._rendered.clear()
+        return changed
+
+    def entries(self):
+        '''
+        Yield (rel_path, mtime_ns, size) in the same order os.walk would.
+        '''
+        stack = [""]
+        while stack:
+            rel_dir = stack.pop()
+            scanned = self.dirs.get(rel_dir)
+            if scanned is None:
+                continue
+            subdirs, files = scanned
+            prefix = rel_dir + os.sep if rel_dir else ""
+            for fn in sorted(files):
+                mtime, size = files[fn]
+                yield prefix + fn, mtime, size
+            stack.extend(reversed([prefix + d for d in subdirs]))
+
+    def _cached(self, store, read, entries):
+        missing = [rel_path for rel_path, mtime, size in entries
+                   if store.get(rel_path, (None, None))[:2] != (mtime, size)]
+        if missing:
+            stats = {rel_path: (mtime, size) for rel_path, mtime, size in entries}
+            for rel_path, value in read(self.root, missing, self.workers).items():
+                store[rel_path] = stats[rel_path] + (value,)
+        return {rel_path: store[rel_path][2] for rel_path, _, _ in entries}
+
+    def _heads(self, entries):
+        def read(root, rel_paths, workers):
+            return {rel_path: guard_text(head) for rel_path, head in read_heads(root, rel_paths, workers).items()}
+        return self._cached(self.heads, read, entries)
+
+    def _checksums(self, entries):
+        return self._cached(self.checksums, read_checksums, entries)
+
+    def render(self, max_bytes: int = 60_000, goal: str = None) -> str:
+        """
+        The summarize_repo text: one "path (size bytes, crc xxxxxxxx)" line
+        per file and the heads of the files most relevant to `goal`, capped
+        by max_bytes (see scanner.render_summary).
+        """
+        key = (max_bytes, goal)
+        cached = self._rendered.get(key)
+        if cached is not None:
+            return cached
+        text = render_summary(list(self.entries()), max_bytes, goal, self._heads,
+                              scores=self.scores.setdefault(goal, {}), checksums=self._checksums)
+        self._rendered[key] = text
+        return text
+
+
+def summarize_repo(root: str, max_bytes: int = 60_000, goal: str = None) -> str:
+    """
+    Returns a compact text summary of the repo (paths + small file heads)
+    capped by max_bytes. Skips common noise and whatever .gitignore excludes.
+    """
+    return RepoSnapshot(root).render(max_bytes, goal)
@@ -0,0 +1,151 @@
+import os
+import uuid
+import shutil
+from typing import Any, Dict, List, Optional
+
+from actions import Action
+from checkpoints import clone_file
+from config import CHECKPOINT_DIR
+from file_reads import read_file
+from patching import write_file
+from telemetry import telemetry
+from injection import guard_read
+
+DELETED = "deleted"  # whiteout: the path is deleted in the overlay
+WRITTEN = "written"
+
+
+class Speculation:
+    '''
+    Runs the actions of a turn in an overlay of the repo while they are
+    still being evaluated, so the work is done by the time verdicts arrive.
+
+    The overlay lives in <repo>/.agent-eval/overlay/<id> and only holds the
+    paths the turn touches: a written file is cloned (reflink where
+    possible) from the repo and changed there, a deleted one gets a
+    whiteout. Reads see the overlay first, then the repo.
+
+    `finish(verdicts)` then settles each path: if every action on it was
+    approved, the overlay file is moved into the repo with os.replace (or
+    the file is removed) and the speculative results are kept. If any was
+    declined, the path's overlay is dropped and its approved actions are
+    executed for real, since they may have built on the declined one.
+    '''
+    def __init__(self, action_agent, actions: List[Any], executor):
+        self.agent = action_agent
+        self.actions = actions
+        self.repo_root = os.path.abspath(action_agent.repo_root)
+        self.dir = os.path.join(self.repo_root, CHECKPOINT_DIR, "overlay", uuid.uuid4().hex[:12])
+        self.state: Dict[str, str] = {}  # real rel path -> WRITTEN | DELETED
+        self.results: List[Optional[Dict[str, Any]]] = [None] * len(actions)
+        self.groups: Dict[str, List[int]] = {}
+        for i, res in enumerate(actions):
+            if res.action_type != "COMPLETED":
+                self.groups.setdefault(action_agent.path_key(res.target), []).append(i)
+        self.futures = [executor.submit(self._run_group, indices) for indices in self.groups.values()]
+
+    def _run_group(self, indices: List[int]) -> None:
+        for i in indices:
+            try:
+                self.results[i] = self._run(self.actions[i])
+            except Exception as e:
+                self.results[i] = {"ok": False, "error": str(e)}
+
+    def _run(self, res) -> Dict[str, Any]:
+        try:
+            action = Action[res.action_type]
+        except KeyError:
+            return {"ok": False, "error": f"Unknown action_type: {res.action_type}"}
+        self.agent.safe_join(self.repo_root, res.target)
+        rel = self._key(res.target)
+        src = os.path.join(self.repo_root, rel)
+        staged = os.path.join(self.dir, rel)
+        state = self.state.get(rel)
+        exists = os.path.isfile(staged) if state == WRITTEN else state != DELETED and os.path.exists(src)
+
+        if action == Action.OPEN_FILE:
+            if not exists:
+                return {"ok": False, "error": "File does not exist"}
+            path = staged if state == WRITTEN else src
+            return guard_read({"ok": True, "action": action, "target": res.target, **read_file(path, res.read)})
+
+        if action == Action.WRITE_FILE:
+            if state != WRITTEN:
+                os.makedirs(os.path.dirname(staged), exist_ok=True)
+                if exists:
+                    clone_file(src, staged)
+            result = write_file(staged, res.contents_or_diff)
+            if result["ok"]:
+                self.state[rel] = WRITTEN
+            elif state != WRITTEN and os.path.exists(staged):
+                os.remove(staged)
+            return {"ok": result.pop("ok"), "action": action, "target": res.target, **result}
+
+        if action == Action.DELETE_FILE:
+            if not exists:
+                return {"ok": False, "error": "File does not exist"}
+            if state == WRITTEN:
+                os.remove(staged)
+            self.state[rel] = DELETED
+            return {"ok": True, "action": action, "target": res.target}
+
+        return {"ok": False, "error": f"Unknown action_type: {action}"}
+
+    def finish(self, verdicts) -> List[Optional[Dict[str, Any]]]:
+        """
+        Commit or discard the overlay given the verdicts. Returns results
+        aligned with the actions, None where nothing was executed.
+        """
+        for f in self.futures:
+            f.result()
+        results: List[Optional[Dict[str, Any]]] = [None] * len(self.actions)
+        try:
+            for key, indices in self.groups.items():
+                approved = [i for i in indices if verdicts[i].approved]
+                if not approved:
+                    telemetry.count("speculation_total", outcome="discarded")
+                    continue
+                if len(approved) == len(indices):
+                    self._commit(key)
+                    for i in indices:
+                        results[i] = self.results[i]
+                        telemetry.record_file_io(results[i])
+                    telemetry.count("speculation_total", outcome="committed")
+                else:
+                    for i in approved:
+                        res = self.actions[i]
+                        try:
+                            action = Action[res.action_type]
+                        except KeyError:
+                            results[i] = {"ok": False, "error": f"Unknown action_type: {res.action_type}"}
+                            continue
+                        results[i] = self.agent.execute_action(action=action, target=res.target,
+                                                               payload=res.contents_or_diff, read=res.read)
+                    telemetry.count("speculation_total", outcome="replayed")
+        finally:
+            shutil.rmtree(self.dir, ignore_errors=True)
+        return results
+
+    def _key(self, target: str) -> str:
+        """
+        The real repo-relative path of a target, which keys the overlay
+        state and files as well as the groups, so a file and a symlink to it
+        share one staged copy.
+        """
+        rel = self.agent.path_key(target)
+        if rel == os.pardir or rel.startswith(os.pardir + os.sep):
+            raise ValueError("Unsafe path detected")
+        return rel
+
+    def _commit(self, rel: str) -> None:
+        state = self.state.get(rel)
+        if state is None:
+            return  # never staged
+        src = os.path.join(self.repo_root, rel)
+        self.agent._capture(src)
+        if state == WRITTEN:
+            os.makedirs(os.path.dirname(src), exist_ok=True)
+            os.replace(os.path.join(self.dir, rel), src)
+        elif os.path.exists(src):
+            os.remove(src)
+        self.agent._mark_dirty(self.repo_root, src)
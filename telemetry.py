@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import functools
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Any, Dict, Optional, Tuple
+
+from config import TELEMETRY_ENABLED, TRACE_PATH
+
+PREFIX = "agent_eval_"
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+_current_span = contextvars.ContextVar("agent_eval_span", default=None)
+
+
+def _labels(labels: Dict[str, Any]) -> Tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def escape_label(value: Any) -> str:
+    """
+    A label value in the Prometheus text format: backslash, double quote
+    and newline escaped.
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Telemetry:
+    '''
+    In-process spans and metrics for the gate loop.
+
+    Counters and latency histograms are plain dicts behind one lock, so
+    recording costs a few microseconds and can stay on in production. Spans
+    nest through a context variable and, when `trace_path` is set, each
+    finished span is appended to that file as one JSON line. Metrics are
+    exposed in the Prometheus text format by `render_prometheus`, which
+    `serve_metrics` puts behind a small HTTP endpoint.
+    '''
+    def __init__(self, trace_path: str = None, enabled: bool = True):
+        self.enabled = enabled
+        self.trace_path = trace_path
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.histograms: Dict[Tuple[str, Tuple], list] = {}  # -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        self._trace_file = None
+        self._server = None
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        if not self.enabled:
+            return
+        key = (name, _labels(labels))
+        with self._lock:
+            h = self.histograms.get(key)
+            if h is None:
+                h = self.histograms[key] = [0] * (len(LATENCY_BUCKETS) + 2)
+            i = bisect.bisect_left(LATENCY_BUCKETS, seconds)
+            if i < len(LATENCY_BUCKETS):
+                h[i] += 1
+            h[-2] += seconds
+            h[-1] += 1
+
+    @contextmanager
+    def span(self, name: str, **attrs):
+        """
+        Time a phase of the loop. Yields a dict of attributes that the body
+        may add to (e.g. token counts); they are written with the trace.
+        """
+        if not self.enabled:
+            yield attrs
+            return
+        parent = _current_span.get()
+        span = {
+            "trace": parent["trace"] if parent else uuid.uuid4().hex[:16],
+            "span": uuid.uuid4().hex[:8],
+            "parent": parent["span"] if parent else None,
+            "name": name,
+        }
+        token = _current_span.set(span)
+        start = time.time()
+        t = time.perf_counter()
+        error = None
+        try:
+            yield attrs
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            duration = time.perf_counter() - t
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # resumed from another context, e.g. a generator driven elsewhere
+                _current_span.set(parent)
+            self.observe("span_seconds", duration, span=name)
+            if self.trace_path:
+                record = dict(span, start=start, duration_ms=round(duration * 1e3, 3), **attrs)
+                if error:
+                    record["error"] = error
+                self._write(record)
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self._trace_file is None:
+                os.makedirs(os.path.dirname(os.path.abspath(self.trace_path)), exist_ok=True)
+                self._trace_file = open(self.trace_path, "a", encoding="utf-8", buffering=1)
+            self._trace_file.write(line)
+
+    def record_usage(self, model: str, response, attrs: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Count the tokens reported in a response's usage_metadata, if any.
+        """
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return
+        for kind, field in (("prompt", "prompt_token_count"), ("output", "candidates_token_count"),
+                            ("cached", "cached_content_token_count")):
+            n = getattr(usage, field, None)
+            if n:
+                self.count("model_tokens_total", n, model=model, kind=kind)
+                if attrs is not None:
+                    attrs[f"{kind}_tokens"] = n
+
+    def record_verdicts(self, actions, verdicts) -> None:
+        for res, res_eval in zip(actions, verdicts):
+            self.count("verdicts_total", action=res.action_type, decision=res_eval.decision, rule=res_eval.rule,
+                       cached=res_eval.cached)
+
+    def record_file_io(self, result: Dict[str, Any]) -> None:
+        """
+        Count the file bytes an executed action read or wrote.
+        """
+        if not result.get("ok"):
+            return
+        if isinstance(result.get("content"), str):
+            self.count("file_bytes_total", len(result["content"].encode("utf-8")), op="read")
+        if result.get("bytes_written") is not None:
+            self.count("file_bytes_total", result["bytes_written"], op="written")
+
+    def traced(self, name: str):
+        """
+        Decorator form of span() for whole functions.
+        """
+        def wrap(fn):
+            @functools.wraps(fn)
+            def inner(*args, **kwargs):
+                with self.span(name):
+                    return fn(*args, **kwargs)
+            return inner
+        return wrap
+
+    def render_prometheus(self) -> str:
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{escape_label(v)}"' for k, v in pairs) + "}"
+
+        with self._lock:
+            counters = dict(self.counters)
+            histograms = {k: list(v) for k, v in self.histograms.items()}
+        lines = []
+        for name in sorted({n for n, _ in counters}):
+            lines.append(f"# TYPE {PREFIX}{name} counter")
+            for (n, labels), value in sorted(counters.items()):
+                if n == name:
+                    lines.append(f"{PREFIX}{name}{fmt(labels)} {value}")
+        for name in sorted({n for n, _ in histograms}):
+            lines.append(f"# TYPE {PREFIX}{name} histogram")
+            for (n, labels), h in sorted(histograms.items()):
+                if n != name:
+                    continue
+                cumulative = 0
+                for bound, c in zip(LATENCY_BUCKETS, h):
+                    cumulative += c
+                    lines.append(f"{PREFIX}{name}_bucket{fmt(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{PREFIX}{name}_bucket{fmt(labels, [('le', '+Inf')])} {h[-1]}")
+                lines.append(f"{PREFIX}{name}_sum{fmt(labels)} {h[-2]}")
+                lines.append(f"{PREFIX}{name}_count{fmt(labels)} {h[-1]}")
+        return "\n".join(lines) + "\n"
+
+    def serve_metrics(self, port: int, host: str = "127.0.0.1"):
+        """
+        Serve render_prometheus() on http://host:port/metrics from a daemon
+        thread. Calling it again returns the running server.
+        """
+        if self._server is not None:
+            return self._server
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = telemetry.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True, name="metrics").start()
+        return self._server
+
+    def close(self) -> None:
+        with self._lock:
+            if self._trace_file is not None:
+                self._trace_file.close()
+                self._trace_file = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
+
+
+# process-wide instance used by the loop, the agents and the backends
+telemetry = Telemetry(trace_path=TRACE_PATH, enabled=TELEMETRY_ENABLED)
@@ -0,0 +1,56 @@
+import pytest
+
+from backends import GeminiBackend
+from tests.fake_server import FakeGeminiServer
+
+
+def propose(action_type, target="", contents="", rationale="r"):
+    return {"name": "propose_action", "args": {"action_type": action_type, "target": target,
+                                               "contents_or_diff": contents, "rationale": rationale}}
+
+
+def evaluate(decision="approve", rationale="ok", **extra):
+    return {"name": "evaluate_action", "args": dict(decision=decision, rationale=rationale, **extra)}
+
+
+@pytest.fixture
+def gemini(monkeypatch):
+    """
+    start(script) -> (FakeGeminiServer, GeminiBackend talking to it).
+    """
+    servers = []
+
+    def start(script):
+        server = FakeGeminiServer(script).start()
+        servers.append(server)
+        monkeypatch.setenv("GOOGLE_GEMINI_BASE_URL", server.url)
+        # llm_client keeps one client per key, so each server gets its own
+        return server, GeminiBackend(api_key=f"test-key-{len(servers)}-{id(server)}")
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = tmp_path / "repo"
+    root.mkdir()
+    (root / "a.txt").write_text("hi\n")
+    (root / "b.py").write_text("def parse_diff(text):\n    return text.splitlines()\n")
+    (root / "uv.lock").write_text("lock\n")
+    return root
+
+
+def role_script(action_steps, eval_steps):
+    """
+    A fake-server script that answers by role rather than by model name,
+    since the fast eval route and the action agent share a model.
+    """
+    its = {"action": iter(action_steps), "eval": iter(eval_steps)}
+
+    def script(model, body):
+        role = "eval" if "proposed action by the agent" in str(body) else "action"
+        return next(its[role], {"text": "(script exhausted)"})
+
+    return script
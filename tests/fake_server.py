@@ -0,0 +1,120 @@
+import json
+import threading
+import itertools
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeGeminiServer:
+    '''
+    Local stand-in for the Gemini REST API, for tests that go through the
+    real google.genai client (point it here with GOOGLE_GEMINI_BASE_URL).
+
+    Serves generateContent, streamGenerateContent (SSE) and cachedContents
+    create/delete. Replies come from `script`: a list of steps, a dict of
+    lists keyed by model name, or a callable (model, request_body) -> step,
+    where a step is {"text": ..., "function_calls": [{"name", "args"}]}.
+    Every request is kept in `requests` as (method, path, body).
+    '''
+    def __init__(self, script):
+        self.script = script
+        self.requests = []
+        self.caches = {}
+        self._iters = {}
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def start(self) -> "FakeGeminiServer":
+        self._thread.start()
+        return self
+
+    def close(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def calls(self, kind: str):
+        return [r for r in self.requests if r[1].endswith(":" + kind)]
+
+    def _next_step(self, model, body):
+        with self._lock:
+            if callable(self.script):
+                return self.script(model, body)
+            steps = self.script.get(model, []) if isinstance(self.script, dict) else self.script
+            it = self._iters.get(model)
+            if it is None:
+                it = self._iters[model] = itertools.cycle(steps)
+            return next(it, {"text": "(script exhausted)"})
+
+    @staticmethod
+    def _response(step, text=True, calls=True):
+        parts = []
+        if text and step.get("text"):
+            parts.append({"text": step["text"]})
+        if calls:
+            parts.extend({"functionCall": {"name": fc["name"], "args": fc.get("args", {})}}
+                         for fc in step.get("function_calls", ()))
+        return {
+            "candidates": [{"content": {"role": "model", "parts": parts}, "finishReason": "STOP"}],
+            "usageMetadata": {"promptTokenCount": 100, "candidatesTokenCount": 10, "totalTokenCount": 110},
+        }
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _send(self, code, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length) or b"{}")
+                path = self.path.split("?", 1)[0]
+                with fake._lock:
+                    fake.requests.append(("POST", path, body))
+                if path.endswith("/cachedContents"):
+                    name = f"cachedContents/fake-{next(fake._ids)}"
+                    with fake._lock:
+                        fake.caches[name] = body
+                    return self._send(200, {"name": name, "model": body.get("model")})
+                cached = body.get("cachedContent")
+                if cached is not None and cached not in fake.caches:
+                    return self._send(404, {"error": {"code": 404, "message": f"{cached} not found",
+                                                      "status": "NOT_FOUND"}})
+                model = path.rsplit("/", 1)[-1].split(":", 1)[0]
+                step = fake._next_step(model, body)
+                if path.endswith(":generateContent"):
+                    return self._send(200, fake._response(step))
+                if path.endswith(":streamGenerateContent"):
+                    self.send_response(200)
+                    self.send_header("Content-Type", "text/event-stream")
+                    self.end_headers()
+                    chunks = [fake._response(step, calls=False)] if step.get("text") else []
+                    if step.get("function_calls"):
+                        chunks.append(fake._response(step, text=False))
+                    for chunk in chunks:
+                        self.wfile.write(b"data: " + json.dumps(chunk).encode() + b"\r\n\r\n")
+                    return
+                self._send(404, {"error": {"code": 404, "message": path, "status": "NOT_FOUND"}})
+
+            def do_DELETE(self):
+                path = self.path.split("?", 1)[0]
+                with fake._lock:
+                    fake.requests.append(("DELETE", path, None))
+                    fake.caches.pop(path.split("/v1beta/", 1)[-1], None)
+                self._send(200, {})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
@@ -0,0 +1,21 @@
+from actions import ProposedAction, EvalVerdict
+from backends import ScriptedBackend
+from config import MODEL_ACTION
+from models import ActionAgent
+from tests.conftest import propose, evaluate
+
+
+def test_calls_parse_into_typed_objects(repo):
+    backend = ScriptedBackend({MODEL_ACTION: [{"text": "thinking", "function_calls": [
+        propose("open_file", "a.txt"), evaluate(),
+        {"name": "propose_action", "args": {"action_type": "WRITE_FILE", "target": None,
+                                            "contents_or_diff": "true", "extra": None}}]}]})
+    actions = ActionAgent(repo_root=str(repo), backend=backend).prompt("go")
+    assert actions == [ProposedAction("OPEN_FILE", "a.txt", "", "r"), ProposedAction("WRITE_FILE", "", "true", "")]
+
+
+def test_unreadable_decisions_decline():
+    assert EvalVerdict.from_args({"decision": "APPROVE"}).approved
+    verdict = EvalVerdict.from_args({"decision": "maybe", "rationale": None}, rule="x")
+    assert verdict.to_dict() == {"decision": "decline", "rationale": "", "rule": "x", "cached": False,
+                                 "confidence": None, "route": None}
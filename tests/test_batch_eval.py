@@ -0,0 +1,42 @@
+import json
+import os
+
+from backends import ScriptedBackend
+from batch_eval import load_goals, make_workspace, run_batch
+from config import CHECKPOINT_DIR
+from tests.conftest import propose, evaluate
+
+
+def test_workspace_copies_the_repo_without_noise_dirs(repo, tmp_path):
+    for name in (".git/HEAD", "node_modules/m.js", "src/__pycache__/x.pyc", "src/ok.py",
+                 f"{CHECKPOINT_DIR}/index.sqlite"):
+        os.makedirs(repo / os.path.dirname(name), exist_ok=True)
+        (repo / name).write_text("x\n")
+    dest = make_workspace(str(repo), str(tmp_path / "ws"))
+    copied = sorted(os.path.relpath(os.path.join(d, f), dest) for d, _, files in os.walk(dest) for f in files)
+    assert copied == ["a.txt", "b.py", os.path.join("src", "ok.py"), "uv.lock"]
+    (tmp_path / "ws" / "a.txt").write_text("changed\n")
+    assert (repo / "a.txt").read_text() == "hi\n"
+
+
+def test_load_goals_defaults_ids_and_goal(tmp_path):
+    path = tmp_path / "goals.jsonl"
+    path.write_text(json.dumps({"goal": "a"}) + "\n\n" + json.dumps({"id": "x", "prompt": "b"}) + "\n")
+    assert [(j["id"], j["goal"]) for j in load_goals(str(path))] == [("0", "a"), ("x", "b")]
+
+
+def test_batch_reports_one_row_per_goal(repo, tmp_path):
+    goals = tmp_path / "goals.jsonl"
+    goals.write_text(json.dumps({"id": "one", "goal": "write c.txt"}) + "\n" + json.dumps({"goal": "again"}) + "\n")
+    report = tmp_path / "report.jsonl"
+    backend = ScriptedBackend({
+        "action": [{"function_calls": [propose("OPEN_FILE", "a.txt"), propose("WRITE_FILE", "c.txt", "1")]},
+                   {"function_calls": [propose("COMPLETED")]}],
+        "eval": [{"function_calls": [evaluate(confidence=0.9)]}],
+    })
+    assert run_batch(str(goals), str(report), repo_root=str(repo), workers=2, work_dir=str(tmp_path / "work"),
+                     cache_path=None, backend=backend) == 2
+    rows = sorted((json.loads(line) for line in report.read_text().splitlines()), key=lambda r: r["id"])
+    assert [(r["id"], r["verdict"], r["turns"]) for r in rows] == [("1", "completed", 2), ("one", "completed", 2)]
+    assert all(r["stop"]["turns"] == 2 and r["last_decision"]["decision"] == "approve" for r in rows)
+    assert os.listdir(tmp_path / "work") == [] and not (repo / "c.txt").exists()
@@ -0,0 +1,38 @@
+from actions import ProposedAction
+from backends import ScriptedBackend
+from bench import bench_imports, bench_loop
+from config import MODEL_ACTION
+from models import ActionAgent, EvalAgent
+from tests.conftest import propose, evaluate
+
+
+def test_scripted_backend_replays_per_model():
+    backend = ScriptedBackend({"a": [{"text": "1"}, {"text": "2"}], "b": [{"function_calls": [
+        {"name": "f", "args": {"x": 1}}]}]}, cycle=False)
+    assert [backend.generate("a", [], None).text for _ in range(3)] == ["1", "2", "(script exhausted)"]
+    response = backend.generate("b", [], None)
+    assert [(fc.name, fc.args) for fc in response.function_calls] == [("f", {"x": 1})]
+    assert response.candidates[0].content.parts[0].function_call.name == "f"
+    assert backend.calls == 4
+
+
+def test_scripts_keyed_by_role_when_agents_share_a_model(repo):
+    backend = ScriptedBackend({"action": [{"function_calls": [propose("OPEN_FILE", "a.txt")]}],
+                               "eval": [{"function_calls": [evaluate("decline", "no")]}]})
+    action_agent = ActionAgent(repo_root=str(repo), backend=backend)
+    eval_agent = EvalAgent("goal", backend=backend)
+    for _ in range(2):
+        assert [a.target for a in action_agent.prompt("read a.txt")] == ["a.txt"]
+        verdicts = eval_agent.prompt(ProposedAction("WRITE_FILE", "c.txt", "x"), model=MODEL_ACTION)
+        assert [v.decision for v in verdicts] == ["decline"]
+
+
+def test_loop_bench_runs_every_step():
+    row = bench_loop(n_files=50, n_steps=12, latency=0.0)
+    assert row["turns"] == 13
+
+
+def test_entry_points_import_no_sdk_up_front():
+    rows = {row["target"]: row for row in bench_imports(repeats=1)}
+    for target in ("cli", "loop", "batch"):
+        assert rows[target]["error"] is None and rows[target]["heavy_modules"] == [], rows[target]
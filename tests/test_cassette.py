@@ -0,0 +1,29 @@
+import pytest
+
+from backends import CassetteBackend, CassetteMiss, ScriptedBackend
+from config import MODEL_ACTION, MODEL_EVAL
+from main_loop import evaluate_prompt
+from tests.conftest import propose, evaluate
+
+
+def session(repo, backend):
+    return [e.to_dict() for e in evaluate_prompt("write c.txt", repo_root=str(repo), backend=backend, max_turns=3)]
+
+
+def test_replay_serves_a_recorded_session_offline(repo, tmp_path):
+    path = str(tmp_path / "cassette.jsonl")
+    scripted = ScriptedBackend({
+        MODEL_ACTION: [{"text": "writing", "function_calls": [propose("WRITE_FILE", "c.txt", "1")]},
+                       {"function_calls": [propose("COMPLETED")]}],
+        MODEL_EVAL: [{"function_calls": [evaluate()]}],
+    })
+    recorder = CassetteBackend(scripted, path, "record")
+    recorded = session(repo, recorder)
+    assert recorder.stats["recorded"] == scripted.calls > 0
+
+    (repo / "c.txt").unlink()
+    player = CassetteBackend(None, path, "replay")
+    assert session(repo, player) == recorded
+    assert player.stats["replayed"] == scripted.calls and (repo / "c.txt").read_text() == "1"
+    with pytest.raises(CassetteMiss):
+        player.generate(MODEL_EVAL, ["never recorded"], None)
@@ -0,0 +1,54 @@
+import os
+
+from actions import ProposedAction
+from checkpoints import CheckpointStore
+from policy import PolicyEngine
+
+
+def test_rollback_restores_writes_and_deletes(repo):
+    store = CheckpointStore(str(repo))
+    first = store.begin("turn 1")
+    store.capture(str(repo / "a.txt"))
+    (repo / "a.txt").write_text("changed\n")
+    store.capture(str(repo / "new.txt"))
+    (repo / "new.txt").write_text("new\n")
+    store.begin("turn 2")
+    store.capture(str(repo / "b.py"))
+    os.remove(repo / "b.py")
+
+    assert store.rollback(first) == ["a.txt", "b.py", "new.txt"]
+    assert (repo / "a.txt").read_text() == "hi\n"
+    assert (repo / "b.py").exists() and not (repo / "new.txt").exists()
+    assert store.order == [first]
+
+
+def test_objects_do_not_share_the_live_inode(repo):
+    store = CheckpointStore(str(repo))
+    cid = store.begin()
+    path = repo / "a.txt"
+    store.capture(str(path))
+    # an in-place edit after the capture, e.g. after a failed write or by an editor
+    with open(path, "r+") as f:
+        f.write("XX")
+    assert store.stats["cloned"] + store.stats["copied"] == 1
+    store.rollback(cid)
+    assert path.read_text() == "hi\n"
+
+
+def test_identical_contents_are_stored_once(repo):
+    (repo / "c.txt").write_text("hi\n")
+    store = CheckpointStore(str(repo))
+    store.begin()
+    store.capture(str(repo / "a.txt"))
+    store.capture(str(repo / "c.txt"))
+    assert store.stats["deduplicated"] == 1
+    assert not [n for n in os.listdir(store.store_dir) if n.endswith(".tmp")]
+    store.discard()
+    assert store.gc() == 0
+
+
+def test_agent_cannot_touch_the_store(repo):
+    engine = PolicyEngine(repo_root=str(repo))
+    for action in ("WRITE_FILE", "DELETE_FILE"):
+        verdict = engine.decide(ProposedAction(action, ".agent-eval/checkpoints/x.json", "{}"))
+        assert verdict.decision == "decline"
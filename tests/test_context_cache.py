@@ -0,0 +1,150 @@
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from actions import ProposedAction
+from backends import ScriptedBackend, ModelBackend
+from context_cache import ContextCacheManager
+from models import EvalAgent
+from routing import Route, Router
+
+
+def test_prefix_is_registered_once_and_dropped_on_close():
+    backend = ScriptedBackend([{"text": "ok"}])
+    manager = ContextCacheManager(backend, min_chars=10)
+    prefix = ["x" * 20]
+    handle = manager.get("action", "m", prefix, ["contents"], [], None)
+    assert backend.caches[handle]["contents"] == ["contents"]
+    assert manager.get("action", "m", prefix, ["contents"], [], None) == handle
+    assert manager.get("eval", "m", ["short"], [], [], None) is None
+    assert manager.stats == {"created": 1, "reused": 1, "invalidated": 0, "inline": 1, "errors": 0}
+    manager.close()
+    assert backend.caches == {}
+
+
+def test_refused_prefixes_are_sent_inline():
+    manager = ContextCacheManager(ModelBackend(), min_chars=10)
+    assert manager.get("eval", "m", ["x" * 20], [], [], None) is None
+    assert manager.get("eval", "m", ["x" * 20], [], [], None) is None
+    assert manager.stats["created"] == 0 and manager.stats["inline"] == 2
+
+
+def test_scripted_handles_are_never_reissued():
+    backend = ScriptedBackend([])
+    first = backend.create_cache("m", [], [], None, 60)
+    second = backend.create_cache("m", [], [], None, 60)
+    backend.delete_cache(first)
+    third = backend.create_cache("m", [], [], None, 60)
+    assert len({first, second, third}) == 3
+    assert set(backend.caches) == {second, third}
+    with pytest.raises(KeyError):
+        backend.generate("m", [], SimpleNamespace(cached_content=first))
+
+
+def test_cache_reused_until_prefix_changes():
+    backend = ScriptedBackend([{"text": "ok"}])
+    manager = ContextCacheManager(backend, min_chars=10)
+    prefix = ["x" * 20]
+    handle = manager.get("eval", "m", prefix, [], [], None)
+    assert manager.get("eval", "m", prefix, [], [], None) == handle
+    manager.release(handle)
+    manager.release(handle)
+    changed = manager.get("eval", "m", ["y" * 20], [], [], None)
+    assert changed != handle and handle not in backend.caches
+    assert manager.get("eval", "m", ["short"], [], [], None) is None
+    assert manager.stats["created"] == 2 and manager.stats["reused"] == 1
+    manager.close()
+    assert backend.caches == {}
+
+
+def test_replaced_cache_waits_for_its_requests():
+    backend = ScriptedBackend([{"text": "ok"}])
+    manager = ContextCacheManager(backend, min_chars=10)
+    handle = manager.get("eval", "m", ["x" * 20], [], [], None)
+    changed = manager.get("eval", "m", ["y" * 20], [], [], None)
+    assert handle in backend.caches  # still in flight
+    backend.generate("m", [], SimpleNamespace(cached_content=handle))
+    manager.release(handle)
+    assert handle not in backend.caches and changed in backend.caches
+    manager.release(changed)
+    assert changed in backend.caches  # the current cache stays for the next call
+
+
+class CountingBackend(ScriptedBackend):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.created = 0
+        self.deleted = 0
+
+    def create_cache(self, model, contents, tools, tool_config, ttl):
+        self.created += 1
+        return super().create_cache(model, contents, tools, tool_config, ttl)
+
+    def delete_cache(self, handle):
+        self.deleted += 1
+        super().delete_cache(handle)
+
+
+def test_eval_routes_keep_their_own_caches(repo):
+    def script(model, contents):
+        confidence = 0.5 if model == "fast-model" else 0.9
+        return {"function_calls": [{"name": "evaluate_action", "args": {
+            "decision": "approve", "rationale": "ok", "confidence": confidence}}]}
+
+    backend = CountingBackend(script, latency=0.005)
+    manager = ContextCacheManager(backend, min_chars=0)
+    router = Router([Route("fast", "fast-model", 0.8), Route("strong", "strong-model")], escalate_actions=(),
+                    sensitive_paths=(), repo_root=str(repo))
+    agent = EvalAgent("goal", backend=backend, context_cache=manager, router=router)
+    agent.current_state = "repo"
+    actions = [ProposedAction("WRITE_FILE", f"f{i}.txt", "x") for i in range(10)]
+    errors = []
+
+    def run(res):
+        try:
+            assert agent.decide(res).route == "strong"
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(res,)) for res in actions]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert backend.created == 2 and backend.deleted == 0
+    assert backend.cached_calls == 20
+    manager.close()
+    assert backend.caches == {}
+
+
+def test_create_cache_runs_outside_the_manager_lock():
+    started, finish = threading.Event(), threading.Event()
+
+    class SlowBackend(CountingBackend):
+        def create_cache(self, model, contents, tools, tool_config, ttl):
+            if model == "slow":
+                started.set()
+                assert finish.wait(5)
+            return super().create_cache(model, contents, tools, tool_config, ttl)
+
+    backend = SlowBackend([{"text": "ok"}])
+    manager = ContextCacheManager(backend, min_chars=10)
+    handles = []
+    threads = [threading.Thread(target=lambda: handles.append(manager.get("eval", "slow", ["x" * 20], [], [], None)))
+               for _ in range(2)]
+    threads[0].start()
+    assert started.wait(5)
+    threads[1].start()
+    # another slot is served, and leases are returned, while "slow" is being created
+    other = manager.get("action", "m", ["y" * 20], [], [], None)
+    manager.release(other)
+    assert other in backend.caches and backend.created == 1
+    finish.set()
+    for t in threads:
+        t.join()
+    # the second caller of the slot waited for the first one's cache instead of making its own
+    assert handles[0] == handles[1] and backend.created == 2
+    assert manager.stats["reused"] == 1
+    manager.close()
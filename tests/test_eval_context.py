@@ -0,0 +1,45 @@
+import os
+
+from eval_context import EvalContext, parse_state, diff_states
+from snapshot import RepoSnapshot
+
+
+def state(**files):
+    return "\n".join(f"{path} ({size} bytes)" for path, size in files.items())
+
+
+def test_diff_lists_added_removed_and_resized_files():
+    old = parse_state(state(a=1, b=2, c=3))
+    assert old == {"a": (1, None), "b": (2, None), "c": (3, None)}
+    assert diff_states(old, parse_state(state(a=1, b=5, d=4))) == "+ d (4 bytes)\n- c\n~ b (2 -> 5 bytes)"
+
+
+def test_same_size_rewrites_show_up_in_the_diff(repo):
+    snapshot = RepoSnapshot(str(repo))
+    before = snapshot.render()
+    assert parse_state(before)["a.txt"][0] == 3
+    (repo / "a.txt").write_text("ho\n")
+    os.utime(repo / "a.txt", ns=(0, os.stat(repo / "a.txt").st_mtime_ns + 1))
+    snapshot.mark_dirty(str(repo / "a.txt"))
+    snapshot.refresh()
+    after = snapshot.render()
+    assert diff_states(parse_state(before), parse_state(after)) == "~ a.txt (3 bytes, edited)"
+    context = EvalContext("goal", template="{goal}|{repo}", step_template="{changes}|{action}")
+    context.render(before, "act")
+    assert "~ a.txt (3 bytes, edited)" in context.render(after, "act")[1]
+    # only the content counts: touching a file leaves its line alone
+    os.utime(repo / "a.txt", ns=(0, os.stat(repo / "a.txt").st_mtime_ns + 1))
+    snapshot.mark_dirty(str(repo / "a.txt"))
+    snapshot.refresh()
+    assert snapshot.render() == after
+
+
+def test_prefix_is_stable_until_the_diff_outgrows_the_base():
+    context = EvalContext("goal", template="{goal}|{repo}", step_template="{changes}|{action}")
+    base = state(**{f"file{i}.py": i for i in range(20)})
+    prefix, step = context.render(base, "act")
+    assert prefix == "goal|" + base and "unchanged" in step
+    again, step = context.render(base + "\nnew.py (1 bytes)", "act")
+    assert again == prefix and "+ new.py (1 bytes)" in step
+    rebased, step = context.render(state(other=1), "act")
+    assert rebased == "goal|other (1 bytes)" and context.rebases == 2 and "unchanged" in step
@@ -0,0 +1,66 @@
+import pytest
+
+from file_reads import read_file
+
+
+def lines_file(tmp_path, n=5):
+    path = tmp_path / "f.txt"
+    path.write_text("".join(f"line {i}\n" for i in range(1, n + 1)))
+    return str(path)
+
+
+def test_byte_and_line_ranges(tmp_path):
+    path = lines_file(tmp_path)
+    assert read_file(path, {"start_byte": 7, "end_byte": 14})["content"] == "line 2\n"
+    result = read_file(path, {"start_line": 2, "end_line": 3})
+    assert result["content"] == "line 2\nline 3\n" and result["range"] == [7, 21]
+    assert read_file(path, {"start_line": 5})["content"] == "line 5\n"
+    assert read_file(path, {"start_line": 9})["content"] == ""
+    assert read_file(path, {"start_line": 2, "end_line": 0})["content"] == ""
+    assert read_file(path, {"start_byte": 3, "end_byte": 1})["content"] == ""
+
+
+def test_head_tail_and_grep(tmp_path):
+    path = lines_file(tmp_path)
+    assert read_file(path, {"head": 2})["content"] == "line 1\nline 2\n"
+    assert read_file(path, {"tail": 2})["content"] == "line 4\nline 5\n"
+    assert read_file(path, {"tail": 9})["content"] == read_file(path)["content"]
+    result = read_file(path, {"grep": r"[24]$"})
+    assert (result["content"], result["matches"], result["truncated"]) == ("2:line 2\n4:line 4\n", 2, False)
+    assert read_file(path, {"grep": "line"}, max_matches=3)["truncated"]
+
+
+def test_zero_line_reads_are_empty(tmp_path):
+    path = lines_file(tmp_path)
+    for read in ({"head": 0}, {"tail": 0}):
+        result = read_file(path, read)
+        assert (result["content"], result["truncated"]) == ("", False), read
+
+
+def test_grep_edge_cases(tmp_path):
+    path = lines_file(tmp_path, n=3)
+    # "^" also matches after the final newline, where there is no line
+    assert read_file(path, {"grep": "^"})["content"] == "1:line 1\n2:line 2\n3:line 3\n"
+    assert read_file(path, {"grep": "^$"})["matches"] == 0
+    unterminated = tmp_path / "g.txt"
+    unterminated.write_text("a\n\nb")
+    assert read_file(str(unterminated), {"grep": "^"})["content"] == "1:a\n2:\n3:b\n"
+    for pattern in (r"(a+)+$", r"(\w+\s?)*x", r"((ab)*)+"):
+        with pytest.raises(ValueError):
+            read_file(path, {"grep": pattern})
+    assert read_file(path, {"grep": r"(?:line )+\d"})["matches"] == 3
+
+
+def test_grep_scans_a_bounded_prefix(tmp_path):
+    path = lines_file(tmp_path, n=100)
+    result = read_file(path, {"grep": "line"}, max_scan=21)
+    assert (result["matches"], result["truncated"]) == (3, True)
+
+
+def test_caps_and_binary_files(tmp_path):
+    path = lines_file(tmp_path, n=100)
+    result = read_file(path, max_bytes=10)
+    assert (result["content"], result["truncated"], result["size"]) == ("line 1\nlin", True, 792)
+    binary = tmp_path / "b.bin"
+    binary.write_bytes(b"\x89PNG\0\0\xff")
+    assert read_file(str(binary)) == {"size": 7, "binary": True, "content": "<binary file, 7 bytes>"}
@@ -0,0 +1,184 @@
+import os
+import json
+import threading
+import urllib.error
+import urllib.request
+
+import pytest
+
+import main_loop
+from backends import RateLimitedBackend, CassetteBackend, ScriptedBackend, find_backend
+from config import MODEL_ACTION, MODEL_EVAL
+from gate_service import GateService, Job, QueueFull, Scheduler
+from tests.conftest import propose, evaluate
+
+
+def job(tenant, repo="r"):
+    return Job(id=f"{tenant}-{repo}", tenant=tenant, goal="g", repo_root=repo)
+
+
+def test_scheduler_is_fair_and_bounded():
+    scheduler = Scheduler(max_queued=4, tenant_max_queued=2, tenant_concurrency=1)
+    for j in (job("a", "1"), job("a", "2"), job("b", "3")):
+        scheduler.put(j)
+    with pytest.raises(QueueFull):
+        scheduler.put(job("a", "4"))
+    first = scheduler.get()
+    assert first.id == "a-1" and scheduler.get().id == "b-3"
+    # a is at its concurrency cap until its first job is done
+    assert scheduler._pick() is None
+    scheduler.done(first)
+    assert scheduler.get().id == "a-2"
+
+
+def test_one_session_per_repo_at_a_time():
+    scheduler = Scheduler()
+    scheduler.put(job("a", "same"))
+    scheduler.put(job("b", "same"))
+    running = scheduler.get()
+    assert scheduler._pick() is None
+    scheduler.done(running)
+    assert scheduler.get().tenant == "b"
+
+
+def test_post_streams_a_session(repo):
+    backend = ScriptedBackend({MODEL_ACTION: [{"function_calls": [propose("OPEN_FILE", "a.txt")]},
+                                              {"function_calls": [propose("COMPLETED")]}],
+                               MODEL_EVAL: [{"function_calls": [evaluate()]}]})
+    service = GateService(str(repo.parent), backend=backend, workers=1, tenant_rpm=6000)
+    server = service.serve(port=0)
+    try:
+        req = urllib.request.Request(f"http://127.0.0.1:{server.server_address[1]}/sessions", method="POST",
+                                     data=json.dumps({"goal": "read a.txt", "repo": "repo", "stream": True}).encode())
+        with urllib.request.urlopen(req) as resp:
+            events = [json.loads(line) for line in resp]
+        assert events[-1]["type"] == "done" and events[-1]["reason"] == "completed"
+        turn = next(e for e in events if e["type"] == "turn")
+        assert turn["results"][0]["content"] == "hi\n"
+    finally:
+        service.close()
+
+
+def session_script(model, body):
+    body = str(body)
+    if "proposed action by the agent" in body:
+        return {"function_calls": [evaluate(confidence=0.9)]}
+    if "was accepted" in body:
+        return {"function_calls": [propose("COMPLETED")]}
+    return {"function_calls": [propose("OPEN_FILE", "a.txt"), propose("OPEN_FILE", "b.py")]}
+
+
+@pytest.fixture
+def service(gemini, repo):
+    server, backend = gemini(session_script)
+    svc = GateService(str(repo.parent), backend=backend, workers=2, session_threads=2, tenant_rpm=6000)
+    yield server, svc
+    svc.close()
+
+
+def post(server, body):
+    req = urllib.request.Request(f"http://127.0.0.1:{server.server_address[1]}/sessions",
+                                 data=json.dumps(body).encode(), method="POST")
+    try:
+        with urllib.request.urlopen(req) as resp:
+            return resp.status, json.loads(resp.read())
+    except urllib.error.HTTPError as e:
+        return e.code, json.loads(e.read())
+
+
+def test_sessions_run_on_the_workers_own_pools(service, monkeypatch):
+    _, svc = service
+    threads = set()
+    execute = main_loop.execute_approved
+
+    def recording(action_agent, actions, verdicts, executor=None):
+        threads.add(threading.current_thread().name)
+        return execute(action_agent, actions, verdicts, executor)
+
+    monkeypatch.setattr(main_loop, "execute_approved", recording)
+    shared = main_loop._executor.submit
+    monkeypatch.setattr(main_loop._executor, "submit", lambda *a, **k: pytest.fail("shared pool used"))
+    jobs = [svc.submit("read a.txt", tenant=t, repo="repo", max_turns=3) for t in ("x", "y")]
+    for job in jobs:
+        list(job.follow())
+    monkeypatch.setattr(main_loop._executor, "submit", shared)
+    assert [j.status for j in jobs] == ["done", "done"]
+    assert [j.result["reason"] for j in jobs] == ["completed", "completed"]
+    assert threads and all(t.startswith("gate-worker-") for t in threads)
+
+
+def test_rate_limit_is_waited_for_before_the_pool(service, monkeypatch):
+    _, svc = service
+    waits = []
+    wait_for = RateLimitedBackend.wait_for
+    monkeypatch.setattr(RateLimitedBackend, "wait_for",
+                        lambda self, n: waits.append((threading.current_thread().name, n)) or wait_for(self, n))
+    job = svc.submit("read a.txt", tenant="x", repo="repo", max_turns=3)
+    list(job.follow())
+    assert job.status == "done"
+    assert (waits[0][1], waits[1][1]) == (1, 2)  # the action call, then the turn's two evals
+    assert all(name.startswith("gate-worker-") and "_" not in name for name, _ in waits)
+
+
+def test_wait_for_leaves_room_for_the_calls():
+    class Inner:
+        def generate(self, model, contents, config):
+            return "ok"
+
+    limiter = RateLimitedBackend(Inner(), rpm=6000, burst=2)
+    limiter.generate("m", [], None)
+    limiter.generate("m", [], None)
+    limiter.wait_for(2)
+    assert limiter.waited_s > 0
+    assert limiter._reserve() == 0.0 and limiter._reserve() == 0.0
+
+
+def test_bad_bodies_are_rejected(service):
+    _, svc = service
+    server = svc.serve(port=0)
+    for body in ({"goal": "x", "max_turns": "3"}, {"goal": "x", "max_turns": 0}, {"goal": "x", "max_turns": True},
+                 {"goal": ["x"]}, {"goal": "x", "tenant": 5}, {"goal": "x", "repo": 1},
+                 {"goal": "x", "stream": "yes"}, []):
+        code, reply = post(server, body)
+        assert code == 400 and reply["error"], body
+    assert not svc.jobs
+
+
+def test_bad_from_is_rejected(service):
+    _, svc = service
+    server = svc.serve(port=0)
+    job = svc.submit("read a.txt", tenant="x", repo="repo", max_turns=3)
+    events = list(job.follow())
+    url = f"http://127.0.0.1:{server.server_address[1]}/sessions/{job.id}/events"
+    for bad in ("-1", "x", "1.5", ""):
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(f"{url}?from={bad}")
+        assert e.value.code == 400 and json.loads(e.value.read())["error"], bad
+    with urllib.request.urlopen(f"{url}?from=1") as resp:
+        assert [line.decode().rstrip("\n") for line in resp] == events[1:]
+
+
+def test_repo_symlinks_cannot_leave_the_root(repo, tmp_path_factory):
+    outside = tmp_path_factory.mktemp("outside")
+    os.symlink(outside, repo.parent / "escape")
+    os.symlink(repo.parent, outside / "root-link")
+    svc = GateService(str(repo.parent), backend=ScriptedBackend([]), workers=0)
+    with pytest.raises(ValueError):
+        svc.resolve_repo("escape")
+    assert svc.resolve_repo("repo") == os.path.realpath(repo)
+    # a root given through a symlink still contains its own repos
+    linked = GateService(str(outside / "root-link"), backend=ScriptedBackend([]), workers=0)
+    assert linked.resolve_repo("repo") == os.path.realpath(repo)
+    svc.close()
+    linked.close()
+
+
+def test_cassette_is_not_wrapped_twice(monkeypatch, tmp_path, repo):
+    path = str(tmp_path / "c.jsonl")
+    monkeypatch.setattr(main_loop, "CASSETTE_PATH", path)
+    inner = CassetteBackend(None, path, "auto")
+    backend = RateLimitedBackend(inner, rpm=600)
+    action_agent, eval_agent, _ = main_loop.make_agents("goal", str(repo), backend)
+    assert find_backend(action_agent.backend, CassetteBackend) is inner
+    assert find_backend(action_agent.backend, RateLimitedBackend) is backend
+    assert backend.inner is inner
@@ -0,0 +1,93 @@
+import asyncio
+import threading
+
+from google.genai import types
+
+import llm_client
+from config import MODEL_ACTION, MODEL_EVAL
+from helper_functions import function_calls
+from main_loop import aevaluate_prompt
+from models import ActionAgent, EvalAgent
+from actions import ProposedAction
+from tests.conftest import propose, evaluate, role_script
+
+
+def test_sync_async_and_stream_calls_share_one_client(gemini):
+    server, backend = gemini([{"text": "ok", "function_calls": [evaluate()]}])
+    contents = [types.Content(role="user", parts=[types.Part.from_text(text="hi")])]
+    config = types.GenerateContentConfig(temperature=0)
+
+    response = backend.generate(MODEL_EVAL, contents, config)
+    assert [fc["decision"] for fc in function_calls(response, "evaluate_action")] == ["approve"]
+    response = asyncio.run(backend.agenerate(MODEL_EVAL, contents, config))
+    assert function_calls(response, "evaluate_action")
+    chunks = list(backend.generate_stream(MODEL_EVAL, contents, config))
+    assert any(function_calls(c, "evaluate_action") for c in chunks)
+    assert len(server.calls("generateContent")) == 2
+    assert len(server.calls("streamGenerateContent")) == 1
+
+
+def test_sync_and_async_calls_share_one_client(gemini):
+    server, backend = gemini([{"text": "first"}, {"text": "second"}])
+    contents = [types.Content(role="user", parts=[types.Part.from_text(text="hi")])]
+    config = types.GenerateContentConfig(temperature=0)
+    key = backend.api_key
+
+    assert llm_client.get_client(key) is llm_client.get_client(key)
+    assert backend.generate(MODEL_EVAL, contents, config).text == "first"
+    assert asyncio.run(backend.agenerate(MODEL_EVAL, contents, config)).text == "second"
+    assert [path for _, path, _ in server.calls("generateContent")] == [
+        f"/v1beta/models/{MODEL_EVAL}:generateContent"] * 2
+    assert llm_client.get_client(key) is not llm_client.get_client(key + "-other")
+
+
+def test_async_prompt_builds_request_off_the_event_loop(gemini, repo):
+    server, backend = gemini(role_script([{"function_calls": [propose("OPEN_FILE", "a.txt")]}],
+                                         [{"function_calls": [evaluate(confidence=0.9)]}]))
+    threads = []
+
+    class Recording(ActionAgent):
+        def build_request(self, *args, **kwargs):
+            threads.append(threading.get_ident())
+            return super().build_request(*args, **kwargs)
+
+    agent = Recording(repo_root=str(repo), backend=backend)
+    actions = asyncio.run(agent.aprompt("read a.txt"))
+    assert [a.target for a in actions] == ["a.txt"]
+    assert threads and threading.get_ident() not in threads
+
+
+def test_async_eval_decision(gemini, repo):
+    server, backend = gemini(role_script([], [{"function_calls": [evaluate("decline", "no")]}]))
+    agent = EvalAgent("goal", backend=backend)
+    verdict = asyncio.run(agent.adecide(ProposedAction("WRITE_FILE", "c.txt", "x")))
+    assert (verdict.decision, verdict.rule) == ("decline", "llm")
+
+
+def test_async_sessions_share_one_loop(gemini, repo, tmp_path):
+    def script(model, body):
+        body = str(body)
+        if "proposed action by the agent" in body:
+            return {"function_calls": [evaluate(confidence=0.9)]}
+        if "was accepted" in body:
+            return {"function_calls": [propose("COMPLETED")]}
+        return {"function_calls": [propose("OPEN_FILE", "a.txt"), propose("WRITE_FILE", "c.txt", "1")]}
+
+    server, backend = gemini(script)
+    other = tmp_path / "other"
+    other.mkdir()
+    (other / "a.txt").write_text("there\n")
+
+    async def run(root):
+        return [x async for x in aevaluate_prompt("write c.txt", repo_root=str(root), backend=backend,
+                                                  max_turns=5)]
+
+    async def both():
+        return await asyncio.gather(run(repo), run(other))
+
+    first, second = asyncio.run(both())
+    assert (repo / "c.txt").read_text() == "1"
+    assert (other / "c.txt").read_text() == "1"
+    assert first[-1].decision == second[-1].decision == "approve"
+    assert server.calls("generateContent")
+    assert all(MODEL_ACTION in path or MODEL_EVAL in path for _, path, _ in server.calls("generateContent"))
@@ -0,0 +1,95 @@
+from actions import ProposedAction, EvalVerdict
+from backends import ScriptedBackend
+from main_loop import evaluate_prompt, evaluate_prompt_events, turn_feedback
+from tests.conftest import propose, evaluate
+
+
+def test_every_proposed_action_in_a_turn_runs(repo):
+    backend = ScriptedBackend({
+        "action": [{"function_calls": [propose("WRITE_FILE", "c.txt", "1"), propose("WRITE_FILE", "d.txt", "d"),
+                                       propose("WRITE_FILE", "c.txt", "2")]},
+                   {"function_calls": [propose("COMPLETED")]}],
+        "eval": [{"function_calls": [evaluate()]}],
+    })
+    events = list(evaluate_prompt("write files", repo_root=str(repo), backend=backend, max_turns=3))
+    assert [e.target for e in events[::2]] == ["c.txt", "d.txt", "c.txt", ""]
+    assert [e.decision for e in events[1::2]] == ["approve"] * 4
+    # same-path actions keep their proposal order
+    assert (repo / "c.txt").read_text() == "2"
+    assert (repo / "d.txt").read_text() == "d"
+
+
+def test_events_stream_deltas_verdicts_and_done(repo):
+    backend = ScriptedBackend({
+        "action": [{"text": "reading both files", "function_calls": [propose("OPEN_FILE", "a.txt"),
+                                                                      propose("WRITE_FILE", "c.txt", "1")]},
+                   {"function_calls": [propose("COMPLETED")]}],
+        "eval": [{"text": "looks fine", "function_calls": [evaluate()]}],
+    }, chunk_chars=4)
+    events = list(evaluate_prompt_events("go", repo_root=str(repo), backend=backend, max_turns=3))
+    kinds = [(e["agent"], e["type"]) for e in events]
+    text = "".join(e["text"] for e in events if (e["agent"], e["type"]) == ("action", "text"))
+    assert text == "reading both files"
+    assert [e["args"]["target"] for e in events if (e["agent"], e["type"]) == ("action", "function_call")][:2] == [
+        "a.txt", "c.txt"]
+    verdicts = [e for e in events if e["type"] == "verdict"]
+    assert sorted(e["index"] for e in verdicts[:2]) == [0, 1]
+    assert all(e["verdict"].approved for e in verdicts)
+    assert kinds.count(("loop", "turn")) == 2
+    assert (events[-1]["type"], events[-1]["reason"]) == ("done", "completed")
+    assert (repo / "c.txt").read_text() == "1"
+
+
+def test_turn_feedback_does_not_print(capsys):
+    feedback, done = turn_feedback([ProposedAction("COMPLETED"), ProposedAction("WRITE_FILE", "x")],
+                                   [EvalVerdict("approve"), EvalVerdict("decline", "no")], [None, None])
+    assert done
+    assert "declined because: no" in feedback
+    assert capsys.readouterr().out == ""
+
+
+def test_session_events(repo, capsys):
+    def script(model, contents):
+        text = str(contents)
+        if "proposed action by the agent" in text:
+            return {"function_calls": [evaluate(confidence=0.9)]}
+        if "was accepted" in text:
+            return {"function_calls": [propose("COMPLETED")]}
+        return {"function_calls": [propose("OPEN_FILE", "a.txt"), propose("WRITE_FILE", "c.txt", "1")]}
+
+    events = list(evaluate_prompt_events("write c.txt", repo_root=str(repo), backend=ScriptedBackend(script),
+                                         max_turns=5))
+    turns = [e for e in events if e["type"] == "turn"]
+    done = events[-1]
+    assert done["type"] == "done" and done["reason"] == "completed"
+    assert turns[0]["results"][0]["content"] == "hi\n"
+    assert (repo / "c.txt").read_text() == "1"
+    assert capsys.readouterr().out == ""
+
+
+def test_same_file_under_different_spellings_runs_serially(repo):
+    import threading
+    import time
+    from models import ActionAgent
+    from main_loop import execute_approved
+
+    active, peak, order = [0], [0], []
+    lock = threading.Lock()
+
+    class Agent(ActionAgent):
+        def execute_action(self, action, target, payload="", read=None, **kwargs):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            order.append(payload)
+            with lock:
+                active[0] -= 1
+            return {"ok": True}
+
+    agent = Agent(repo_root=str(repo))
+    actions = [ProposedAction("WRITE_FILE", "a.txt", "1"), ProposedAction("WRITE_FILE", str(repo / "a.txt"), "2"),
+               ProposedAction("WRITE_FILE", "./sub/../a.txt", "3")]
+    execute_approved(agent, actions, [EvalVerdict("approve")] * 3)
+    assert peak[0] == 1 and order == ["1", "2", "3"]
+    assert agent.path_key(str(repo / "a.txt")) == agent.path_key("a.txt") == "a.txt"
@@ -0,0 +1,32 @@
+from memory import SessionMemory, compact_result, estimate_tokens
+
+
+def test_history_stays_within_the_budget():
+    memory = SessionMemory("goal", keep_recent=2, token_budget=1_000)
+    for i in range(20):
+        memory.add(f"turn {i} " + "x" * 400)
+    text = memory.render()
+    assert estimate_tokens(text) <= 1_000 and memory.sizes == [estimate_tokens(text)]
+    assert text.startswith("goal\n[") and "earlier turn(s) omitted" in text
+    assert "turn 19" in text and "turn 0 " not in text
+
+
+def test_fixed_sections_count_against_the_budget():
+    memory = SessionMemory("goal", keep_recent=2, token_budget=1_000)
+    for i in range(20):
+        memory.add(f"turn {i} " + "x" * 400)
+    full = memory.render()
+    assert estimate_tokens(full) <= 1_000
+    reserved = memory.render(reserved_tokens=800)
+    assert estimate_tokens(reserved) <= 200
+    assert memory.sizes[-1] <= 1_000 and memory.sizes[-1] >= 800
+    assert "turn 19" in reserved
+
+
+def test_old_turns_are_compacted():
+    memory = SessionMemory("goal", keep_recent=1)
+    big = {"ok": True, "content": "line\n" * 100}
+    memory.add("verbatim " + str(big), "compact " + str(compact_result(big)))
+    memory.add("latest")
+    text = memory.render()
+    assert "compact" in text and "verbatim" not in text and "sha256:" in text
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from patching import PatchConflict, apply_patch, is_unified_diff, write_file
+
+DIFF = "--- a/f.py\n+++ b/f.py\n@@ -2,3 +2,3 @@\n b\n-c\n+C\n d\n"
+
+
+def test_applies_with_offset_and_fuzz():
+    text = "x\ny\na\nb\nc\nd\ne\n"
+    new, info = apply_patch(text, DIFF)
+    assert new == "x\ny\na\nb\nC\nd\ne\n"
+    new, info = apply_patch("a\nb  \nc\nQ\n", DIFF)
+    assert new == "a\nb  \nC\nQ\n" and info["fuzz"] == 1
+
+
+def test_conflict_changes_nothing(tmp_path):
+    path = tmp_path / "f.py"
+    path.write_text("nothing here\n")
+    with pytest.raises(PatchConflict):
+        apply_patch("nothing here\n", DIFF)
+    result = write_file(str(path), DIFF)
+    assert not result["ok"] and result["conflicts"]
+    assert path.read_text() == "nothing here\n"
+
+
+def test_full_writes_replace_the_file_in_place(tmp_path):
+    path = tmp_path / "run.sh"
+    path.write_text("echo one\n")
+    os.chmod(path, 0o755)
+    result = write_file(str(path), "echo two\n")
+    assert (result["mode"], result["bytes_written"], result["bytes_changed"]) == ("full", 9, 3)
+    assert path.read_text() == "echo two\n" and os.stat(path).st_mode & 0o777 == 0o755
+    assert os.listdir(tmp_path) == ["run.sh"]
+
+
+def test_writes_through_a_symlink_keep_the_link(tmp_path):
+    (tmp_path / "real").mkdir()
+    target = tmp_path / "real" / "f.py"
+    target.write_text("a\nb\nc\nd\n")
+    os.symlink(target, tmp_path / "link.py")
+    assert write_file(str(tmp_path / "link.py"), DIFF)["ok"]
+    assert os.path.islink(tmp_path / "link.py") and target.read_text() == "a\nb\nC\nd\n"
+    assert write_file(str(tmp_path / "link.py"), "new\n")["ok"]
+    assert os.path.islink(tmp_path / "link.py") and target.read_text() == "new\n"
+    assert sorted(os.listdir(tmp_path / "real")) == ["f.py"]
+
+
+def test_only_newlines_split_lines():
+    text = "a = 1\nb = '\x0c'\nc = ' \x85\x1c'\nd\n"
+    diff = "@@ -1,4 +1,4 @@\n a = 1\n b = '\x0c'\n c = ' \x85\x1c'\n-d\n+D\n"
+    new, _ = apply_patch(text, diff)
+    assert new == text.replace("d\n", "D\n")
+
+
+def test_line_endings_are_kept():
+    text = "a\r\nb\nc\r\nd"
+    new, _ = apply_patch(text, "@@ -2,2 +2,3 @@\n b\n-c\n+c2\n+c3\n d\n\\ No newline at end of file\n")
+    assert new == "a\r\nb\nc2\r\nc3\r\nd"
+
+
+def test_diff_files_are_written_verbatim(tmp_path):
+    patch = tmp_path / "fix.patch"
+    result = write_file(str(patch), DIFF)
+    assert result["mode"] == "full" and patch.read_text() == DIFF
+    target = tmp_path / "f.py"
+    target.write_text("a\nb\nc\nd\n")
+    assert write_file(str(target), DIFF)["mode"] == "patch"
+    assert target.read_text() == "a\nb\nC\nd\n"
+    assert is_unified_diff(DIFF) and not is_unified_diff("--- just a heading\n")
@@ -0,0 +1,68 @@
+import os
+
+from config import CHECKPOINT_DIR
+from retrieval import RetrievalIndex
+from scanner import is_excluded
+from snapshot import RepoSnapshot
+
+
+def test_sync_search_and_update(repo):
+    (repo / "util.py").write_text("class DiffParser:\n    pass\n")
+    index = RetrievalIndex(str(repo))
+    assert index.sync(RepoSnapshot(str(repo)).entries()) == {"added": 4, "updated": 0, "removed": 0}
+    assert [h["path"] for h in index.search("parse diff")] == ["b.py", "util.py"]
+    assert "--- b.py lines 1-2 ---\ndef parse_diff(text):" in index.excerpts("parse diff")
+
+    (repo / "util.py").write_text("x = 1\n")
+    index.update(str(repo / "util.py"))
+    os.remove(repo / "b.py")
+    index.update("b.py")
+    assert index.search("parse diff") == [] and index.excerpts("parse diff") == ""
+    assert index.sync(RepoSnapshot(str(repo)).entries()) == {"added": 0, "updated": 0, "removed": 0}
+    index.close()
+
+
+def test_update_skips_what_the_walk_excludes(repo):
+    (repo / ".gitignore").write_text("build/\n*.log\n")
+    index = RetrievalIndex(str(repo))
+    index.sync(RepoSnapshot(str(repo)).entries())
+    for name, text in ((".env", "API_KEY=parse_diff-secret\n"), ("build/out.py", "def parse_diff(): pass\n"),
+                       ("run.log", "parse_diff failed\n"), (".hidden/x.py", "def parse_diff(): pass\n")):
+        os.makedirs(repo / os.path.dirname(name), exist_ok=True)
+        (repo / name).write_text(text)
+        index.update(str(repo / name))
+    (repo / "c.py").write_text("def parse_diff_again(): pass\n")
+    index.update("c.py")
+    assert sorted({h["path"] for h in index.search("parse diff")}) == ["b.py", "c.py"]
+    assert "secret" not in index.excerpts("parse diff")
+    index.close()
+
+
+def test_is_excluded_matches_the_snapshot(repo):
+    (repo / ".gitignore").write_text("gen/\n!keep.log\n*.log\n")
+    for name in ("gen/a.py", "x.log", "keep.log", "src/.env", "node_modules/m.js", "src/ok.py"):
+        os.makedirs(repo / os.path.dirname(name) if os.path.dirname(name) else repo, exist_ok=True)
+        (repo / name).write_text("x\n")
+    walked = {rel for rel, _, _ in RepoSnapshot(str(repo)).entries()}
+    for name in ("gen/a.py", "x.log", "keep.log", "src/.env", "node_modules/m.js", "src/ok.py", "a.txt",
+                 ".gitignore"):
+        assert is_excluded(str(repo), name) == (name not in walked), name
+    assert is_excluded(str(repo), "../outside.py")
+
+
+def test_index_file_is_created_lazily(tmp_path):
+    empty = tmp_path / "empty"
+    empty.mkdir()
+    index = RetrievalIndex(str(empty))
+    assert index.sync([]) == {"added": 0, "updated": 0, "removed": 0}
+    index.update("gone.py")
+    assert index.search("anything") == [] and index.stats() == {"files": 0, "chunks": 0}
+    index.close()
+    assert not os.path.exists(empty / CHECKPOINT_DIR)
+
+    (empty / "a.py").write_text("def f(): pass\n")
+    index = RetrievalIndex(str(empty))
+    index.update("a.py")
+    assert index.stats()["files"] == 1
+    index.close()
+    assert os.path.exists(empty / CHECKPOINT_DIR / "index.sqlite")
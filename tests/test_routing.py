@@ -0,0 +1,31 @@
+from actions import ProposedAction
+from backends import ScriptedBackend
+from config import MODEL_ACTION, MODEL_EVAL
+from models import EvalAgent
+from policy import PolicyEngine
+from routing import Router
+from tests.conftest import evaluate
+
+
+def test_risky_actions_skip_to_the_strong_route(repo):
+    router = Router(repo_root=str(repo))
+    assert [r.name for r in router.plan(ProposedAction("WRITE_FILE", "c.txt", "x"))] == ["fast", "strong"]
+    assert [r.name for r in router.plan(ProposedAction("WRITE_FILE", ".env.local", "x"))] == ["strong"]
+    assert [r.name for r in router.plan(ProposedAction("COMPLETED"))] == ["strong"]
+    assert router.risky == 2
+
+
+def test_low_confidence_verdicts_escalate(repo):
+    backend = ScriptedBackend({
+        MODEL_ACTION: [{"function_calls": [evaluate("decline", "unsure", confidence=0.3)]},
+                       {"function_calls": [evaluate(confidence=0.95)]}],
+        MODEL_EVAL: [{"function_calls": [evaluate(rationale="checked", confidence=0.5)]}],
+    })
+    router = Router(repo_root=str(repo))
+    agent = EvalAgent("write files", backend=backend, policy=PolicyEngine(repo_root=str(repo)), router=router)
+    first = agent.decide(ProposedAction("WRITE_FILE", "c.txt", "1"))
+    assert (first.decision, first.rationale, first.route) == ("approve", "checked", "strong")
+    assert agent.decide(ProposedAction("WRITE_FILE", "d.txt", "2")).route == "fast"
+    stats = router.stats()
+    assert stats["routes"]["fast"]["calls"] == 2 and stats["routes"]["fast"]["escalated"] == 1
+    assert stats["routes"]["strong"]["decided"] == 1 and stats["fast_path_share"] == 0.5
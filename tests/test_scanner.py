@@ -0,0 +1,40 @@
+import os
+
+from scanner import GitIgnore, render_summary, walk
+from snapshot import RepoSnapshot
+
+
+def test_gitignore_rules():
+    ignore = GitIgnore(["# comment", "*.log", "!keep.log", "build/", "/top.txt", "docs/**/*.tmp"])
+    assert ignore.match("x.log", False) and ignore.match("a/b/x.log", False)
+    assert ignore.match("keep.log", False) is False
+    assert ignore.match("build", True) and ignore.match("build", False) is None
+    assert ignore.match("top.txt", False) and ignore.match("sub/top.txt", False) is None
+    assert ignore.match("docs/a/b/x.tmp", False) and ignore.match("x.tmp", False) is None
+
+
+def test_parallel_walk_honors_nested_gitignores(repo):
+    (repo / ".gitignore").write_text("*.log\nout/\n")
+    for name in ("src/a.py", "src/x.log", "src/gen/keep.txt", "src/gen/drop.txt", "out/o.py", ".git/HEAD"):
+        os.makedirs(repo / os.path.dirname(name), exist_ok=True)
+        (repo / name).write_text("x\n")
+    (repo / "src" / "gen" / ".gitignore").write_text("drop.txt\n")
+
+    def files(workers):
+        return sorted(os.path.join(d, f) if d else f for d, _, fs in walk(str(repo), workers=workers) for f in fs)
+
+    assert files(4) == files(1) == ["a.txt", "b.py", os.path.join("src", "a.py"),
+                                    os.path.join("src", "gen", "keep.txt"), "uv.lock"]
+
+
+def test_summary_shows_heads_of_relevant_files(repo):
+    lines = RepoSnapshot(str(repo)).render(goal="fix parse_diff").splitlines()
+    assert lines[lines.index("b.py (51 bytes, crc b28b83c9)") + 1] == "    def parse_diff(text):"
+    entries = [("a.txt", 0, 3), ("b.py", 0, 51)]
+    texts = {"a.txt": "hi", "b.py": "def parse_diff(text):"}
+    heads = lambda asked: {rel: texts[rel] for rel, _, _ in asked}
+    assert render_summary(entries, goal="parse", heads=heads, head_files=1).splitlines() == [
+        "a.txt (3 bytes)", "b.py (51 bytes)", "    def parse_diff(text):"]
+    entries = [(f"pkg/file{i}.py", 0, 10) for i in range(100)] + [("pkg/parser.py", 0, 10)]
+    kept = render_summary(entries, max_bytes=200, goal="parser").splitlines()
+    assert "pkg/parser.py (10 bytes)" in kept and kept[-1].startswith("…(truncated")
@@ -0,0 +1,35 @@
+from actions import ProposedAction, EvalVerdict
+from backends import ScriptedBackend
+from config import MODEL_ACTION, MODEL_EVAL
+from main_loop import evaluate_prompt_events
+from session import SessionController
+from tests.conftest import propose, evaluate
+
+A = [ProposedAction("OPEN_FILE", "a.txt")]
+B = [ProposedAction("OPEN_FILE", "b.py")]
+OK = [EvalVerdict("approve")]
+
+
+def test_repeated_declines_warn_then_stop(repo):
+    backend = ScriptedBackend({MODEL_ACTION: [{"function_calls": [propose("WRITE_FILE", "c.txt", "x")]}],
+                               MODEL_EVAL: [{"function_calls": [evaluate("decline", "no")]}]})
+    events = list(evaluate_prompt_events("write c.txt", repo_root=str(repo), backend=backend, max_turns=10))
+    done = events[-1]
+    assert done["type"] == "done" and done["reason"] == "repeated_action"
+    assert done["stop"]["turns"] == 4  # warned after the third decline, stopped on the fourth
+    assert not (repo / "c.txt").exists()
+
+
+def test_oscillation_and_budgets():
+    controller = SessionController(max_turns=20, repeat_limit=5, window=4)
+    outcomes = []
+    for actions in (A, B, A, B, A):
+        assert controller.start_turn(10) is None
+        outcomes.append(controller.end_turn(actions, OK))
+    assert outcomes[:3] == [{}, {}, {}] and "warn" in outcomes[3]
+    assert outcomes[4]["stop"].reason == "oscillation"
+    budget = SessionController(max_tokens=15)
+    assert budget.start_turn(10) is None and budget.start_turn(10).reason == "token_budget"
+    capped = SessionController(max_turns=1)
+    capped.start_turn()
+    assert capped.start_turn().reason == "max_turns"
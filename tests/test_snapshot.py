@@ -0,0 +1,30 @@
+import os
+
+from snapshot import RepoSnapshot
+
+
+def test_entries_follow_os_walk_order(repo):
+    for name in ("src/z.py", "src/a/b.py", "docs/x.md", ".hidden/y.py", "node_modules/m.js", "src/.env"):
+        os.makedirs(repo / os.path.dirname(name), exist_ok=True)
+        (repo / name).write_text("x\n")
+    walked = []
+    for dirpath, dirnames, filenames in os.walk(repo):
+        dirnames[:] = [d for d in dirnames if d != "node_modules" and not d.startswith(".")]
+        rel_dir = os.path.relpath(dirpath, repo)
+        walked += [os.path.normpath(os.path.join(rel_dir, f)) for f in sorted(filenames) if not f.startswith(".")]
+    assert [rel for rel, _, _ in RepoSnapshot(str(repo)).entries()] == walked
+
+
+def test_only_dirty_directories_are_rescanned(repo):
+    snapshot = RepoSnapshot(str(repo))
+    before = snapshot.render()
+    (repo / "c.py").write_text("pass\n")
+    assert not snapshot.refresh() and snapshot.render() == before
+    snapshot.mark_dirty(str(repo / "c.py"))
+    assert snapshot.refresh()
+    assert "c.py (5 bytes, crc 0e1a9296)" in snapshot.render().splitlines()
+    os.makedirs(repo / "new" / "deep")
+    (repo / "new" / "deep" / "d.py").write_text("x\n")
+    snapshot.mark_dirty("new/deep/d.py")
+    assert snapshot.refresh()
+    assert os.path.join("new", "deep", "d.py") in [rel for rel, _, _ in snapshot.entries()]
@@ -0,0 +1,77 @@
+import os
+import shutil
+
+from backends import ScriptedBackend
+from config import CHECKPOINT_DIR
+from main_loop import evaluate_prompt_events
+from tests.conftest import propose, evaluate
+
+TURN = [propose("WRITE_FILE", "a.txt", "new\n"), propose("DELETE_FILE", "b.py"),
+        propose("WRITE_FILE", "c.txt", "bad\n"),
+        propose("WRITE_FILE", "d.txt", "1\n"), propose("WRITE_FILE", "d.txt", "declined\n"),
+        propose("OPEN_FILE", "d.txt")]
+
+
+def backend(turn):
+    def script(model, contents):
+        text = str(contents)
+        if "proposed action by the agent" not in text:
+            return {"function_calls": [propose("COMPLETED")] if "was accepted" in text else turn}
+        return {"function_calls": [evaluate("decline" if "bad" in text or "declined" in text else "approve",
+                                            confidence=0.9)]}
+    return ScriptedBackend(script)
+
+
+def run(root, speculative, turn=TURN):
+    events = list(evaluate_prompt_events("edit", repo_root=str(root), backend=backend(turn), max_turns=2,
+                                         speculative=speculative))
+    return [e for e in events if e["type"] == "turn"][0]
+
+
+def tree(root):
+    return {os.path.relpath(os.path.join(d, f), root): open(os.path.join(d, f)).read()
+            for d, dirs, files in os.walk(root) if CHECKPOINT_DIR not in d for f in files}
+
+
+def test_speculative_results_match_normal_execution(repo, tmp_path):
+    plain = tmp_path / "plain"
+    shutil.copytree(repo, plain)
+    fast, slow = run(repo, True), run(plain, False)
+    assert fast["results"] == slow["results"]
+    assert tree(repo) == tree(plain)
+    assert not os.listdir(repo / CHECKPOINT_DIR / "overlay")
+
+
+def test_approved_paths_commit_and_declined_paths_replay(repo):
+    turn = run(repo, True)
+    assert [v.decision for v in turn["verdicts"]] == ["approve", "approve", "decline", "approve", "decline",
+                                                      "approve"]
+    assert (repo / "a.txt").read_text() == "new\n" and not (repo / "b.py").exists()
+    assert not (repo / "c.txt").exists()
+    # d.txt had a declined write, so its approved actions were re-run without it
+    assert (repo / "d.txt").read_text() == "1\n"
+    assert turn["results"][5]["content"] == "1\n"
+    assert turn["results"][2] is None and turn["results"][4] is None
+
+
+PATCHES = [propose("WRITE_FILE", "a.txt", "@@ -1 +1 @@\n-hi\n+hello\n"),
+           propose("WRITE_FILE", "link.txt", "@@ -1 +1 @@\n-hello\n+hello world\n")]
+
+
+def test_patches_through_a_symlink_share_the_staged_file(repo, tmp_path):
+    os.symlink("a.txt", repo / "link.txt")
+    plain = tmp_path / "plain"
+    shutil.copytree(repo, plain, symlinks=True)
+    fast, slow = run(repo, True, PATCHES), run(plain, False, PATCHES)
+    assert [r["ok"] for r in fast["results"]] == [True, True]
+    assert fast["results"] == slow["results"]
+    assert tree(repo) == tree(plain)
+    assert (repo / "a.txt").read_text() == "hello world\n" and os.readlink(repo / "link.txt") == "a.txt"
+
+
+def test_declined_write_through_a_symlink_replays_the_real_path(repo):
+    os.symlink("a.txt", repo / "link.txt")
+    turn = run(repo, True, [propose("WRITE_FILE", "a.txt", "new\n"), propose("WRITE_FILE", "link.txt", "bad\n")])
+    assert [v.decision for v in turn["verdicts"]] == ["approve", "decline"]
+    assert turn["results"][0]["ok"] and turn["results"][1] is None
+    assert (repo / "a.txt").read_text() == "new\n" and os.readlink(repo / "link.txt") == "a.txt"
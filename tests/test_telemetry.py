@@ -0,0 +1,36 @@
+import json
+
+from telemetry import Telemetry
+
+
+def test_counters_and_histograms_render_as_prometheus():
+    t = Telemetry()
+    t.count("file_ops_total", op="read")
+    t.count("file_ops_total", 2, op="read")
+    t.observe("span_seconds", 0.02, span="turn")
+    lines = t.render_prometheus().splitlines()
+    assert 'agent_eval_file_ops_total{op="read"} 3' in lines
+    assert 'agent_eval_span_seconds_bucket{span="turn",le="0.025"} 1' in lines
+    assert 'agent_eval_span_seconds_count{span="turn"} 1' in lines
+
+
+def test_prometheus_label_values_are_escaped():
+    t = Telemetry()
+    t.count("file_ops_total", target='evil"}\nfake_metric 1\\')
+    t.observe("span_seconds", 0.02, span="turn")
+    lines = t.render_prometheus().splitlines()
+    assert 'agent_eval_file_ops_total{target="evil\\"}\\nfake_metric 1\\\\"} 1' in lines
+    assert not any(l.startswith("fake_metric") for l in lines)
+    assert 'agent_eval_span_seconds_bucket{span="turn",le="0.025"} 1' in lines
+    assert 'agent_eval_span_seconds_count{span="turn"} 1' in lines
+
+
+def test_spans_nest_and_record_attrs(tmp_path):
+    path = tmp_path / "trace.jsonl"
+    t = Telemetry(trace_path=str(path))
+    with t.span("session") as outer:
+        with t.span("turn") as inner:
+            inner["prompt_tokens"] = 5
+    t.close()
+    turn, session = [json.loads(l) for l in path.read_text().splitlines()]
+    assert turn["parent"] == session["span"] and turn["prompt_tokens"] == 5
@@ -0,0 +1,56 @@
+import pytest
+
+import verdict_cache
+from actions import ProposedAction
+from verdict_cache import VerdictCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(verdict_cache.time, "time", lambda: now[0])
+    return now
+
+
+def key(target, rationale="r"):
+    res = ProposedAction("write_file", target, "x", rationale)
+    return VerdictCache.make_key("goal", res, "a.txt (3 bytes)", "model", "template")
+
+
+def test_hit_miss_and_stats(tmp_path, clock):
+    cache = VerdictCache(str(tmp_path / "v.sqlite"))
+    assert cache.get(key("a.txt")) is None
+    cache.put(key("a.txt"), {"decision": "approve"})
+    assert cache.get(key("./a.txt", rationale="other words")) == {"decision": "approve"}
+    assert key("a.txt") != key("b.txt")
+    other = VerdictCache(str(tmp_path / "v.sqlite"))
+    assert other.get(key("b.txt")) is None
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5, "total_hits": 1, "total_misses": 2,
+                             "total_hit_rate": 1 / 3, "entries": 1}
+    cache.close()
+    other.close()
+
+
+def test_entries_expire_after_the_ttl(tmp_path, clock):
+    cache = VerdictCache(str(tmp_path / "v.sqlite"), ttl=5)
+    cache.put(key("a.txt"), {"decision": "approve"})
+    assert cache.get(key("a.txt")) is not None
+    clock[0] += 6
+    assert cache.get(key("a.txt")) is None
+    assert cache.stats()["entries"] == 0
+    cache.close()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, clock):
+    cache = VerdictCache(str(tmp_path / "v.sqlite"), max_entries=2)
+    for name in ("a", "b"):
+        cache.put(key(name), {"decision": name})
+        clock[0] += 1
+    assert cache.get(key("a")) == {"decision": "a"}
+    clock[0] += 1
+    cache.put(key("c"), {"decision": "c"})
+    cache.evict()
+    assert cache.get(key("b")) is None
+    assert cache.get(key("a")) and cache.get(key("c"))
+    assert cache.stats()["entries"] == 2
+    cache.close()
@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Dict, Optional
+
+from actions import ProposedAction
+from config import VERDICT_CACHE_PATH, VERDICT_CACHE_TTL, VERDICT_CACHE_MAX_ENTRIES
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verdicts (
+    key TEXT PRIMARY KEY,
+    verdict TEXT NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS verdicts_last_used ON verdicts(last_used);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO stats VALUES ('hits', 0), ('misses', 0);
+"""
+
+
+def digest(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def normalize_action(res: ProposedAction) -> Dict[str, Any]:
+    """
+    The parts of a proposed action that affect the verdict. The model's own
+    rationale is left out so rephrasings of the same action share a key.
+    """
+    target = res.target.strip().replace("\\", "/")
+    if target:
+        target = os.path.normpath(target).replace(os.sep, "/")
+    normalized = {
+        "action_type": res.action_type.upper(),
+        "target": target,
+        "contents_or_diff": res.contents_or_diff,
+    }
+    if res.read:
+        normalized["read"] = res.read
+    return normalized
+
+
+class VerdictCache:
+    '''
+    Persistent, content-addressed cache of EvalAgent verdicts.
+
+    Backed by SQLite in WAL mode so concurrent processes (e.g. batch_eval
+    workers) share one store. Entries expire after `ttl` seconds and the
+    least recently used ones are evicted beyond `max_entries`.
+    '''
+    EVICT_EVERY = 100
+
+    def __init__(self, path: str = VERDICT_CACHE_PATH, ttl: float = VERDICT_CACHE_TTL,
+                 max_entries: int = VERDICT_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._puts = 0
+        self._lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def make_key(goal: str, res: ProposedAction, repo_state: str, model: str, template: str) -> str:
+        payload = json.dumps({
+            "goal": goal,
+            "action": normalize_action(res),
+            "repo": digest(repo_state),
+            "model": model,
+            "template": digest(template),
+        }, sort_keys=True, separators=(",", ":"))
+        return digest(payload)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT verdict, created FROM verdicts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM verdicts WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                self._conn.execute("UPDATE stats SET value = value + 1 WHERE name = 'misses'")
+                return None
+            self.hits += 1
+            self._conn.execute("UPDATE verdicts SET last_used = ? WHERE key = ?", (now, key))
+            self._conn.execute("UPDATE stats SET value = value + 1 WHERE name = 'hits'")
+        return json.loads(row[0])
+
+    def put(self, key: str, verdict: Dict[str, Any]) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO verdicts (key, verdict, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(verdict), now, now),
+            )
+            self._puts += 1
+            if self._puts % self.EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM verdicts WHERE created < ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM verdicts WHERE key IN ("
+            " SELECT key FROM verdicts ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def evict(self) -> None:
+        with self._lock:
+            self._evict(time.time())
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Hit rates for this process and across every process sharing the store.
+        """
+        with self._lock:
+            totals = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            entries = self._conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        lookups = self.hits + self.misses
+        all_lookups = totals["hits"] + totals["misses"]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "total_hits": totals["hits"],
+            "total_misses": totals["misses"],
+            "total_hit_rate": totals["hits"] / all_lookups if all_lookups else 0.0,
+            "entries": entries,
+        }
+
+    def close(self) -> None:
+        self._conn.close()